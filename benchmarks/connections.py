@@ -0,0 +1,77 @@
+"""
+Benchmark da abertura e do fechamento de conexões com o banco DuckDB ao longo de uma execução. Simula as chamadas de
+`connect_db` de uma safra completa (cada etapa grava uma linha e lê o catálogo) num banco em arquivo com uma tabela
+grande e várias tabelas e tipos, e compara uma conexão por etapa (fluxo antigo) com uma única `pipeline_session`, com um
+checkpoint explícito a cada tabela.
+
+Uso (a partir da raiz do repositório):
+
+    python -m benchmarks.connections --rows 20000000 --steps 30
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import duckdb
+
+from dados_publicos_cnpj_receita_federal.database import connect_db
+from dados_publicos_cnpj_receita_federal.database import pipeline_session
+
+# etapas entre dois checkpoints, aproximadamente as chamadas de `connect_db` de um `processar_*`
+STEPS_PER_TABLE = 6
+
+
+def create_synthetic_db(db_uri, rows):
+    """
+    Cria o banco com uma tabela de `rows` linhas, tabelas de referência com os seus tipos ENUM e a tabela `etapas`.
+    """
+    with duckdb.connect(db_uri) as db:
+        db.execute(f"CREATE TABLE estabelecimentos AS SELECT i AS cnpj_basico, 'RAZAO ' || i AS razao_social, i % 5570 AS municipio FROM range({rows}) AS t(i)")
+        for i in range(20):
+            db.execute(f"CREATE TABLE referencia_{i} AS SELECT i AS codigo, 'DESCRICAO ' || i AS descricao FROM range(1000) AS t(i)")
+            db.execute(f'CREATE TYPE enum_referencia_{i} AS ENUM (SELECT descricao FROM referencia_{i})')
+        db.execute('CREATE TABLE etapas (etapa INTEGER, instante TIMESTAMP)')
+
+
+def step(db_uri, i):
+    with connect_db(db_uri=db_uri) as db:
+        db.execute('INSERT INTO etapas VALUES (?, current_timestamp)', [i])
+        db.execute("SELECT COUNT(*) FROM information_schema.tables WHERE table_name = 'estabelecimentos'").fetchall()
+
+
+def run_connect_per_step(db_uri, steps):
+    start = time.time()
+    for i in range(steps):
+        step(db_uri, i)
+    return time.time() - start
+
+
+def run_pipeline_session(db_uri, steps):
+    start = time.time()
+    with pipeline_session(db_uri) as session:
+        for i in range(steps):
+            step(db_uri, i)
+            if (i + 1) % STEPS_PER_TABLE == 0:
+                session.checkpoint(f'etapa {i}')
+    return time.time() - start
+
+
+def run(rows, steps):
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as folder:
+        db_uri = os.path.join(folder, 'bench.duckdb')
+        create_synthetic_db(db_uri, rows)
+        print(f'banco sintético: {rows:_} linhas, {os.path.getsize(db_uri) / 2**20:.0f} MB | {steps} etapas')
+        elapsed_connect = run_connect_per_step(db_uri, steps)
+        elapsed_session = run_pipeline_session(db_uri, steps)
+        print(f'uma conexão por etapa {elapsed_connect:6.2f} s | pipeline_session {elapsed_session:6.2f} s | {elapsed_connect / elapsed_session:.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=20_000_000)
+    parser.add_argument('--steps', type=int, default=30)
+    args = parser.parse_args()
+    run(rows=args.rows, steps=args.steps)
@@ -0,0 +1,111 @@
+"""
+Benchmark do carregamento de CSV para o DuckDB: fluxo antigo (tabela temporária + INSERT + ALTER/UPDATE da safra)
+versus o `CREATE TABLE AS SELECT` em uma única passada de `load_data_to_duckdb`.
+
+Uso (a partir da raiz do repositório):
+
+    python -m benchmarks.load_data_to_duckdb --rows 2000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from unittest.mock import patch
+
+import duckdb
+
+from dados_publicos_cnpj_receita_federal.engine import _core
+from dados_publicos_cnpj_receita_federal.engine._core import _select_clause
+from dados_publicos_cnpj_receita_federal.engine._core import load_data_to_duckdb
+
+SAFRA = '2024-10'
+
+DICT_COLUMN_TYPES = {
+    'cnpj_basico': 'VARCHAR',
+    'cnpj_ordem': 'VARCHAR',
+    'cnpj_dv': 'VARCHAR',
+    'identificador_matriz_filial': 'VARCHAR',
+    'nome_fantasia': 'VARCHAR',
+    'situacao_cadastral': 'VARCHAR',
+    'data_situacao_cadastral': 'VARCHAR',
+    'motivo_situacao_cadastral': 'VARCHAR',
+    'codigo_municipio': 'VARCHAR',
+    'uf': 'VARCHAR',
+    'capital_social': 'DOUBLE',
+}
+
+
+def write_synthetic_csv(path, rows, seed=0):
+    """
+    Grava um CSV no formato da Receita Federal (`;`, todos os campos entre aspas, Latin-1) com `rows` linhas.
+    """
+    rng = random.Random(seed)
+    list_uf = ['SP', 'RJ', 'MG', 'RS', 'BA', 'PR']
+    with open(path, 'w', encoding='latin-1') as f:
+        for i in range(rows):
+            values = [
+                f'{i:08d}',
+                f'{rng.randint(1, 9999):04d}',
+                f'{rng.randint(0, 99):02d}',
+                str(rng.randint(1, 2)),
+                f'LOJA SÃO JOÃO {i}',
+                f'{rng.choice([1, 2, 3, 4, 8]):02d}',
+                f'20{rng.randint(0, 23):02d}{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}',
+                f'{rng.randint(0, 80):02d}',
+                str(rng.randint(1, 9999)),
+                rng.choice(list_uf),
+                f'{rng.randint(0, 10_000_000)},{rng.randint(0, 99):02d}',
+            ]
+            f.write(';'.join(f'"{v}"' for v in values) + '\n')
+
+
+def load_legacy(db_uri, path, dict_column_types, table_name, safra, sep=';', header='false', encoding='latin-1'):
+    """
+    O fluxo anterior de `load_data_to_duckdb`: `read_csv_auto` para uma tabela temporária, `CREATE TABLE` + `INSERT`
+    com as conversões de tipo, `ALTER TABLE ADD COLUMN safra` + `UPDATE` e, por fim, a remoção da tabela temporária.
+    """
+    list_columns_names = list(dict_column_types.keys())
+    columns_definitions = ',\n'.join([f'{name} {dtype}' for name, dtype in dict_column_types.items()])
+    with duckdb.connect(db_uri) as db:
+        db.execute(
+            f"""
+                DROP TABLE IF EXISTS temp_table;
+                CREATE TABLE temp_table AS
+                SELECT * FROM read_csv_auto('{path}', sep='{sep}', header={header}, quote='"', union_by_name=true, encoding='{encoding}', names={list_columns_names});
+                DROP TABLE IF EXISTS {table_name};
+                CREATE TABLE {table_name} ({columns_definitions});
+                INSERT INTO {table_name} SELECT {_select_clause(dict_column_types)} FROM temp_table;
+                ALTER TABLE {table_name} ADD COLUMN safra VARCHAR;
+                UPDATE {table_name} SET safra = '{safra}';
+                DROP TABLE IF EXISTS temp_table;
+            """,
+        )
+
+
+def load_single_pass(db_uri, path, dict_column_types, table_name, safra, encoding='latin-1'):
+    with patch.object(_core, 'process_mapping'):
+        load_data_to_duckdb(db_uri=db_uri, path=path, dict_column_types=dict_column_types, table_name=table_name, safra=safra, encoding=encoding)
+
+
+def run(rows):
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'K3241.K03200Y0.D41109.ESTABELE')
+        write_synthetic_csv(path, rows)
+        print(f'arquivo sintético: {rows:_} linhas, {os.path.getsize(path) / 1024 ** 2:_.1f} MiB')
+
+        for name, func in [('antes (multi-etapas)', load_legacy), ('depois (CTAS único)', load_single_pass)]:
+            db_uri = os.path.join(folder, f'{func.__name__}.duckdb')
+            start = time.time()
+            func(db_uri=db_uri, path=path, dict_column_types=DICT_COLUMN_TYPES, table_name='estabelecimentos', safra=SAFRA)
+            elapsed = time.time() - start
+            with duckdb.connect(db_uri) as db:
+                row_count = db.sql('SELECT COUNT(*) FROM estabelecimentos').fetchone()[0]
+            print(f'{name:>22} | {elapsed:6.2f} s | {row_count:_} linhas | arquivo do banco {os.path.getsize(db_uri) / 1024 ** 2:_.1f} MiB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+    run(rows=args.rows)
@@ -0,0 +1,98 @@
+"""
+Benchmark das buscas de descrições nas tabelas de referência, para cada busca de `estabelecimentos`, em uma tabela
+sintética. Compara o carregamento seguido de `UPDATE` com subconsulta correlacionada contra uma referência lida por
+`read_csv_auto` (fluxo antigo) com o carregamento que já faz o `LEFT JOIN` tipado de `compile_select` contra a
+referência carregada por `process_mapping`; os dois tempos incluem a gravação da tabela.
+
+Uso (a partir da raiz do repositório):
+
+    python -m benchmarks.lookups --rows 10000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import duckdb
+
+from dados_publicos_cnpj_receita_federal.engine import estabelecimentos
+from dados_publicos_cnpj_receita_federal.engine._core import compile_select
+
+# (coluna derivada, tabela de referência, coluna de descrição, coluna de código, quantidade de códigos, tamanho do código)
+LIST_LOOKUPS = [
+    ('situacao_cadastral_motivo', 'motivos', 'motivo', 'situacao_cadastral_motivo_codigo', 60, 2),
+    ('municipio', 'municipios', 'municipio', 'municipio_codigo', 5_570, 4),
+]
+
+
+def create_synthetic_tables(db, rows):
+    """
+    Cria a tabela `estabelecimentos_csv` (códigos em VARCHAR, como lidos do CSV) com `rows` linhas e, para cada busca,
+    a referência como o `read_csv_auto` a criava (`codigo` BIGINT detectado) e a referência tipada (`codigo` INTEGER).
+    """
+    code_columns = ',\n'.join(f"LPAD(CAST(hash(i, '{code_column}') % {n_codes} AS VARCHAR), {width}, '0') AS {code_column}" for _, _, _, code_column, n_codes, width in LIST_LOOKUPS)
+    db.execute(
+        f"""
+            CREATE TABLE estabelecimentos_csv AS
+            SELECT
+                LPAD(CAST(i AS VARCHAR), 8, '0') AS cnpj_basico,
+                {code_columns}
+            FROM range({rows}) AS t(i)
+        """,
+    )
+    for _, reference_table, description_column, _, n_codes, _ in LIST_LOOKUPS:
+        db.execute(f"CREATE TABLE {reference_table}_auto AS SELECT CAST(i AS BIGINT) AS codigo, 'DESCRICAO ' || i AS {description_column} FROM range({n_codes}) AS t(i)")
+        db.execute(f"CREATE TABLE {reference_table} AS SELECT CAST(i AS INTEGER) AS codigo, 'DESCRICAO ' || i AS {description_column} FROM range({n_codes}) AS t(i)")
+
+
+def lookup_legacy(db, name, reference_table, description_column, code_column):
+    """
+    O fluxo antigo: a tabela é carregada e, em seguida, a descrição é preenchida por `ALTER TABLE` + `UPDATE` com
+    subconsulta correlacionada na referência com `codigo` BIGINT.
+    """
+    start = time.time()
+    db.execute(
+        f"""
+            DROP TABLE IF EXISTS legacy;
+            CREATE TABLE legacy AS SELECT * FROM estabelecimentos_csv;
+            ALTER TABLE legacy ADD COLUMN {name} VARCHAR;
+            UPDATE legacy
+            SET {name} = (
+                SELECT {description_column}
+                FROM {reference_table}_auto
+                WHERE {reference_table}_auto.codigo = legacy.{code_column}
+                );
+        """,
+    )
+    return time.time() - start
+
+
+def lookup_hash_join(db, name, reference_table, description_column, code_column):
+    """
+    O fluxo atual: a descrição é buscada por hash join tipado no próprio carregamento (`compile_select`).
+    """
+    dict_column_types = {'cnpj_basico': 'VARCHAR', code_column: 'VARCHAR'}
+    dict_transforms = {name: estabelecimentos.DICT_TRANSFORMS[name]}
+    start = time.time()
+    db.execute(f"DROP TABLE IF EXISTS hash_join; CREATE TABLE hash_join AS {compile_select(dict_column_types=dict_column_types, safra='2024-10', relation='estabelecimentos_csv', dict_transforms=dict_transforms)}")
+    return time.time() - start
+
+
+def run(rows):
+    with tempfile.TemporaryDirectory() as folder:
+        with duckdb.connect(os.path.join(folder, 'bench.duckdb')) as db:
+            create_synthetic_tables(db, rows)
+            print(f'estabelecimentos sintético: {rows:_} linhas')
+            for name, reference_table, description_column, code_column, n_codes, _ in LIST_LOOKUPS:
+                elapsed_legacy = lookup_legacy(db, name, reference_table, description_column, code_column)
+                elapsed_hash_join = lookup_hash_join(db, name, reference_table, description_column, code_column)
+                expected = db.sql(f'SELECT {code_column}, {name} FROM legacy ORDER BY ALL').fetchall()
+                assert db.sql(f'SELECT {code_column}, {name} FROM hash_join ORDER BY ALL').fetchall() == expected
+                print(f'{name:>26} ({n_codes:_} códigos) | carga + UPDATE correlacionado {elapsed_legacy:6.2f} s | carga com hash join tipado {elapsed_hash_join:6.2f} s | {elapsed_legacy / elapsed_hash_join:.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    args = parser.parse_args()
+    run(rows=args.rows)
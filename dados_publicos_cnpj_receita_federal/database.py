@@ -1,16 +1,30 @@
 import contextlib
+import os
+import re
+import threading
+import time
 from typing import Generator
 
 import duckdb
 from duckdb import DuckDBPyConnection
 
 from dados_publicos_cnpj_receita_federal import SetupLogger
+from dados_publicos_cnpj_receita_federal.settings import DUCKDB_MAX_TEMP_DIRECTORY_SIZE
+from dados_publicos_cnpj_receita_federal.settings import DUCKDB_MEMORY_FRACTION
+from dados_publicos_cnpj_receita_federal.settings import DUCKDB_MEMORY_LIMIT
+from dados_publicos_cnpj_receita_federal.settings import DUCKDB_PRESERVE_INSERTION_ORDER
+from dados_publicos_cnpj_receita_federal.settings import DUCKDB_TEMP_DIRECTORY
+from dados_publicos_cnpj_receita_federal.settings import DUCKDB_THREADS
 
 _log = SetupLogger('database')
 
+# intervalo, em segundos, entre as leituras de `memory_monitor`
+MEMORY_MONITOR_INTERVAL = 0.5
+DICT_SIZE_UNITS = {'B': 1, 'KB': 10**3, 'MB': 10**6, 'GB': 10**9, 'TB': 10**12, 'KiB': 2**10, 'MiB': 2**20, 'GiB': 2**30, 'TiB': 2**40}
+
 
 @contextlib.contextmanager
-def connect_db(db_uri=None) -> Generator[DuckDBPyConnection, None, None]:
+def connect_db(db_uri=None, profile=None) -> Generator[DuckDBPyConnection, None, None]:
     """
     Um gerenciador de contexto que conecta ao banco de dados DuckDB e cede a conexão para uso.
 
@@ -20,12 +34,20 @@ def connect_db(db_uri=None) -> Generator[DuckDBPyConnection, None, None]:
 
     Se nenhum `db_uri` for fornecido, ele usará o URI padrão especificado nas configurações.
 
+    Dentro de uma `pipeline_session` do mesmo banco, nenhuma conexão é aberta: é cedido um cursor da conexão da sessão,
+    fechado ao final do bloco, sem fechar o banco. Toda conexão aberta recebe um perfil de recursos (ver
+    `apply_resource_profile`).
+
     Parâmetros:
     ----------
     db_uri : str, opcional
         O URI para o banco de dados DuckDB ao qual se conectar. Se não for fornecido, o URI será carregado da configuração
         `DB_URI`.
 
+    profile : dict, opcional
+        O perfil de recursos aplicado à conexão (ver `resource_profile`). Se não for fornecido, usa `resource_profile()`.
+        Ignorado dentro de uma `pipeline_session`, cuja conexão já recebeu o perfil da sessão.
+
     Cede:
     ------
     DuckDBPyConnection
@@ -45,9 +67,22 @@ def connect_db(db_uri=None) -> Generator[DuckDBPyConnection, None, None]:
 
         db_uri = DB_URI
 
+    session = _DICT_SESSIONS.get(_session_key(db_uri))
+    if session is not None:
+        cursor = session.cursor()
+        try:
+            yield cursor
+        except Exception as e:
+            _log.error(f'connect_db | erro durante a execução no banco de dados: {e}')
+            raise
+        finally:
+            cursor.close()
+        return
+
     try:
         _log.info('connect_db | conectando ao DuckDB')
         db = duckdb.connect(db_uri)
+        apply_resource_profile(db, profile=profile)
         yield db
     except Exception as e:
         _log.error(f'connect_db | erro durante a conexão ou execução no banco de dados: {e}')
@@ -56,3 +91,310 @@ def connect_db(db_uri=None) -> Generator[DuckDBPyConnection, None, None]:
         _log.info('connect_db | fechando a conexão com o DuckDB')
         db.close()
         _log.info('connect_db | conexão fechada')
+
+
+# sessões ativas (ver `pipeline_session`), pelo caminho absoluto do banco
+_DICT_SESSIONS = {}
+
+
+def _session_key(db_uri):
+    if not isinstance(db_uri, str) or db_uri == ':memory:':
+        return db_uri
+    return os.path.abspath(db_uri)
+
+
+class DuckDBSession:
+    """
+    Uma conexão DuckDB de longa duração, compartilhada por todas as etapas de uma execução (ver `pipeline_session`).
+
+    Cada abertura de um banco em arquivo recarrega o catálogo e reaplica o WAL, e cada fechamento força um checkpoint;
+    com a sessão, isso acontece uma única vez por execução e os checkpoints passam a ser explícitos (`checkpoint`). Os
+    usuários recebem cursores (`cursor`), conexões leves sobre o mesmo banco que podem ser usadas em threads diferentes.
+
+    Atributos:
+    ----------
+    db_uri : str
+        O URI do banco de dados DuckDB.
+
+    profile : dict
+        O perfil de recursos aplicado à conexão (ver `apply_resource_profile`), ou None para `resource_profile()`.
+
+    dict_stats : dict
+        Os tempos da sessão: `segundos_abertura` e `segundos_fechamento` da conexão, `segundos_checkpoints`,
+        `checkpoints` e `cursores` (as aberturas de conexão evitadas).
+    """
+
+    def __init__(self, db_uri, profile=None):
+        self.db_uri = db_uri
+        self.profile = profile
+        self.db = None
+        self.dict_stats = {'segundos_abertura': 0.0, 'segundos_fechamento': 0.0, 'segundos_checkpoints': 0.0, 'checkpoints': 0, 'cursores': 0}
+        self._lock = threading.Lock()
+
+    def open(self):
+        start = time.perf_counter()
+        self.db = duckdb.connect(self.db_uri)
+        apply_resource_profile(self.db, profile=self.profile)
+        self.dict_stats['segundos_abertura'] = time.perf_counter() - start
+        _log.info(f'DuckDBSession | {self.db_uri=} | conexão aberta em {self.dict_stats["segundos_abertura"]:.3f} segundos')
+
+    def cursor(self):
+        with self._lock:
+            self.dict_stats['cursores'] += 1
+            return self.db.cursor()
+
+    def checkpoint(self, label=''):
+        """
+        Grava o WAL no arquivo do banco (`CHECKPOINT`), num ponto escolhido da execução (ex: ao final de cada tabela).
+        """
+        start = time.perf_counter()
+        cursor = self.cursor()
+        try:
+            cursor.execute('CHECKPOINT')
+        finally:
+            cursor.close()
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.dict_stats['checkpoints'] += 1
+            self.dict_stats['segundos_checkpoints'] += elapsed
+        _log.info(f'DuckDBSession | checkpoint {label} em {elapsed:.3f} segundos')
+
+    def close(self):
+        start = time.perf_counter()
+        self.db.close()
+        self.dict_stats['segundos_fechamento'] = time.perf_counter() - start
+        # cada cursor substituiu uma abertura e um fechamento de conexão, cujo custo é estimado pelos da própria sessão
+        saved = self.dict_stats['cursores'] * (self.dict_stats['segundos_abertura'] + self.dict_stats['segundos_fechamento'])
+        _log.info(f'DuckDBSession | {self.db_uri=} | conexão fechada | {self.dict_stats} | economia estimada de {saved:.3f} segundos')
+
+
+@contextlib.contextmanager
+def pipeline_session(db_uri=None, profile=None) -> Generator[DuckDBSession, None, None]:
+    """
+    Um gerenciador de contexto que mantém uma única conexão com o banco de dados durante toda uma execução.
+
+    Enquanto a sessão está ativa, todas as chamadas de `connect_db` para o mesmo banco (em qualquer função de `engine` ou
+    `io`, em qualquer thread) usam cursores da conexão da sessão, em vez de abrir e fechar o arquivo a cada etapa, e
+    portanto o perfil de recursos da sessão. Uma sessão aninhada para o mesmo banco reaproveita a sessão já ativa.
+
+    Parâmetros:
+    ----------
+    db_uri : str, opcional
+        O URI do banco de dados DuckDB. Se não for fornecido, usa `DB_URI` das configurações.
+
+    profile : dict, opcional
+        O perfil de recursos da conexão da sessão (ver `resource_profile`). Se não for fornecido, usa
+        `resource_profile()`.
+
+    Cede:
+    ------
+    DuckDBSession
+        A sessão, com `checkpoint` para os pontos de gravação explícitos e `dict_stats` com os tempos.
+
+    Exemplo:
+    --------
+    with pipeline_session() as session:
+        processar_empresas(safra)
+        session.checkpoint('empresas')
+        processar_estabelecimentos(safra)
+    """
+    if not db_uri:
+        from dados_publicos_cnpj_receita_federal.settings import DB_URI
+
+        db_uri = DB_URI
+
+    key = _session_key(db_uri)
+    if key in _DICT_SESSIONS:
+        yield _DICT_SESSIONS[key]
+        return
+
+    session = DuckDBSession(db_uri, profile=profile)
+    session.open()
+    _DICT_SESSIONS[key] = session
+    try:
+        yield session
+    finally:
+        del _DICT_SESSIONS[key]
+        session.close()
+
+
+def resource_profile(n_workers=1):
+    """
+    Retorna as configurações de recursos do DuckDB, a partir de `settings.py` (variáveis `DADOS_PUBLICOS_CNPJ_DUCKDB_*`).
+
+    `memory_limit` e `threads` não configurados são dimensionados a partir da memória e dos processadores detectados
+    (ver `detect_memory_bytes` e `detect_cpu_count`); quando não é possível detectar, fica o padrão do DuckDB.
+
+    Parâmetros:
+    ----------
+    n_workers : int, opcional, padrão=1
+        O número de processos que dividem a máquina (ver `build_parallel`). O `memory_limit` e os `threads` efetivos,
+        configurados ou detectados, são o total de todos eles e são divididos igualmente entre os processos.
+
+    Retorna:
+    -------
+    dict
+        `{configuração: valor}`, no formato do `SET` do DuckDB.
+
+    Exemplo:
+    --------
+    resource_profile()
+    # {'memory_limit': '11468MiB', 'threads': 4, 'preserve_insertion_order': False}
+    resource_profile(n_workers=4)
+    # {'memory_limit': '2867MiB', 'threads': 1, 'preserve_insertion_order': False}
+    """
+    dict_profile = {}
+    memory_bytes = detect_memory_bytes()
+    if DUCKDB_MEMORY_LIMIT:
+        memory_limit_bytes = parse_size(DUCKDB_MEMORY_LIMIT)
+    else:
+        memory_limit_bytes = int(memory_bytes * DUCKDB_MEMORY_FRACTION) if memory_bytes else None
+
+    if n_workers > 1 and memory_limit_bytes:
+        dict_profile['memory_limit'] = f'{memory_limit_bytes // n_workers // 2**20}MiB'
+    elif DUCKDB_MEMORY_LIMIT:
+        if n_workers > 1:
+            _log.warning(f"resource_profile | DUCKDB_MEMORY_LIMIT='{DUCKDB_MEMORY_LIMIT}' não reconhecido, aplicado sem divisão a cada um dos {n_workers} processos")
+        dict_profile['memory_limit'] = DUCKDB_MEMORY_LIMIT
+    elif memory_limit_bytes:
+        dict_profile['memory_limit'] = f'{memory_limit_bytes // 2**20}MiB'
+
+    threads = int(DUCKDB_THREADS) if DUCKDB_THREADS else detect_cpu_count()
+    if threads:
+        dict_profile['threads'] = max(threads // n_workers, 1)
+    if DUCKDB_TEMP_DIRECTORY:
+        dict_profile['temp_directory'] = DUCKDB_TEMP_DIRECTORY
+    if DUCKDB_MAX_TEMP_DIRECTORY_SIZE:
+        dict_profile['max_temp_directory_size'] = DUCKDB_MAX_TEMP_DIRECTORY_SIZE
+    dict_profile['preserve_insertion_order'] = DUCKDB_PRESERVE_INSERTION_ORDER
+    return dict_profile
+
+
+def apply_resource_profile(db, profile=None):
+    """
+    Aplica um perfil de recursos a uma conexão com o banco de dados.
+
+    As configurações valem para o banco inteiro (todas as conexões e cursores do processo sobre o mesmo arquivo).
+    `temp_directory` só é alterado se for diferente do atual, pois o DuckDB não permite trocá-lo depois de usado.
+
+    Parâmetros:
+    ----------
+    db : DuckDBPyConnection
+        A conexão com o banco de dados DuckDB.
+
+    profile : dict, opcional
+        O perfil a aplicar (ver `resource_profile`). Se não for fornecido, usa `resource_profile()`.
+    """
+    profile = resource_profile() if profile is None else profile
+    for name, value in profile.items():
+        if name == 'temp_directory' and db.execute("SELECT current_setting('temp_directory')").fetchone()[0] == value:
+            continue
+        db.execute(f"SET {name} = '{value}'")
+
+
+def detect_memory_bytes():
+    """
+    Retorna a memória disponível para o processo, em bytes: a memória física ou, se menor, o limite do contêiner
+    (cgroup v2 ou v1). Retorna None se não for possível detectar (ex: Windows).
+    """
+    list_limits = []
+    try:
+        list_limits.append(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES'))
+    except (AttributeError, ValueError, OSError):
+        pass
+
+    for path in ['/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes']:
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        if value.isdigit():
+            list_limits.append(int(value))
+    return min(list_limits) if list_limits else None
+
+
+def detect_cpu_count():
+    """
+    Retorna o número de processadores disponíveis para o processo: os da afinidade do processo ou, se menor, a cota do
+    contêiner (cgroup v2 `cpu.max`).
+    """
+    cpu_count = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cpu_count = min(cpu_count, max(int(quota) // int(period), 1))
+    except (OSError, ValueError):
+        pass
+    return cpu_count
+
+
+def parse_size(value):
+    """
+    Converte um tamanho no formato do DuckDB (ex: `'11.1 GiB'`, `'8GB'`) em bytes. Retorna None se não reconhecer.
+    """
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMGT]i?B|B)\s*', value or '')
+    if not match:
+        return None
+    return int(float(match[1]) * DICT_SIZE_UNITS[match[2]])
+
+
+@contextlib.contextmanager
+def memory_monitor(db_uri, stage, interval=MEMORY_MONITOR_INTERVAL):
+    """
+    Um gerenciador de contexto que registra o pico de memória do DuckDB durante uma etapa, comparado com o orçamento.
+
+    Uma thread lê `duckdb_memory()` a cada `interval` segundos enquanto a etapa executa; ao final, são registrados no log
+    o pico de memória, o pico de uso da pasta temporária (dados que excederam a memória) e o `memory_limit` configurado.
+    Por ser amostrado, o pico pode subestimar picos mais curtos que o intervalo.
+
+    Parâmetros:
+    ----------
+    db_uri : str
+        O URI do banco de dados DuckDB usado pela etapa.
+
+    stage : str
+        O nome da etapa, usado no log.
+
+    interval : float, opcional
+        O intervalo, em segundos, entre as leituras.
+
+    Cede:
+    ------
+    dict
+        `{'pico_memoria': bytes, 'pico_temporario': bytes, 'memory_limit': str}`, preenchido ao final da etapa.
+
+    Exemplo:
+    --------
+    with memory_monitor(DB_URI, 'estabelecimentos'):
+        processar_estabelecimentos(safra)
+    """
+    dict_peak = {'pico_memoria': 0, 'pico_temporario': 0, 'memory_limit': None}
+    stop = threading.Event()
+
+    def sample(db):
+        memory, temporary = db.execute('SELECT COALESCE(SUM(memory_usage_bytes), 0), COALESCE(SUM(temporary_storage_bytes), 0) FROM duckdb_memory()').fetchone()
+        dict_peak['pico_memoria'] = max(dict_peak['pico_memoria'], memory)
+        dict_peak['pico_temporario'] = max(dict_peak['pico_temporario'], temporary)
+
+    def poll(db):
+        while not stop.wait(interval):
+            sample(db)
+
+    with connect_db(db_uri=db_uri) as db:
+        cursor = db.cursor()
+        thread = threading.Thread(target=poll, args=(cursor,), daemon=True)
+        thread.start()
+        try:
+            yield dict_peak
+        finally:
+            stop.set()
+            thread.join()
+            sample(cursor)
+            dict_peak['memory_limit'] = cursor.execute("SELECT current_setting('memory_limit')").fetchone()[0]
+            cursor.close()
+
+    budget = parse_size(dict_peak['memory_limit'])
+    usage = f' ({dict_peak["pico_memoria"] / budget:.0%} do orçamento)' if budget else ''
+    _log.info(f'memory_monitor | {stage} | pico de memória {dict_peak["pico_memoria"] / 2**20:_.0f} MiB{usage} | memory_limit={dict_peak["memory_limit"]} | pico da pasta temporária {dict_peak["pico_temporario"] / 2**20:_.0f} MiB')
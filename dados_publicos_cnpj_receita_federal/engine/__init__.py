@@ -1,5 +1,26 @@
 from dados_publicos_cnpj_receita_federal.engine.empresas import processar_empresas
 from dados_publicos_cnpj_receita_federal.engine.estabelecimentos import processar_estabelecimentos
+from dados_publicos_cnpj_receita_federal.engine.historico import as_of
+from dados_publicos_cnpj_receita_federal.engine.historico import diff_safras
+from dados_publicos_cnpj_receita_federal.engine.referencias import carregar_referencias
+from dados_publicos_cnpj_receita_federal.engine.referencias import referencia_arrow
 from dados_publicos_cnpj_receita_federal.engine.regime_tributario import processar_regime_tributario
 from dados_publicos_cnpj_receita_federal.engine.simples import processar_simples
 from dados_publicos_cnpj_receita_federal.engine.socios import processar_socios
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_EMPRESAS
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_ESTABELECIMENTOS
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_REGIME_TRIBUTARIO
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_SIMPLES
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_SOCIOS
+
+# o `processar_*` de cada tabela, usado pela carga incremental e pela pipeline (`run_pipeline`, `run_resumable` e
+# `build_parallel`); definido antes da importação de `incremental`, que o importa daqui
+DICT_TABLE_ENGINE = {
+    TABLE_NAME_EMPRESAS: processar_empresas,
+    TABLE_NAME_ESTABELECIMENTOS: processar_estabelecimentos,
+    TABLE_NAME_REGIME_TRIBUTARIO: processar_regime_tributario,
+    TABLE_NAME_SIMPLES: processar_simples,
+    TABLE_NAME_SOCIOS: processar_socios,
+}
+
+from dados_publicos_cnpj_receita_federal.engine.incremental import processar_incremental  # noqa: E402
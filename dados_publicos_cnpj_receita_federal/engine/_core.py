@@ -1,32 +1,67 @@
+import fnmatch
+import glob
 import os
+import time
+import zipfile
+from urllib.parse import unquote
 
 import duckdb
+import pandas as pd
 
 from dados_publicos_cnpj_receita_federal import SetupLogger
 from dados_publicos_cnpj_receita_federal.database import connect_db
-from dados_publicos_cnpj_receita_federal.settings import DB_URI
+from dados_publicos_cnpj_receita_federal.io.cnaes import ler_cnaes
+from dados_publicos_cnpj_receita_federal.settings import FOLDER_UNZIP
+from dados_publicos_cnpj_receita_federal.settings import FOLDER_ZIP
 from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_REFERENCIAS_VERSAO
+from dados_publicos_cnpj_receita_federal.settings import TYPED_DATES
+from dados_publicos_cnpj_receita_federal.settings import TYPED_KEYS
+from dados_publicos_cnpj_receita_federal.settings import UNZIP_ENCODING
 
 
 _log = SetupLogger('src.engine._core')
 
+CHUNK_ROWS = 200_000
+SOURCE_ENCODING = 'ISO-8859-1'
 
-def load_data_to_duckdb(db_uri, path, dict_column_types, table_name, safra, sep=';', header='false'):
+# formatos de data aceitos em `'date'` (ver `compile_select`) -> formato do `strptime`
+DICT_DATE_FORMATS = {
+    'YYYYMMDD': '%Y%m%d',
+}
+# valores de origem que representam uma data ausente; no modo tipado viram NULL e não contam como inválidos
+LIST_DATE_SENTINELS = ['', '0', '00000000']
+# coluna com o arquivo .zip de origem de cada linha nas cargas por partição (ver `load_partitions_to_duckdb`)
+PARTITION_COLUMN = 'arquivo_origem'
+
+DICT_MAPPING_TABLES = {
+    'qualificacoes_socios': ('*.QUALSCSV', 'Qualificacoes*.zip', ['codigo', 'descricao']),
+    'pais': ('*.PAISCSV', 'Paises*.zip', ['codigo', 'pais']),
+    'naturezas_juridicas': ('*.NATJUCSV', 'Naturezas*.zip', ['codigo', 'natureza_juridica']),
+    'municipios': ('*.MUNICCSV', 'Municipios*.zip', ['codigo', 'municipio']),
+    'motivos': ('*.MOTICSV', 'Motivos*.zip', ['codigo', 'motivo']),
+}
+
+
+def load_data_to_duckdb(db_uri, path, dict_column_types, table_name, safra, sep=';', header='false', encoding=None, dict_transforms=None, append=False, typed_dates=None, typed_keys=None, order_by=None, partition=None):
     """
     Carrega dados de arquivos CSV em uma tabela do DuckDB, com transformações de tipo.
 
     Esta função lê os dados CSV de um caminho especificado, transforma os tipos de dados de acordo com um dicionário
-    de tipos de coluna fornecido, e carrega os dados em uma tabela do DuckDB. Ela cria uma tabela temporária para
-    ler os dados, realiza as transformações de tipo necessárias e depois insere os dados na tabela de destino.
-    Além disso, adiciona uma coluna `safra` à tabela e a atualiza com o valor fornecido.
+    de tipos de coluna fornecido, e carrega os dados em uma tabela do DuckDB. A tabela é criada com um único
+    `CREATE TABLE AS SELECT` direto do leitor de CSV, com as colunas declaradas a partir de `dict_column_types` (sem
+    detecção automática) e a coluna `safra` como uma constante, de modo que os dados são gravados uma única vez.
+    As transformações de `dict_transforms` (ver `compile_select`) são aplicadas nessa mesma passada; por isso as
+    tabelas de referência (`process_mapping`) são carregadas antes da tabela.
 
     Parâmetros:
     ----------
     db_uri : str
         O URI para conectar ao banco de dados DuckDB.
 
-    path : str
-        O caminho para os arquivos CSV a serem carregados. Pode incluir padrões de coringa para carregar vários arquivos.
+    path : str ou list
+        O caminho para os arquivos CSV a serem carregados. Pode incluir padrões de coringa para carregar vários arquivos,
+        ou ser uma lista de caminhos (ver `load_data_in_batches`).
 
     dict_column_types : dict
         Um dicionário que mapeia os nomes das colunas para seus tipos de dados de destino (exemplo: `{'coluna1': 'INTEGER', 'coluna2': 'DOUBLE'}`).
@@ -44,6 +79,36 @@ def load_data_to_duckdb(db_uri, path, dict_column_types, table_name, safra, sep=
         Especifica se os arquivos CSV contêm uma linha de cabeçalho.
         Defina como `'true'` se a primeira linha contiver os nomes das colunas (padrão é `'false'`).
 
+    encoding : str, opcional
+        A codificação dos arquivos CSV (`'utf-8'` ou `'latin-1'`), repassada ao leitor de CSV do DuckDB. Se não for
+        fornecida, usa `UNZIP_ENCODING` das configurações, a mesma usada por `unzip_safra` ao extrair os arquivos.
+
+    dict_transforms : dict, opcional
+        A especificação das transformações da tabela (ver `compile_select`). Sem ela, apenas os tipos são convertidos.
+
+    append : bool, opcional, padrão=False
+        Se `True`, insere os dados em `table_name` já existente em vez de recriá-la.
+
+    typed_dates : bool, opcional
+        Se `True`, as colunas de data são gravadas como DATE (ver `compile_select`). Se não for fornecido, usa
+        `TYPED_DATES` das configurações.
+
+    typed_keys : bool, opcional
+        Se `True`, as colunas com `'key'` são gravadas com o tipo inteiro da especificação (ver `compile_select`). Se não
+        for fornecido, usa `TYPED_KEYS` das configurações.
+
+    order_by : str, opcional
+        Se fornecido, a tabela é gravada ordenada por esta expressão (ver `sort_table`).
+
+    partition : str, opcional
+        Se fornecido, grava o arquivo .zip de origem na coluna `PARTITION_COLUMN` (ver `load_partitions_to_duckdb`).
+
+    Retorna:
+    -------
+    dict
+        No modo tipado, o número de valores de data inválidos (que não são datas nem `LIST_DATE_SENTINELS`) por
+        coluna; caso contrário, um dicionário vazio.
+
     Lança:
     ------
     Exceção
@@ -59,24 +124,25 @@ def load_data_to_duckdb(db_uri, path, dict_column_types, table_name, safra, sep=
         safra='2024-10'
     )
     """
+    encoding = encoding or UNZIP_ENCODING
+    typed_dates = TYPED_DATES if typed_dates is None else typed_dates
+    typed_keys = TYPED_KEYS if typed_keys is None else typed_keys
+    process_mapping(db_uri, safra, encoding=encoding)
     with connect_db(db_uri=db_uri) as db:
-        list_columns_names = list(dict_column_types.keys())
-        _log.info(f'load_data_to_duckdb | {table_name} | carregando para a tabela temporária -> todos os arquivos em {path=}')
+        _log.info(f'load_data_to_duckdb | {table_name} | carregando e transformando em uma única passada -> todos os arquivos em {path=}')
+        read_csv_clause = _read_csv_clause(path=path, list_columns_names=list(dict_column_types.keys()), sep=sep, header=header, encoding=encoding)
+        select_statement = compile_select(dict_column_types=dict_column_types, safra=safra, relation=read_csv_clause, dict_transforms=dict_transforms, typed_dates=typed_dates, typed_keys=typed_keys, partition=partition)
+        if append:
+            statement = f'INSERT INTO {table_name} {select_statement}'
+        else:
+            statement = f'DROP TABLE IF EXISTS {table_name}; CREATE TABLE {table_name} AS {select_statement}'
+            if order_by:
+                statement += f' ORDER BY {order_by}'
         try:
             db.execute(
                 f"""
                     SET progress_bar_time = 1;
-                    DROP TABLE IF EXISTS temp_table;
-                    CREATE TABLE temp_table AS
-                    SELECT * FROM
-                        read_csv_auto(
-                                '{path}',
-                                sep='{sep}',
-                                header = {header},
-                                quote='"',
-                                union_by_name=true,
-                                names = {list_columns_names}
-                            )
+                    {statement};
                 """,
             )
         except duckdb.duckdb.IOException:
@@ -84,57 +150,92 @@ def load_data_to_duckdb(db_uri, path, dict_column_types, table_name, safra, sep=
             _log.critical(msg)
             raise Exception(msg)
 
-        _log.info(f'load_data_to_duckdb | {table_name} | criando e carregando a tabela final (tipos transformados)')
-        columns_definitions = ',\n'.join([f'{name} {dtype}' for name, dtype in dict_column_types.items()])
-        select_statements = []
-        for name, dtype in dict_column_types.items():
-            if dtype == 'DOUBLE':
-                select_statements.append(f"REPLACE(CAST({name} AS VARCHAR), ',', '.')::DOUBLE AS {name}")
-            elif dtype == 'INTEGER':
-                select_statements.append(f"CAST(REPLACE(CAST({name} AS VARCHAR), ',', '') AS INTEGER) AS {name}")
-            else:
-                select_statements.append(f'CAST({name} AS VARCHAR) AS {name}')
-
-        select_clause = ', '.join(select_statements)
-
-        db.execute(
-            f"""
-                SET progress_bar_time = 1;
-                DROP TABLE IF EXISTS {table_name};
-                CREATE TABLE {table_name} (
-                    {columns_definitions}
-                );
-                INSERT INTO {table_name}
-                SELECT
-                    {select_clause}
-                FROM temp_table;
-            """,
-        )
-
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                ALTER TABLE {table_name} DROP COLUMN IF EXISTS safra;
-                ALTER TABLE {table_name} ADD COLUMN safra VARCHAR;
-                UPDATE {table_name}
-                SET safra = '{safra}';
-                """,
-        )
-
-        db.execute('DROP TABLE IF EXISTS temp_table;')
         _log.info(f'load_data_to_duckdb | {table_name} | tabela carregada')
+        if append and order_by:
+            sort_table(db, table_name=table_name, order_by=order_by)
 
-        process_mapping(db_uri, safra)
+        dict_invalid_dates = {}
+        if typed_dates:
+            dict_invalid_dates = count_invalid_dates(db, relation=read_csv_clause, dict_transforms=dict_transforms)
+            _log_invalid_dates(table_name, dict_invalid_dates)
+        return dict_invalid_dates
 
 
-def process_mapping(db_uri, safra):
+def _read_csv_clause(path, list_columns_names, sep, header, encoding):
     """
-    Processa e carrega os dados de mapeamento no banco de dados DuckDB.
+    Monta a chamada `read_csv` do DuckDB com as colunas declaradas explicitamente como VARCHAR, sem detecção automática
+    de dialeto ou de tipos; as conversões de tipo ficam a cargo de `_select_clause`.
+    """
+    columns = ', '.join(f"'{name}': 'VARCHAR'" for name in list_columns_names)
+    files = f"'{path}'" if isinstance(path, str) else '[' + ', '.join(f"'{file_path}'" for file_path in path) + ']'
+    return f"""read_csv(
+                            {files},
+                            auto_detect = false,
+                            delim = '{sep}',
+                            header = {header},
+                            quote = '"',
+                            escape = '"',
+                            encoding = '{encoding}',
+                            columns = {{{columns}}}
+                        )"""
+
+
+def load_data_in_batches(db_uri, path, dict_column_types, table_name, safra, batch_files, sep=';', header='false', encoding=None, dict_transforms=None, append=False, typed_dates=None, typed_keys=None, order_by=None):
+    """
+    Carrega os arquivos CSV de `path` em lotes de `batch_files` arquivos, um lote por vez, na mesma tabela.
+
+    Cada lote é lido, transformado e gravado por `load_data_to_duckdb` (o primeiro cria a tabela e os demais inserem
+    nela), de modo que a memória e a pasta temporária usadas por cada passada dependem do tamanho do lote e não da
+    safra inteira. A ordenação por `order_by`, se houver, é feita uma única vez, após o último lote. O tempo de cada lote
+    é registrado no log.
+
+    Parâmetros:
+    ----------
+    path : str
+        O padrão dos arquivos CSV (ex: `'.../unzip/*.ESTABELE'`); os arquivos são carregados em ordem alfabética.
+
+    batch_files : int
+        O número de arquivos por lote.
+
+    Os demais parâmetros são os de `load_data_to_duckdb`.
+
+    Retorna:
+    -------
+    dict
+        O número de valores de data inválidos por coluna no modo tipado, somado entre os lotes (ver
+        `load_data_to_duckdb`).
+
+    Lança:
+    ------
+    Exceção
+        Se nenhum arquivo corresponder a `path`.
+
+    Exemplo:
+    --------
+    load_data_in_batches(db_uri=DB_URI, path='/dados/unzip/*.ESTABELE', dict_column_types=dict_column_types, table_name='estabelecimentos', safra='2024-10', batch_files=1)
+    """
+    list_files = sorted(glob.glob(path))
+    if not list_files:
+        msg = f"load_data_in_batches | Verifique se 'safra' existe: {path}"
+        _log.critical(msg)
+        raise Exception(msg)
+
+    n_batches = -(-len(list_files) // batch_files)
+    dict_invalid_dates = {}
+    for i in range(n_batches):
+        start = time.time()
+        list_batch = list_files[i * batch_files : (i + 1) * batch_files]
+        dict_batch = load_data_to_duckdb(db_uri=db_uri, path=list_batch, dict_column_types=dict_column_types, table_name=table_name, safra=safra, sep=sep, header=header, encoding=encoding, dict_transforms=dict_transforms, append=append or i > 0, typed_dates=typed_dates, typed_keys=typed_keys, order_by=order_by if i == n_batches - 1 else None)
+        for name, count in dict_batch.items():
+            dict_invalid_dates[name] = dict_invalid_dates.get(name, 0) + count
+        _log.info(f'load_data_in_batches | {table_name} | lote {i + 1} de {n_batches} ({len(list_batch)} arquivos) em {time.time() - start:.1f} segundos')
+    return dict_invalid_dates
 
-    Esta função verifica se as tabelas de mapeamento específicas existem no banco de dados (como `qualificacoes_socios`,
-    `pais`, `naturezas_juridicas`, `municipios`, `motivos`, e `cnaes`). Se uma tabela não existir, a função carrega
-    os dados CSV correspondentes para o banco de dados. Para algumas tabelas como `cnaes`, os dados são recuperados
-    de uma fonte externa e processados antes de serem carregados no banco de dados.
+
+def load_safra_to_duckdb(db_uri, safra, pattern_unzip, pattern_zip, dict_column_types, table_name, source='unzip', sep=';', header='false', dict_transforms=None, append=False, typed_dates=None, typed_keys=None, order_by=None, batch_files=None, partitions=None):
+    """
+    Carrega uma tabela de uma safra a partir dos CSVs descompactados (`load_data_to_duckdb`) ou diretamente dos
+    arquivos .zip (`load_zip_to_duckdb`), conforme `source`.
 
     Parâmetros:
     ----------
@@ -142,131 +243,774 @@ def process_mapping(db_uri, safra):
         O URI para conectar ao banco de dados DuckDB.
 
     safra : str
-        O identificador do lote ou período de dados a ser processado. Isso é usado para construir caminhos
-        para os arquivos CSV que precisam ser carregados.
+        O identificador do lote ou período de dados a ser processado.
+
+    pattern_unzip : str
+        O padrão dos arquivos CSV dentro da pasta `unzip` da safra (ex: `'*.EMPRECSV'`).
+
+    pattern_zip : str
+        O padrão dos arquivos .zip dentro da pasta `zip` da safra (ex: `'Empresas*.zip'`).
+
+    dict_column_types : dict
+        Um dicionário que mapeia os nomes das colunas para seus tipos de dados de destino.
+
+    table_name : str
+        O nome da tabela de destino.
+
+    source : str, opcional, padrão='unzip'
+        `'unzip'` para ler os CSVs descompactados ou `'zip'` para ler diretamente dos arquivos .zip.
+
+    sep : str, opcional
+        O delimitador usado nos arquivos CSV (padrão é `';'`).
+
+    header : str, opcional
+        Defina como `'true'` se a primeira linha dos arquivos contiver os nomes das colunas (padrão é `'false'`).
+
+    dict_transforms : dict, opcional
+        A especificação das transformações da tabela (ver `compile_select`).
+
+    append : bool, opcional, padrão=False
+        Se `True`, insere os dados em `table_name` já existente em vez de recriá-la.
+
+    typed_dates : bool, opcional
+        Se `True`, as colunas de data são gravadas como DATE (ver `compile_select`). Se não for fornecido, usa
+        `TYPED_DATES` das configurações.
+
+    typed_keys : bool, opcional
+        Se `True`, as colunas com `'key'` são gravadas com o tipo inteiro da especificação (ver `compile_select`). Se não
+        for fornecido, usa `TYPED_KEYS` das configurações.
+
+    order_by : str, opcional
+        Se fornecido, a tabela é gravada ordenada por esta expressão (ver `sort_table`).
+
+    batch_files : int, opcional
+        Com `source='unzip'`, carrega os CSVs em lotes de `batch_files` arquivos, um lote por vez (ver
+        `load_data_in_batches`), em vez de todos numa única passada. Os arquivos .zip já são lidos um por vez, em blocos
+        de linhas.
+
+    partitions : list, opcional
+        Se fornecida, carrega a tabela por partição: apenas os arquivos .zip da lista que correspondem a `pattern_zip`
+        são (re)carregados, substituindo as suas linhas na tabela (ver `load_partitions_to_duckdb`).
+
+    Retorna:
+    -------
+    dict
+        O número de valores de data inválidos por coluna no modo tipado (ver `load_data_to_duckdb`).
 
     Exemplo:
     --------
-    process_mapping(db_uri='caminho_do_banco.duckdb', safra='2024-10')
+    load_safra_to_duckdb(db_uri=DB_URI, safra='2024-10', pattern_unzip='*.EMPRECSV', pattern_zip='Empresas*.zip', dict_column_types=dict_column_types, table_name='empresas', source='zip')
+    """
+    if partitions is not None and source in ('zip', 'unzip'):
+        list_partitions = [partition for partition in partitions if match_zip_patterns(partition, [pattern_zip])]
+        return load_partitions_to_duckdb(db_uri=db_uri, safra=safra, pattern_unzip=pattern_unzip, partitions=list_partitions, dict_column_types=dict_column_types, table_name=table_name, source=source, sep=sep, header=header, dict_transforms=dict_transforms, typed_dates=typed_dates, typed_keys=typed_keys, order_by=order_by)
+    if source == 'zip':
+        path = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_ZIP, pattern_zip)
+        return load_zip_to_duckdb(db_uri=db_uri, path=path, dict_column_types=dict_column_types, table_name=table_name, safra=safra, sep=sep, header=header, dict_transforms=dict_transforms, append=append, typed_dates=typed_dates, typed_keys=typed_keys, order_by=order_by)
+    elif source == 'unzip':
+        path = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_UNZIP, pattern_unzip)
+        if batch_files:
+            return load_data_in_batches(db_uri=db_uri, path=path, dict_column_types=dict_column_types, table_name=table_name, safra=safra, batch_files=batch_files, sep=sep, header=header, dict_transforms=dict_transforms, append=append, typed_dates=typed_dates, typed_keys=typed_keys, order_by=order_by)
+        return load_data_to_duckdb(db_uri=db_uri, path=path, dict_column_types=dict_column_types, table_name=table_name, safra=safra, sep=sep, header=header, dict_transforms=dict_transforms, append=append, typed_dates=typed_dates, typed_keys=typed_keys, order_by=order_by)
+    else:
+        msg = f'load_safra_to_duckdb | {source=} não implementado'
+        _log.info(msg)
+        raise NotImplementedError(msg)
+
+
+def load_partitions_to_duckdb(db_uri, safra, pattern_unzip, partitions, dict_column_types, table_name, source='unzip', sep=';', header='false', dict_transforms=None, typed_dates=None, typed_keys=None, order_by=None):
+    """
+    Substitui, em `table_name`, as linhas de cada arquivo .zip de `partitions` pelas lidas novamente desse arquivo.
+
+    Cada arquivo .zip da safra é uma partição da tabela, identificada na coluna `PARTITION_COLUMN`. Se a tabela já
+    existe com essa coluna, as linhas das partições são apagadas e os arquivos são inseridos de novo, um por vez,
+    mantendo as demais partições; partições sem o arquivo .zip na safra são apenas apagadas. Caso contrário, a tabela é
+    recriada a partir da primeira partição. As colunas convertidas por
+    `apply_data_enums` voltam a ser VARCHAR antes da inserção, pois um `ENUM` não aceita valores novos; a conversão deve
+    ser refeita ao final.
+
+    Parâmetros:
+    ----------
+    pattern_unzip : str
+        O padrão dos arquivos CSV na pasta `unzip` da safra; com `source='unzip'`, cada partição é lida dos CSVs
+        extraídos do seu arquivo .zip que correspondem a este padrão.
+
+    partitions : list
+        Os nomes dos arquivos .zip a (re)carregar (ex: `['Empresas3.zip']`).
+
+    Os demais parâmetros são os de `load_safra_to_duckdb` (sem `append`, que é decidido pela tabela existente).
+
+    Retorna:
+    -------
+    dict
+        O número de valores de data inválidos por coluna no modo tipado, somado entre as partições (ver
+        `load_data_to_duckdb`).
+
+    Exemplo:
+    --------
+    load_partitions_to_duckdb(db_uri=DB_URI, safra='2024-10', pattern_unzip='*.EMPRECSV', partitions=['Empresas3.zip'], dict_column_types=dict_column_types, table_name='empresas')
     """
+    folder_zip = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_ZIP)
     with connect_db(db_uri=db_uri) as db:
-        if not check_table_exists(db_uri=DB_URI, table_name='qualificacoes_socios'):
-            _log.info('process_mapping | indo para qualificacoes_socios')
-            path = os.path.join(PATH_FOLDER_RAW, safra, 'unzip', '*.QUALSCSV')
-            db.execute(
-                f"""
-                    SET progress_bar_time = 1;
-                    DROP TABLE IF EXISTS qualificacoes_socios;
-                    CREATE TABLE qualificacoes_socios AS
-                    SELECT * FROM
-                        read_csv_auto(
-                                '{path}',
-                                sep=';',
-                                header = false,
-                                quote='"',
-                                union_by_name=true,
-                                names = ['codigo', 'descricao']
-                            )
-                """,
-            )
+        dict_types = dict(db.execute('SELECT column_name, data_type FROM duckdb_columns() WHERE table_name = ? AND database_name = current_database() AND schema_name = current_schema()', [table_name]).fetchall())
+        append = PARTITION_COLUMN in dict_types
+        if append and partitions:
+            _log.info(f'load_partitions_to_duckdb | {table_name} | substituindo as partições {partitions}')
+            for name, spec in (dict_transforms or {}).items():
+                if spec.get('enum') and 'map' not in spec and 'lookup' not in spec and dict_types.get(name, '').startswith('ENUM'):
+                    db.execute(f'ALTER TABLE {table_name} ALTER {name} TYPE VARCHAR')
+            db.execute(f'DELETE FROM {table_name} WHERE {PARTITION_COLUMN} IN ({", ".join("?" for _ in partitions)})', partitions)
 
-        if not check_table_exists(db_uri=DB_URI, table_name='pais'):
-            _log.info('process_mapping | indo para pais')
-            path = os.path.join(PATH_FOLDER_RAW, safra, 'unzip', '*.PAISCSV')
-            db.execute(
-                f"""
-                    SET progress_bar_time = 1;
-                    DROP TABLE IF EXISTS pais;
-                    CREATE TABLE pais AS
-                    SELECT * FROM
-                        read_csv_auto(
-                                '{path}',
-                                sep=';',
-                                header = false,
-                                quote='"',
-                                union_by_name=true,
-                                names = ['codigo', 'pais']
-                            )
-                """,
-            )
+    list_partitions = [partition for partition in partitions if os.path.exists(os.path.join(folder_zip, partition))]
+    dict_invalid_dates = {}
+    for i, partition in enumerate(list_partitions):
+        start = time.time()
+        zip_path = os.path.join(folder_zip, partition)
+        order_by_partition = order_by if i == len(list_partitions) - 1 else None
+        if source == 'zip':
+            dict_partition = load_zip_to_duckdb(db_uri=db_uri, path=zip_path, dict_column_types=dict_column_types, table_name=table_name, safra=safra, sep=sep, header=header, dict_transforms=dict_transforms, append=append or i > 0, typed_dates=typed_dates, typed_keys=typed_keys, order_by=order_by_partition, partition=partition)
+        else:
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                list_files = [os.path.join(PATH_FOLDER_RAW, safra, FOLDER_UNZIP, file_name) for file_name in zip_ref.namelist() if fnmatch.fnmatch(file_name, pattern_unzip)]
+            if not list_files:
+                msg = f'load_partitions_to_duckdb | {partition} não contém arquivos {pattern_unzip}'
+                _log.critical(msg)
+                raise Exception(msg)
+            dict_partition = load_data_to_duckdb(db_uri=db_uri, path=list_files, dict_column_types=dict_column_types, table_name=table_name, safra=safra, sep=sep, header=header, dict_transforms=dict_transforms, append=append or i > 0, typed_dates=typed_dates, typed_keys=typed_keys, order_by=order_by_partition, partition=partition)
+        for name, count in dict_partition.items():
+            dict_invalid_dates[name] = dict_invalid_dates.get(name, 0) + count
+        _log.info(f'load_partitions_to_duckdb | {table_name} | partição {partition} ({i + 1} de {len(list_partitions)}) em {time.time() - start:.1f} segundos')
+    if append and order_by and not list_partitions:
+        # as partições inseridas pelas chamadas anteriores (ex: outras fontes de `regime_tributario`) ainda não foram ordenadas
+        with connect_db(db_uri=db_uri) as db:
+            sort_table(db, table_name=table_name, order_by=order_by)
+    return dict_invalid_dates
 
-        if not check_table_exists(db_uri=DB_URI, table_name='naturezas_juridicas'):
-            _log.info('process_mapping | indo para natureza juridica')
-            path = os.path.join(PATH_FOLDER_RAW, safra, 'unzip', '*.NATJUCSV')
-            db.execute(
-                f"""
-                    SET progress_bar_time = 1;
-                    DROP TABLE IF EXISTS naturezas_juridicas;
-                    CREATE TABLE naturezas_juridicas AS
-                    SELECT * FROM
-                        read_csv_auto(
-                                '{path}',
-                                sep=';',
-                                header = false,
-                                quote='"',
-                                union_by_name=true,
-                                names = ['codigo', 'natureza_juridica']
-                            )
-                """,
-            )
 
-        if not check_table_exists(db_uri=DB_URI, table_name='municipios'):
-            _log.info('process_mapping | indo para municipios')
-            path = os.path.join(PATH_FOLDER_RAW, safra, 'unzip', '*.MUNICCSV')
+def load_zip_to_duckdb(db_uri, path, dict_column_types, table_name, safra, sep=';', header='false', chunksize=CHUNK_ROWS, dict_transforms=None, append=False, typed_dates=None, typed_keys=None, order_by=None, partition=None):
+    """
+    Carrega dados de arquivos CSV compactados diretamente dos .zip para uma tabela do DuckDB, sem descompactá-los em disco.
+
+    Cada membro dos arquivos .zip é lido em fluxo (descompressão sob demanda) por um leitor de CSV incremental do
+    pandas em blocos de `chunksize` linhas, já com os nomes das colunas de `dict_column_types`, e cada bloco é inserido
+    na tabela de destino com as mesmas transformações de `load_data_to_duckdb`. Assim, o disco necessário por
+    safra fica em torno de "arquivos .zip + banco de dados", sem a cópia descompactada dos CSVs.
+
+    Parâmetros:
+    ----------
+    db_uri : str
+        O URI para conectar ao banco de dados DuckDB.
+
+    path : str
+        O caminho para os arquivos .zip a serem carregados. Pode incluir padrões de coringa para carregar vários arquivos.
+
+    dict_column_types : dict
+        Um dicionário que mapeia os nomes das colunas para seus tipos de dados de destino.
+
+    table_name : str
+        O nome da tabela de destino onde os dados serão carregados.
+
+    safra : str
+        Um valor de string que será adicionado como uma coluna à tabela (coluna `safra`).
+
+    sep : str, opcional
+        O delimitador usado nos arquivos CSV (padrão é `';'`).
+
+    header : str, opcional
+        Defina como `'true'` se a primeira linha dos arquivos contiver os nomes das colunas (padrão é `'false'`).
+
+    chunksize : int, opcional
+        O número de linhas lidas e inseridas por bloco (padrão é `CHUNK_ROWS`).
+
+    dict_transforms : dict, opcional
+        A especificação das transformações da tabela (ver `compile_select`).
+
+    append : bool, opcional, padrão=False
+        Se `True`, insere os dados em `table_name` já existente em vez de recriá-la.
+
+    typed_dates : bool, opcional
+        Se `True`, as colunas de data são gravadas como DATE (ver `compile_select`). Se não for fornecido, usa
+        `TYPED_DATES` das configurações.
+
+    typed_keys : bool, opcional
+        Se `True`, as colunas com `'key'` são gravadas com o tipo inteiro da especificação (ver `compile_select`). Se não
+        for fornecido, usa `TYPED_KEYS` das configurações.
+
+    order_by : str, opcional
+        Se fornecido, a tabela é gravada ordenada por esta expressão (ver `sort_table`).
+
+    partition : str, opcional
+        Se fornecido, grava o arquivo .zip de origem na coluna `PARTITION_COLUMN` (ver `load_partitions_to_duckdb`).
+
+    Retorna:
+    -------
+    dict
+        O número de valores de data inválidos por coluna no modo tipado (ver `load_data_to_duckdb`).
+
+    Lança:
+    ------
+    Exceção
+        Se nenhum arquivo .zip for encontrado em `path`.
+
+    Exemplo:
+    --------
+    load_zip_to_duckdb(
+        db_uri='caminho_do_banco.duckdb',
+        path='/dados/zip/Empresas*.zip',
+        dict_column_types={'cnpj_basico': 'VARCHAR', 'capital_social': 'DOUBLE'},
+        table_name='empresas',
+        safra='2024-10'
+    )
+    """
+    if not glob.glob(path):
+        msg = f"load_zip_to_duckdb | Verifique se 'safra' existe: {path}"
+        _log.critical(msg)
+        raise Exception(msg)
+
+    start = time.time()
+    typed_dates = TYPED_DATES if typed_dates is None else typed_dates
+    typed_keys = TYPED_KEYS if typed_keys is None else typed_keys
+    process_mapping(db_uri, safra, source='zip')
+    with connect_db(db_uri=db_uri) as db:
+        _log.info(f'load_zip_to_duckdb | {table_name} | carregando em blocos de {chunksize:_} linhas -> todos os arquivos em {path=}')
+        list_columns_names = list(dict_column_types.keys())
+        select_statement = compile_select(dict_column_types=dict_column_types, safra=safra, relation='chunk_csv', dict_transforms=dict_transforms, typed_dates=typed_dates, typed_keys=typed_keys, partition=partition)
+        if not append:
+            db.register('chunk_csv', pd.DataFrame(columns=list_columns_names, dtype=str))
             db.execute(
                 f"""
-                    SET progress_bar_time = 1;
-                    DROP TABLE IF EXISTS municipios;
-                    CREATE TABLE municipios AS
-                    SELECT * FROM
-                        read_csv_auto(
-                                '{path}',
-                                sep=';',
-                                header = false,
-                                quote='"',
-                                union_by_name=true,
-                                names = ['codigo', 'municipio']
-                            )
+                    DROP TABLE IF EXISTS {table_name};
+                    CREATE TABLE {table_name} AS {select_statement} LIMIT 0;
                 """,
             )
+            db.unregister('chunk_csv')
+
+        row_count = 0
+        dict_invalid_dates = {}
+        for chunk in _iter_zip_csv_chunks(path=path, list_columns_names=list_columns_names, sep=sep, header=header, chunksize=chunksize):
+            db.register('chunk_csv', chunk)
+            db.execute(f'INSERT INTO {table_name} {select_statement}')
+            if typed_dates:
+                for name, count in count_invalid_dates(db, relation='chunk_csv', dict_transforms=dict_transforms).items():
+                    dict_invalid_dates[name] = dict_invalid_dates.get(name, 0) + count
+            db.unregister('chunk_csv')
+            row_count += len(chunk)
+
+        _log.info(f'load_zip_to_duckdb | {table_name} | tabela carregada com {row_count:_} linhas em {time.time() - start:.1f} segundos')
+        if order_by:
+            sort_table(db, table_name=table_name, order_by=order_by)
+        if typed_dates:
+            _log_invalid_dates(table_name, dict_invalid_dates)
+        return dict_invalid_dates
+
+
+def _iter_zip_csv_chunks(path, list_columns_names, sep, header, dtype=str, chunksize=CHUNK_ROWS):
+    """
+    Percorre, em blocos de `chunksize` linhas, todos os CSVs contidos nos arquivos .zip de `path` sem extraí-los.
+    """
+    for zip_path in sorted(glob.glob(path)):
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            for file_name in zip_ref.namelist():
+                with zip_ref.open(file_name) as member_fd:
+                    reader = pd.read_csv(
+                        member_fd,
+                        sep=sep,
+                        header=0 if header == 'true' else None,
+                        names=list_columns_names,
+                        dtype=dtype,
+                        encoding=SOURCE_ENCODING,
+                        quotechar='"',
+                        keep_default_na=False,
+                        na_values=[''],
+                        chunksize=chunksize,
+                    )
+                    for chunk in reader:
+                        yield chunk
+
+
+def _select_clause(dict_column_types):
+    """
+    Monta as expressões do SELECT que convertem as colunas lidas do CSV para os tipos de `dict_column_types`.
+    """
+    return ', '.join(f'{_cast_expression(name, dtype)} AS {name}' for name, dtype in dict_column_types.items())
+
+
+def _cast_expression(name, dtype):
+    """
+    Monta a expressão que converte uma coluna lida do CSV para o tipo `dtype`.
+    """
+    if dtype == 'DOUBLE':
+        return f"REPLACE(CAST({name} AS VARCHAR), ',', '.')::DOUBLE"
+    if dtype == 'INTEGER':
+        return f"CAST(REPLACE(CAST({name} AS VARCHAR), ',', '') AS INTEGER)"
+    return f'CAST({name} AS VARCHAR)'
+
+
+def compile_select(dict_column_types, safra, relation, dict_transforms=None, typed_dates=False, typed_keys=False, partition=None):
+    """
+    Compila a especificação declarativa de uma tabela em um único `SELECT` sobre `relation`.
+
+    A consulta tem duas camadas: a interna converte os tipos (`_select_clause`), aplica as transformações das colunas
+    de `dict_column_types` no próprio lugar e adiciona a `safra`; a externa calcula as colunas derivadas a partir dos
+    valores já transformados. A ordem das colunas do resultado é: as colunas de `dict_column_types`, `safra` e as
+    colunas derivadas, na ordem em que aparecem em `dict_transforms`.
+
+    Cada entrada de `dict_transforms` mapeia o nome de uma coluna para um dicionário com as operações, aplicadas nesta
+    ordem:
 
-        if not check_table_exists(db_uri=DB_URI, table_name='motivos'):
-            _log.info('process_mapping | indo para motivos')
-            path = os.path.join(PATH_FOLDER_RAW, safra, 'unzip', '*.MOTICSV')
+    - `'column'`: a coluna de origem de uma coluna derivada (por padrão, a própria coluna);
+    - `'concat'`: lista de colunas concatenadas com `||` (nula se alguma delas for nula), no lugar de `'column'`;
+    - `'lpad'`: preenche com zeros à esquerda até o tamanho informado;
+    - `'remove'`: lista de caracteres removidos do valor;
+    - `'date'`: o formato de origem da data (uma chave de `DICT_DATE_FORMATS`), convertida para o texto `'YYYY-MM-DD'`
+      ou, com `typed_dates=True`, para DATE por um único `TRY_STRPTIME`, com `LIST_DATE_SENTINELS` e valores inválidos
+      como NULL (ver `count_invalid_dates`);
+    - `'null_if'`: valor de origem convertido em nulo (avaliado antes de `'date'`);
+    - `'map'`: dicionário de código -> descrição, com `'default'` (padrão `None`) para os códigos não mapeados;
+    - `'lookup'`: tupla `(tabela_de_referencia, coluna_de_descricao)`, apenas em colunas derivadas. A busca é um
+      `LEFT JOIN` (hash join) da coluna de origem, convertida para INTEGER, com a coluna `codigo` da referência, que é
+      carregada já tipada e sem códigos repetidos por `process_mapping`.
+    - `'enum'`: se `True`, a coluna é gravada como `ENUM`. Com `'map'`, os valores do `ENUM` são as descrições do
+      mapeamento (e o `'default'`); com `'lookup'`, é o tipo `enum_<tabela_de_referencia>` criado por `process_mapping`
+      a partir da referência; nas demais colunas, o domínio só é conhecido depois da carga e a conversão é feita por
+      `apply_data_enums`.
+    - `'key'`: tupla `(tipo_inteiro, largura)` de uma chave como `cnpj_basico`. Com `typed_keys=True` a coluna é
+      convertida para o tipo inteiro depois das demais transformações (as colunas derivadas continuam usando o texto),
+      e a largura é usada para voltar ao texto com zeros à esquerda nas views de `create_text_view`.
+
+    Parâmetros:
+    ----------
+    dict_column_types : dict
+        As colunas lidas dos arquivos e seus tipos de destino.
+
+    safra : str
+        O valor da coluna `safra`.
+
+    relation : str
+        A relação de origem das colunas (a chamada `read_csv` ou o nome de uma tabela registrada).
+
+    dict_transforms : dict, opcional
+        A especificação das transformações.
+
+    typed_dates : bool, opcional, padrão=False
+        Se `True`, as colunas com `'date'` são DATE em vez de texto.
+
+    typed_keys : bool, opcional, padrão=False
+        Se `True`, as colunas com `'key'` são gravadas com o tipo inteiro da especificação.
+
+    partition : str, opcional
+        Se fornecido, o valor da coluna `PARTITION_COLUMN` (o arquivo .zip de origem), logo após `safra`.
+
+    Retorna:
+    -------
+    str
+        O comando `SELECT`.
+
+    Exemplo:
+    --------
+    compile_select(
+        dict_column_types={'cnpj_basico': 'VARCHAR', 'porte': 'VARCHAR'},
+        safra='2024-10',
+        relation='chunk_csv',
+        dict_transforms={
+            'cnpj_basico': {'lpad': 8},
+            'porte_desc': {'column': 'porte', 'map': {'01': 'NÃO INFORMADO'}},
+        },
+    )
+    """
+    dict_transforms = dict_transforms or {}
+    list_inner = []
+    for name, dtype in dict_column_types.items():
+        expression = _cast_expression(name, dtype)
+        if name in dict_transforms:
+            expression = _enum_expression(dict_transforms[name], _transform_expression(name, dict_transforms[name], expression, typed_dates=typed_dates))
+        list_inner.append(f'{expression} AS {name}')
+    list_inner.append(f"'{safra}'::VARCHAR AS safra")
+    if partition:
+        list_inner.append(f"'{partition}'::VARCHAR AS {PARTITION_COLUMN}")
+
+    list_outer = [_key_expression(dict_transforms.get(name, {}), f'src.{name}', typed_keys) + f' AS {name}' for name in dict_column_types]
+    list_outer.append('src.safra')
+    if partition:
+        list_outer.append(f'src.{PARTITION_COLUMN}')
+    list_joins = []
+    for name, spec in dict_transforms.items():
+        if name in dict_column_types:
+            continue
+        source_column = spec.get('column', name)
+        if 'lookup' in spec:
+            reference_table, reference_column = spec['lookup']
+            alias = f'lookup_{name}'
+            key = _transform_expression(name, {key: value for key, value in spec.items() if key != 'lookup'}, f'src.{source_column}', typed_dates=typed_dates)
+            list_joins.append(f'LEFT JOIN {reference_table} AS {alias} ON {alias}.codigo = TRY_CAST({key} AS INTEGER)')
+            list_outer.append(f'{_enum_expression(spec, f"{alias}.{reference_column}")} AS {name}')
+        else:
+            expression = _enum_expression(spec, _transform_expression(name, spec, f'src.{source_column}', typed_dates=typed_dates))
+            list_outer.append(f'{_key_expression(spec, expression, typed_keys)} AS {name}')
+
+    inner = ',\n'.join(list_inner)
+    outer = ',\n'.join(list_outer)
+    joins = '\n'.join(list_joins)
+    return f"""
+        SELECT
+            {outer}
+        FROM (
+            SELECT
+                {inner}
+            FROM {relation}
+        ) AS src
+        {joins}
+    """
+
+
+def _transform_expression(name, spec, expression, typed_dates=False):
+    """
+    Monta a expressão SQL da coluna `name` a partir da sua especificação (ver `compile_select`), aplicada sobre
+    `expression`: a coluna já convertida para o seu tipo ou, nas colunas derivadas, a coluna de origem.
+    """
+    if 'concat' in spec:
+        expression = ' || '.join(f'src.{column}' for column in spec['concat'])
+
+    if 'lpad' in spec:
+        expression = f"LPAD({expression}, {spec['lpad']}, '0')"
+
+    for char in spec.get('remove', []):
+        expression = f"REPLACE({expression}, '{char}', '')"
+
+    if 'date' in spec and typed_dates:
+        expression = f"TRY_STRPTIME({expression}, '{_date_format(name, spec)}')::DATE"
+    elif 'date' in spec:
+        _date_format(name, spec)
+        date_expression = f"SUBSTR({expression}, 1, 4) || '-' || SUBSTR({expression}, 5, 2) || '-' || SUBSTR({expression}, 7, 2)"
+        if 'null_if' in spec:
+            expression = f"CASE WHEN {expression} = '{spec['null_if']}' THEN NULL ELSE {date_expression} END"
+        else:
+            expression = date_expression
+    elif 'null_if' in spec:
+        expression = f"NULLIF({expression}, '{spec['null_if']}')"
+
+    if 'map' in spec:
+        default = spec.get('default')
+        case_statement = ' '.join(f"WHEN '{key}' THEN '{value}'" for key, value in spec['map'].items())
+        default = 'NULL' if default is None else f"'{default}'"
+        expression = f'CASE {expression} {case_statement} ELSE {default} END'
+
+    return expression
+
+
+def _key_expression(spec, expression, typed_keys):
+    """
+    Converte `expression` para o tipo inteiro de `'key'` quando `typed_keys` (ver `compile_select`).
+    """
+    if not typed_keys or 'key' not in spec:
+        return expression
+    key_type, _ = spec['key']
+    return f'TRY_CAST({expression} AS {key_type})'
+
+
+def sort_table(db, table_name, order_by):
+    """
+    Regrava `table_name` ordenada por `order_by`, para que os mapas de mínimo e máximo do DuckDB descartem os blocos
+    fora do intervalo nas buscas e junções pela chave.
+
+    Usada quando a tabela não pode ser gravada já ordenada em um único `CREATE TABLE AS SELECT ... ORDER BY`: na
+    carga em blocos dos .zip e nas cargas com `append`.
+
+    Parâmetros:
+    ----------
+    db : duckdb.DuckDBPyConnection
+        A conexão com o banco de dados.
+
+    table_name : str
+        O nome da tabela.
+
+    order_by : str
+        A expressão de ordenação (ex: `'cnpj_basico'`).
+    """
+    _log.info(f'sort_table | {table_name} | ordenando por {order_by}')
+    db.execute(
+        f"""
+            SET progress_bar_time = 1;
+            CREATE OR REPLACE TABLE {table_name} AS SELECT * FROM {table_name} ORDER BY {order_by};
+        """,
+    )
+
+
+def create_text_view(db_uri, table_name, dict_transforms):
+    """
+    Cria a view `<table_name>_texto`, igual a `table_name` mas com as chaves inteiras (`'key'` em `dict_transforms`)
+    de volta ao formato texto com zeros à esquerda (ex: `cnpj_basico` 12345 -> `'00012345'`).
+
+    Parâmetros:
+    ----------
+    db_uri : str
+        O URI para conectar ao banco de dados DuckDB.
+
+    table_name : str
+        O nome da tabela com as chaves inteiras.
+
+    dict_transforms : dict
+        A especificação das transformações da tabela (ver `compile_select`).
+
+    Exemplo:
+    --------
+    create_text_view(db_uri=DB_URI, table_name='empresas', dict_transforms={'cnpj_basico': {'lpad': 8, 'key': ('INTEGER', 8)}})
+    """
+    replace = ', '.join(f"LPAD(CAST({name} AS VARCHAR), {spec['key'][1]}, '0') AS {name}" for name, spec in dict_transforms.items() if 'key' in spec)
+    if not replace:
+        return
+
+    with connect_db(db_uri=db_uri) as db:
+        _log.info(f'create_text_view | {table_name}_texto')
+        db.execute(f'CREATE OR REPLACE VIEW {table_name}_texto AS SELECT * REPLACE ({replace}) FROM {table_name}')
+
+
+def _date_format(name, spec):
+    """
+    Devolve o formato do `strptime` correspondente ao `'date'` da especificação da coluna `name`.
+    """
+    if spec['date'] not in DICT_DATE_FORMATS:
+        msg = f"compile_select | {name} | formato de data não suportado: {spec['date']}"
+        _log.critical(msg)
+        raise NotImplementedError(msg)
+    return DICT_DATE_FORMATS[spec['date']]
+
+
+def count_invalid_dates(db, relation, dict_transforms):
+    """
+    Conta, por coluna com `'date'` em `dict_transforms`, os valores de `relation` que não são datas válidas no formato
+    da especificação nem uma data ausente (nulo, `LIST_DATE_SENTINELS` ou o `'null_if'` da coluna). No modo tipado,
+    esses valores são gravados como NULL.
+
+    Parâmetros:
+    ----------
+    db : duckdb.DuckDBPyConnection
+        A conexão com o banco de dados.
+
+    relation : str
+        A relação com os valores de origem (a chamada `read_csv` ou o nome de uma tabela registrada).
+
+    dict_transforms : dict
+        A especificação das transformações da tabela (ver `compile_select`).
+
+    Retorna:
+    -------
+    dict
+        O número de valores inválidos por coluna.
+    """
+    dict_date_specs = {name: spec for name, spec in (dict_transforms or {}).items() if 'date' in spec}
+    if not dict_date_specs:
+        return {}
+
+    list_counts = []
+    for name, spec in dict_date_specs.items():
+        sentinels = ', '.join(f"'{value}'" for value in dict.fromkeys([*LIST_DATE_SENTINELS, *([spec['null_if']] if 'null_if' in spec else [])]))
+        list_counts.append(f"COUNT_IF({name} NOT IN ({sentinels}) AND TRY_STRPTIME({name}, '{_date_format(name, spec)}') IS NULL) AS {name}")
+    counts = ',\n'.join(list_counts)
+    row = db.execute(f'SELECT {counts} FROM {relation}').fetchone()
+    return dict(zip(dict_date_specs, row))
+
+
+def _log_invalid_dates(table_name, dict_invalid_dates):
+    for name, count in dict_invalid_dates.items():
+        if count:
+            _log.warning(f'load | {table_name} | {name} | {count:_} valores de data inválidos gravados como NULL')
+        else:
+            _log.info(f'load | {table_name} | {name} | nenhum valor de data inválido')
+
+
+def _enum_expression(spec, expression):
+    """
+    Converte `expression` para `ENUM` quando a especificação tem `'enum'` e o domínio é conhecido na compilação (ver
+    `compile_select`); caso contrário, devolve `expression` sem alterações.
+    """
+    if not spec.get('enum'):
+        return expression
+    if 'lookup' in spec:
+        reference_table, _ = spec['lookup']
+        return f'CAST({expression} AS enum_{reference_table})'
+    if 'map' in spec:
+        list_values = [*spec['map'].values()]
+        if spec.get('default') is not None:
+            list_values.append(spec['default'])
+        return f'CAST({expression} AS {_enum_type(list_values)})'
+    return expression
+
+
+def _enum_type(list_values):
+    """
+    Monta a declaração de um tipo `ENUM` com os valores de `list_values`, sem repetições e na ordem recebida.
+    """
+    values = ', '.join("'{}'".format(value.replace("'", "''")) for value in dict.fromkeys(list_values))
+    return f'ENUM({values})'
+
+
+def apply_data_enums(db_uri, table_name, dict_transforms):
+    """
+    Converte para `ENUM` as colunas de `table_name` marcadas com `'enum'` em `dict_transforms` cujo domínio não é
+    conhecido antes da carga (sem `'map'` ou `'lookup'`, como `uf`). Os valores do `ENUM` são os valores distintos
+    da coluna, em ordem alfabética.
+
+    Deve ser chamada depois que todos os dados da tabela foram carregados, já que um `ENUM` não aceita valores fora
+    do seu domínio.
+
+    Parâmetros:
+    ----------
+    db_uri : str
+        O URI para conectar ao banco de dados DuckDB.
+
+    table_name : str
+        O nome da tabela.
+
+    dict_transforms : dict
+        A especificação das transformações da tabela (ver `compile_select`).
+
+    Exemplo:
+    --------
+    apply_data_enums(db_uri=DB_URI, table_name='estabelecimentos', dict_transforms={'uf': {'enum': True}})
+    """
+    list_columns = [name for name, spec in dict_transforms.items() if spec.get('enum') and 'map' not in spec and 'lookup' not in spec]
+    if not list_columns:
+        return
+
+    with connect_db(db_uri=db_uri) as db:
+        for name in list_columns:
+            list_values = [row[0] for row in db.execute(f'SELECT DISTINCT {name} FROM {table_name} WHERE {name} IS NOT NULL ORDER BY 1').fetchall()]
+            _log.info(f'apply_data_enums | {table_name} | convertendo {name} para ENUM com {len(list_values)} valores')
+            if list_values:
+                db.execute(f'ALTER TABLE {table_name} ALTER {name} TYPE {_enum_type(list_values)}')
+
+
+def process_mapping(db_uri, safra, encoding=None, source='unzip'):
+    """
+    Processa e carrega os dados de mapeamento no banco de dados DuckDB.
+
+    As tabelas de referência (`qualificacoes_socios`, `pais`, `naturezas_juridicas`, `municipios` e `motivos`) são
+    versionadas pela safra: a safra de origem de cada uma fica registrada em `TABLE_NAME_REFERENCIAS_VERSAO` e a tabela
+    só é (re)carregada quando não existe ou foi carregada de outra safra. Assim, as várias chamadas de uma mesma safra
+    (uma por carga de tabela) custam uma única consulta, numa única conexão, e uma safra nova atualiza as referências.
+    Cada tabela é carregada com tipos explícitos: o código INTEGER (sem repetições) e a descrição VARCHAR, prontas para
+    as buscas por hash join de `compile_select`; junto com ela é recriado o tipo `enum_<tabela>` com as descrições,
+    usado pelas colunas buscadas com `'enum'`. A CNAE, que não depende da safra, vem do snapshot local (ver
+    `ler_cnaes`, sem acesso à rede) e é versionada pela versão do snapshot: `cnaes_hierarquia` guarda os nós da
+    hierarquia (seção, divisão, grupo, classe e subclasse, com o código do nível pai), indexados pelo código, e `cnaes`
+    as classes (`id` e `descricao`). Os códigos da CNAE são VARCHAR, pois as seções são letras e os demais níveis têm
+    zeros à esquerda. Com um snapshot sem as classes (como o distribuído com o pacote, que só tem as seções e
+    divisões), a carga segue com um aviso no log e `cnaes` vazia.
+
+    Parâmetros:
+    ----------
+    db_uri : str
+        O URI para conectar ao banco de dados DuckDB.
+
+    safra : str
+        O identificador do lote ou período de dados a ser processado. Isso é usado para construir caminhos
+        para os arquivos CSV que precisam ser carregados e como versão das tabelas de referência.
+
+    encoding : str, opcional
+        A codificação dos arquivos CSV (ver `load_data_to_duckdb`).
+
+    source : str, opcional, padrão='unzip'
+        De onde ler os arquivos: `'unzip'` para os CSVs descompactados ou `'zip'` para ler diretamente dos .zip
+        (ver `load_zip_to_duckdb`).
+
+    Lança:
+    ------
+    Exceção
+        Se nenhum arquivo de uma tabela de referência a (re)carregar for encontrado na safra.
+
+    Exemplo:
+    --------
+    process_mapping(db_uri='caminho_do_banco.duckdb', safra='2024-10')
+    """
+    encoding = encoding or UNZIP_ENCODING
+    with connect_db(db_uri=db_uri) as db:
+        dict_versions = reference_versions(db)
+        for mapping_table_name, (pattern_unzip, pattern_zip, list_columns_names) in DICT_MAPPING_TABLES.items():
+            if dict_versions.get(mapping_table_name, (None, None))[0] == safra:
+                continue
+
+            _log.info(f'process_mapping | indo para {mapping_table_name} | {safra=}')
+            if source == 'zip':
+                path = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_ZIP, pattern_zip)
+            else:
+                path = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_UNZIP, pattern_unzip)
+            if not glob.glob(path):
+                msg = f"process_mapping | Verifique se 'safra' existe: {path}"
+                _log.critical(msg)
+                raise Exception(msg)
+
+            if source == 'zip':
+                db.register('mapping_csv', pd.concat(_iter_zip_csv_chunks(path=path, list_columns_names=list_columns_names, sep=';', header='false')))
+                relation = 'mapping_csv'
+            else:
+                relation = _read_csv_clause(path=path, list_columns_names=list_columns_names, sep=';', header='false', encoding=encoding)
+
+            code_column, description_column = list_columns_names
             db.execute(
                 f"""
                     SET progress_bar_time = 1;
-                    DROP TABLE IF EXISTS motivos;
-                    CREATE TABLE motivos AS
-                    SELECT * FROM
-                        read_csv_auto(
-                                '{path}',
-                                sep=';',
-                                header = false,
-                                quote='"',
-                                union_by_name=true,
-                                names = ['codigo', 'motivo']
-                            )
+                    DROP TABLE IF EXISTS {mapping_table_name};
+                    CREATE TABLE {mapping_table_name} AS
+                    SELECT
+                        TRY_CAST({code_column} AS INTEGER) AS {code_column},
+                        ANY_VALUE(CAST({description_column} AS VARCHAR)) AS {description_column}
+                    FROM {relation}
+                    GROUP BY 1;
+                    DROP TYPE IF EXISTS enum_{mapping_table_name};
+                    CREATE TYPE enum_{mapping_table_name} AS ENUM (SELECT DISTINCT {description_column} FROM {mapping_table_name} WHERE {description_column} IS NOT NULL ORDER BY 1);
                 """,
             )
+            db.execute(f'INSERT OR REPLACE INTO {TABLE_NAME_REFERENCIAS_VERSAO} VALUES (?, ?, current_timestamp)', [mapping_table_name, safra])
+            if source == 'zip':
+                db.unregister('mapping_csv')
 
-        if not check_table_exists(db_uri=DB_URI, table_name='cnaes'):
-            _log.info('process_mapping | indo para cnaes')
+        snapshot = ler_cnaes()
+        if any(dict_versions.get(table_name, (None, None))[0] != snapshot['versao'] for table_name in ('cnaes', 'cnaes_hierarquia')):
+            _log.info(f'process_mapping | indo para cnaes | versao={snapshot["versao"]}')
+            if not any(item[0] == 'classe' for item in snapshot['itens']):
+                _log.warning(f"process_mapping | o snapshot da CNAE versao={snapshot['versao']} não tem as classes e `cnaes` ficará vazia; para a hierarquia completa, gere o cache local com `python -m dados_publicos_cnpj_receita_federal.io.cnaes` (ver `atualizar_cnaes`)")
+            db.register('cnaes_snapshot', pd.DataFrame(snapshot['itens'], columns=['nivel', 'codigo', 'descricao', 'codigo_pai']))
             db.execute(
                 """
-                    SET progress_bar_time = 1;
+                    DROP TABLE IF EXISTS cnaes_hierarquia;
+                    CREATE TABLE cnaes_hierarquia (nivel VARCHAR, codigo VARCHAR PRIMARY KEY, descricao VARCHAR, codigo_pai VARCHAR);
+                    INSERT INTO cnaes_hierarquia SELECT nivel, codigo, descricao, codigo_pai FROM cnaes_snapshot ORDER BY codigo;
                     DROP TABLE IF EXISTS cnaes;
-                    CREATE TABLE cnaes AS
-                    SELECT * FROM
-                        read_csv_auto(
-                                'https://servicodados.ibge.gov.br/api/v2/cnae/classes',
-                                sep=',',
-                                header = true,
-                                quote='"',
-                                union_by_name=true
-                            )
+                    CREATE TABLE cnaes AS SELECT codigo AS id, descricao FROM cnaes_hierarquia WHERE nivel = 'classe' ORDER BY id;
                 """,
             )
+            db.unregister('cnaes_snapshot')
+            for table_name in ('cnaes', 'cnaes_hierarquia'):
+                db.execute(f'INSERT OR REPLACE INTO {TABLE_NAME_REFERENCIAS_VERSAO} VALUES (?, ?, current_timestamp)', [table_name, snapshot['versao']])
+
+
+def reference_versions(db):
+    """
+    Retorna a safra de origem de cada tabela de referência presente no banco de dados.
+
+    Cria `TABLE_NAME_REFERENCIAS_VERSAO` se ainda não existir. Tabelas registradas que não existem mais no banco (por
+    exemplo, removidas manualmente) são ignoradas, para que sejam carregadas de novo.
+
+    Parâmetros:
+    ----------
+    db : DuckDBPyConnection
+        A conexão com o banco de dados DuckDB.
+
+    Retorna:
+    -------
+    dict
+        `{tabela: (safra, carregado_em)}` para cada tabela de referência carregada.
+    """
+    db.execute(f'CREATE TABLE IF NOT EXISTS {TABLE_NAME_REFERENCIAS_VERSAO} (tabela VARCHAR PRIMARY KEY, safra VARCHAR, carregado_em TIMESTAMP)')
+    rows = db.execute(
+        f"""
+            SELECT versao.tabela, versao.safra, versao.carregado_em
+            FROM {TABLE_NAME_REFERENCIAS_VERSAO} AS versao
+            JOIN duckdb_tables() AS tabelas ON tabelas.table_name = versao.tabela AND tabelas.database_name = current_database()
+        """,
+    ).fetchall()
+    return {tabela: (safra, carregado_em) for tabela, safra, carregado_em in rows}
 
 
 def check_table_exists(db_uri, table_name):
@@ -287,5 +1031,26 @@ def check_table_exists(db_uri, table_name):
         Retorna True se a tabela existir, caso contrário False.
     """
     with connect_db(db_uri=db_uri) as db:
-        result = db.execute(f"SELECT COUNT(*) FROM information_schema.tables WHERE table_name = '{table_name}'").fetchall()
+        result = db.execute('SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?', [table_name]).fetchall()
         return result[0][0] > 0
+
+
+def match_zip_patterns(filename, patterns):
+    """
+    Verifica se o nome de um arquivo .zip (com ou sem codificação de URL, ex: `Lucro%20Real.zip`) corresponde a algum dos
+    padrões (ex: `DICT_TABLE_ZIP_PATTERNS`).
+
+    Parâmetros:
+    ----------
+    filename : str
+        O nome do arquivo .zip.
+
+    patterns : list
+        Os padrões no formato do `fnmatch` (ex: `['Empresas*.zip']`).
+
+    Retorna:
+    -------
+    bool
+        True se o nome corresponder a algum dos padrões.
+    """
+    return any(fnmatch.fnmatch(unquote(filename), pattern) for pattern in patterns)
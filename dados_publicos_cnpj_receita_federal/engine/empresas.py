@@ -1,28 +1,59 @@
-import os
 import time
 
 from dados_publicos_cnpj_receita_federal import SetupLogger
 from dados_publicos_cnpj_receita_federal.database import connect_db
-from dados_publicos_cnpj_receita_federal.engine._core import load_data_to_duckdb
+from dados_publicos_cnpj_receita_federal.database import memory_monitor
+from dados_publicos_cnpj_receita_federal.engine._core import apply_data_enums
+from dados_publicos_cnpj_receita_federal.engine._core import create_text_view
+from dados_publicos_cnpj_receita_federal.engine._core import load_safra_to_duckdb
+from dados_publicos_cnpj_receita_federal.engine.historico import arquivar_safra
 from dados_publicos_cnpj_receita_federal.settings import DB_URI
-from dados_publicos_cnpj_receita_federal.settings import FOLDER_UNZIP
-from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
+from dados_publicos_cnpj_receita_federal.settings import HISTORY
+from dados_publicos_cnpj_receita_federal.settings import LOAD_BATCH_FILES
 from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_EMPRESAS
+from dados_publicos_cnpj_receita_federal.settings import TYPED_KEYS
 
 _log = SetupLogger('engine.empresas')
 
+ORDER_BY = 'cnpj_basico'
 
-def processar_empresas(safra):
+DICT_COLUMN_TYPES = {
+    'cnpj_basico': 'VARCHAR',
+    'razao_social': 'VARCHAR',
+    'codigo_natureza_juridica': 'VARCHAR',
+    'codigo_qualificacao_responsavel': 'VARCHAR',
+    'capital_social': 'DOUBLE',
+    'porte': 'VARCHAR',
+    'ente_federativo_responsavel': 'VARCHAR',
+}
+
+DICT_TRANSFORMS = {
+    'cnpj_basico': {'lpad': 8, 'key': ('INTEGER', 8)},
+    'porte_desc': {
+        'column': 'porte',
+        'map': {
+            '01': 'NÃO INFORMADO',
+            '02': 'MICRO EMPRESA',
+            '03': 'EMPRESA DE PEQUENO PORTE',
+            '05': 'DEMAIS',
+        },
+        'enum': True,
+    },
+    'natureza_juridica': {'column': 'codigo_natureza_juridica', 'lookup': ('naturezas_juridicas', 'natureza_juridica'), 'enum': True},
+    'qualificacao_responsavel': {'column': 'codigo_qualificacao_responsavel', 'lookup': ('qualificacoes_socios', 'descricao'), 'enum': True},
+}
+
+
+def processar_empresas(safra, source='unzip', typed_keys=None, batch_files=None, partitions=None, history=None, db_uri=None):
     """
     Processa e carrega os dados relacionados a empresas para o banco de dados DuckDB.
 
-    Esta função realiza os seguintes passos:
-    1. Carrega os dados brutos de arquivos CSV para uma tabela temporária no DuckDB.
-    2. Aplica transformações nos dados, como:
+    Esta função carrega os dados brutos e aplica as transformações de `DICT_TRANSFORMS` em uma única passada
+    (ver `compile_select`), como:
         - Preencher o `cnpj_basico` para garantir que tenha 8 caracteres.
         - Adicionar descrições à coluna `porte` com base em códigos predefinidos.
         - Adicionar descrições às colunas `natureza_juridica` e `qualificacao_responsavel` unindo com outras tabelas de referência.
-    3. Registra o progresso e o tempo de execução de cada etapa.
+    Ao final, registra o tempo de execução e o número de linhas.
 
     Parâmetros:
     ----------
@@ -30,88 +61,54 @@ def processar_empresas(safra):
         O identificador do lote ou período de dados a ser processado. A função procurará os arquivos CSV
         na pasta correspondente ao safra informado.
 
+    source : str, opcional, padrão='unzip'
+        `'unzip'` para ler os CSVs descompactados por `unzip_safra` ou `'zip'` para ler diretamente dos arquivos .zip,
+        sem descompactá-los em disco (ver `load_zip_to_duckdb`).
+
+    typed_keys : bool, opcional
+        Se `True`, `cnpj_basico` é gravado como INTEGER, a tabela é ordenada por `ORDER_BY` e a view `<tabela>_texto`
+        mantém a chave no formato texto com zeros à esquerda. Se não for fornecido, usa `TYPED_KEYS` das configurações.
+
+    batch_files : int, opcional
+        Com `source='unzip'`, carrega os CSVs em lotes de `batch_files` arquivos, um lote por vez (ver
+        `load_data_in_batches`). Se não for fornecido, usa `LOAD_BATCH_FILES` das configurações (0 carrega todos numa
+        única passada).
+
+    partitions : list, opcional
+        Se fornecida, (re)carrega apenas os arquivos .zip da lista, substituindo as suas linhas na tabela, que guarda o
+        arquivo de origem de cada linha na coluna `arquivo_origem` (ver `load_partitions_to_duckdb` e
+        `processar_incremental`).
+
+    history : bool, opcional
+        Se `True`, a safra carregada também é arquivada em `<tabela>_historico` (ver `arquivar_safra`), mantendo as
+        safras anteriores. Se não for fornecido, usa `HISTORY` das configurações.
+
+    db_uri : str, opcional
+        O banco de dados DuckDB de destino. Se não for fornecido, usa `DB_URI` das configurações (ver `build_parallel`,
+        que carrega cada tabela num arquivo próprio).
+
     Exemplo:
     --------
     processar_empresas('2024-10')
     """
     start = time.time()
+    typed_keys = TYPED_KEYS if typed_keys is None else typed_keys
+    batch_files = LOAD_BATCH_FILES if batch_files is None else batch_files
+    history = HISTORY if history is None else history
+    db_uri = db_uri or DB_URI
     table_name = TABLE_NAME_EMPRESAS
 
-    _log.info(f'{table_name=} | carregando para o DuckDB')
-    dict_column_types = {
-        'cnpj_basico': 'VARCHAR',
-        'razao_social': 'VARCHAR',
-        'codigo_natureza_juridica': 'VARCHAR',
-        'codigo_qualificacao_responsavel': 'VARCHAR',
-        'capital_social': 'DOUBLE',
-        'porte': 'VARCHAR',
-        'ente_federativo_responsavel': 'VARCHAR',
-    }
-    path = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_UNZIP, '*.EMPRECSV')
-    load_data_to_duckdb(db_uri=DB_URI, path=path, dict_column_types=dict_column_types, table_name=table_name, safra=safra)
-    _log.info(f'{table_name=} | TRANSFORMAÇÃO')
-
-    with connect_db(db_uri=DB_URI) as db:
-        _log.info(f'{table_name=} | ajustando cnpj_basico para 8 caracteres')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET cnpj_basico = LPAD(cnpj_basico, 8, '0');
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando porte')
-        dict_situation_desc = {
-            '01': 'NÃO INFORMADO',
-            '02': 'MICRO EMPRESA',
-            '03': 'EMPRESA DE PEQUENO PORTE',
-            '05': 'DEMAIS',
-        }
-        case_statement = '\n'.join(f"WHEN '{key}' THEN '{value}'" for key, value in dict_situation_desc.items())
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                ALTER TABLE {table_name} DROP COLUMN IF EXISTS porte_desc;
-                ALTER TABLE {table_name} ADD COLUMN porte_desc VARCHAR;
-                UPDATE {table_name}
-                SET porte_desc = CASE porte
-                    {case_statement}
-                    ELSE null
-                END;
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando descrição da natureza_juridica')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                ALTER TABLE {table_name} DROP COLUMN IF EXISTS natureza_juridica;
-                ALTER TABLE {table_name} ADD COLUMN natureza_juridica VARCHAR;
-                UPDATE {table_name}
-                SET natureza_juridica = (
-                    SELECT natureza_juridica
-                    FROM naturezas_juridicas
-                    WHERE naturezas_juridicas.codigo = {table_name}.codigo_natureza_juridica
-                    );
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando descrição da qualificacao_responsavel')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                ALTER TABLE {table_name} DROP COLUMN IF EXISTS qualificacao_responsavel;
-                ALTER TABLE {table_name} ADD COLUMN qualificacao_responsavel VARCHAR;
-                UPDATE {table_name}
-                SET qualificacao_responsavel = (
-                    SELECT descricao
-                    FROM qualificacoes_socios
-                    WHERE qualificacoes_socios.codigo = {table_name}.codigo_qualificacao_responsavel
-                    );
-                """,
-        )
+    with memory_monitor(db_uri, table_name):
+        _log.info(f'{table_name=} | carregando e transformando para o DuckDB')
+        load_safra_to_duckdb(db_uri=db_uri, safra=safra, pattern_unzip='*.EMPRECSV', pattern_zip='Empresas*.zip', dict_column_types=DICT_COLUMN_TYPES, table_name=table_name, source=source, dict_transforms=DICT_TRANSFORMS, typed_keys=typed_keys, order_by=ORDER_BY if typed_keys else None, batch_files=batch_files, partitions=partitions)
+
+        apply_data_enums(db_uri=db_uri, table_name=table_name, dict_transforms=DICT_TRANSFORMS)
+        if typed_keys:
+            create_text_view(db_uri=db_uri, table_name=table_name, dict_transforms=DICT_TRANSFORMS)
+        if history:
+            arquivar_safra(db_uri=db_uri, table_name=table_name, safra=safra)
 
+    with connect_db(db_uri=db_uri) as db:
         end = time.time()
         row_count = db.sql(f'SELECT COUNT(*) FROM  {table_name}').fetchone()[0]
         db.sql(f'select * from {table_name}').show()
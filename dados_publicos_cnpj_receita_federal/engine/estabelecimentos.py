@@ -1,29 +1,98 @@
-import os
 import time
 
 from dados_publicos_cnpj_receita_federal import SetupLogger
 from dados_publicos_cnpj_receita_federal.database import connect_db
-from dados_publicos_cnpj_receita_federal.engine._core import load_data_to_duckdb
+from dados_publicos_cnpj_receita_federal.database import memory_monitor
+from dados_publicos_cnpj_receita_federal.engine._core import apply_data_enums
+from dados_publicos_cnpj_receita_federal.engine._core import create_text_view
+from dados_publicos_cnpj_receita_federal.engine._core import load_safra_to_duckdb
+from dados_publicos_cnpj_receita_federal.engine.historico import arquivar_safra
 from dados_publicos_cnpj_receita_federal.settings import DB_URI
-from dados_publicos_cnpj_receita_federal.settings import FOLDER_UNZIP
-from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
+from dados_publicos_cnpj_receita_federal.settings import HISTORY
+from dados_publicos_cnpj_receita_federal.settings import LOAD_BATCH_FILES
 from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_ESTABELECIMENTOS
+from dados_publicos_cnpj_receita_federal.settings import TYPED_KEYS
 
 _log = SetupLogger('engine.estabelecimentos')
 
+ORDER_BY = 'cnpj_basico'
+
+DICT_COLUMN_TYPES = {
+    'cnpj_basico': 'VARCHAR',
+    'cnpj_ordem': 'VARCHAR',
+    'cnpj_dv': 'VARCHAR',
+    'matriz_filial': 'VARCHAR',
+    'nome_fantasia': 'VARCHAR',
+    'situacao_cadastral': 'VARCHAR',
+    'data_situacao_cadastral': 'VARCHAR',
+    'situacao_cadastral_motivo_codigo': 'VARCHAR',
+    'nome_na_cidade_no_exterior': 'VARCHAR',
+    'pais': 'VARCHAR',
+    'data_inicio_atividade': 'VARCHAR',
+    'cnae_principal': 'VARCHAR',
+    'cnae_secundarios': 'VARCHAR',
+    'tipo_de_logradouro': 'VARCHAR',
+    'logradouro': 'VARCHAR',
+    'numero': 'VARCHAR',
+    'complemento': 'VARCHAR',
+    'bairro': 'VARCHAR',
+    'cep': 'VARCHAR',
+    'uf': 'VARCHAR',
+    'municipio_codigo': 'VARCHAR',
+    'tel1_dd': 'VARCHAR',
+    'tel1': 'VARCHAR',
+    'tel2_dd': 'VARCHAR',
+    'tel2': 'VARCHAR',
+    'fax_dd': 'VARCHAR',
+    'fax': 'VARCHAR',
+    'email': 'VARCHAR',
+    'situacao_especial': 'VARCHAR',
+    'data_situacao_especial': 'VARCHAR',
+}
+
+DICT_TRANSFORMS = {
+    'cnpj_basico': {'lpad': 8, 'key': ('INTEGER', 8)},
+    'cnpj_ordem': {'lpad': 4},
+    'cnpj_dv': {'lpad': 2},
+    'data_situacao_cadastral': {'date': 'YYYYMMDD'},
+    'data_inicio_atividade': {'date': 'YYYYMMDD'},
+    'data_situacao_especial': {'date': 'YYYYMMDD'},
+    'matriz_filial': {
+        'map': {
+            '1': 'MATRIZ',
+            '2': 'FILIAL',
+        },
+        'enum': True,
+    },
+    'uf': {'enum': True},
+    'cnpj': {'concat': ['cnpj_basico', 'cnpj_ordem', 'cnpj_dv'], 'key': ('BIGINT', 14)},
+    'situacao_cadastral_descricao': {
+        'column': 'situacao_cadastral',
+        'map': {
+            '01': 'NULA',
+            '02': 'ATIVA',
+            '03': 'SUSPENSA',
+            '04': 'INAPTA',
+            '08': 'BAIXADA',
+        },
+        'enum': True,
+    },
+    'situacao_cadastral_motivo': {'column': 'situacao_cadastral_motivo_codigo', 'lookup': ('motivos', 'motivo'), 'enum': True},
+    'municipio': {'column': 'municipio_codigo', 'lookup': ('municipios', 'municipio')},
+}
+
 
-def processar_estabelecimentos(safra):
+def processar_estabelecimentos(safra, source='unzip', typed_dates=None, typed_keys=None, batch_files=None, partitions=None, history=None, db_uri=None):
     """
     Processa e carrega os dados relacionados a estabelecimentos para o banco de dados DuckDB.
 
-    Esta função realiza os seguintes passos:
-    1. Carrega os dados brutos de arquivos CSV para uma tabela temporária no DuckDB.
-    2. Aplica transformações nos dados, como:
+    Esta função carrega os dados brutos e aplica as transformações de `DICT_TRANSFORMS` em uma única passada
+    (ver `compile_select`), como:
         - Preencher as colunas `cnpj_basico`, `cnpj_ordem` e `cnpj_dv` para garantir os comprimentos corretos.
         - Criar uma coluna consolidada `cnpj` combinando `cnpj_basico`, `cnpj_ordem` e `cnpj_dv`.
         - Reformatar as colunas de data (`data_situacao_cadastral`, `data_inicio_atividade`, `data_situacao_especial`) para o formato `YYYY-MM-DD`.
         - Adicionar descrições nas colunas `matriz_filial`, `situacao_cadastral`, `situacao_cadastral_motivo` e `municipio` unindo com outras tabelas de referência.
-    3. Registra o progresso e o tempo de execução de cada etapa.
+    Ao final, registra o tempo de execução e o número de linhas.
 
     Parâmetros:
     ----------
@@ -31,191 +100,59 @@ def processar_estabelecimentos(safra):
         O identificador do lote ou período de dados a ser processado. A função procurará os arquivos CSV
         na pasta correspondente ao safra informado.
 
+    source : str, opcional, padrão='unzip'
+        `'unzip'` para ler os CSVs descompactados por `unzip_safra` ou `'zip'` para ler diretamente dos arquivos .zip,
+        sem descompactá-los em disco (ver `load_zip_to_duckdb`).
+
+    typed_dates : bool, opcional
+        Se `True`, as colunas de data são gravadas como DATE, com as datas ausentes e inválidas como NULL; o número de
+        valores inválidos por coluna é registrado no log. Se não for fornecido, usa `TYPED_DATES` das configurações.
+
+    typed_keys : bool, opcional
+        Se `True`, `cnpj_basico` é gravado como INTEGER e `cnpj` como BIGINT, a tabela é ordenada por `ORDER_BY` e a view
+        `<tabela>_texto` mantém as chaves no formato texto com zeros à esquerda. Se não for fornecido, usa `TYPED_KEYS`
+        das configurações.
+
+    batch_files : int, opcional
+        Com `source='unzip'`, carrega os CSVs em lotes de `batch_files` arquivos, um lote por vez (ver
+        `load_data_in_batches`). Se não for fornecido, usa `LOAD_BATCH_FILES` das configurações (0 carrega todos numa
+        única passada).
+
+    partitions : list, opcional
+        Se fornecida, (re)carrega apenas os arquivos .zip da lista, substituindo as suas linhas na tabela, que guarda o
+        arquivo de origem de cada linha na coluna `arquivo_origem` (ver `load_partitions_to_duckdb` e
+        `processar_incremental`).
+
+    history : bool, opcional
+        Se `True`, a safra carregada também é arquivada em `<tabela>_historico` (ver `arquivar_safra`), mantendo as
+        safras anteriores. Se não for fornecido, usa `HISTORY` das configurações.
+
+    db_uri : str, opcional
+        O banco de dados DuckDB de destino. Se não for fornecido, usa `DB_URI` das configurações (ver `build_parallel`,
+        que carrega cada tabela num arquivo próprio).
+
     Exemplo:
     --------
     processar_estabelecimentos('2024-10')
     """
     start = time.time()
+    typed_keys = TYPED_KEYS if typed_keys is None else typed_keys
+    batch_files = LOAD_BATCH_FILES if batch_files is None else batch_files
+    history = HISTORY if history is None else history
+    db_uri = db_uri or DB_URI
     table_name = TABLE_NAME_ESTABELECIMENTOS
 
-    _log.info(f'{table_name=} | carregando para o DuckDB')
-    dict_column_types = {
-        'cnpj_basico': 'VARCHAR',
-        'cnpj_ordem': 'VARCHAR',
-        'cnpj_dv': 'VARCHAR',
-        'matriz_filial': 'VARCHAR',
-        'nome_fantasia': 'VARCHAR',
-        'situacao_cadastral': 'VARCHAR',
-        'data_situacao_cadastral': 'VARCHAR',
-        'situacao_cadastral_motivo_codigo': 'VARCHAR',
-        'nome_na_cidade_no_exterior': 'VARCHAR',
-        'pais': 'VARCHAR',
-        'data_inicio_atividade': 'VARCHAR',
-        'cnae_principal': 'VARCHAR',
-        'cnae_secundarios': 'VARCHAR',
-        'tipo_de_logradouro': 'VARCHAR',
-        'logradouro': 'VARCHAR',
-        'numero': 'VARCHAR',
-        'complemento': 'VARCHAR',
-        'bairro': 'VARCHAR',
-        'cep': 'VARCHAR',
-        'uf': 'VARCHAR',
-        'municipio_codigo': 'VARCHAR',
-        'tel1_dd': 'VARCHAR',
-        'tel1': 'VARCHAR',
-        'tel2_dd': 'VARCHAR',
-        'tel2': 'VARCHAR',
-        'fax_dd': 'VARCHAR',
-        'fax': 'VARCHAR',
-        'email': 'VARCHAR',
-        'situacao_especial': 'VARCHAR',
-        'data_situacao_especial': 'VARCHAR',
-    }
-    path = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_UNZIP, '*.ESTABELE')
-    load_data_to_duckdb(db_uri=DB_URI, path=path, dict_column_types=dict_column_types, table_name=table_name, safra=safra)
-    _log.info(f'{table_name=} | TRANSFORMAÇÃO')
-
-    with connect_db(db_uri=DB_URI) as db:
-        _log.info(f'{table_name=} | ajustando cnpj_basico para 8 caracteres')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET cnpj_basico = LPAD(cnpj_basico, 8, '0');
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando cnpj_ordem para 4 caracteres')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET cnpj_ordem = LPAD(cnpj_ordem, 4, '0');
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando cnpj_dv para 2 caracteres')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET cnpj_dv = LPAD(cnpj_dv, 4, '0');
-                """,
-        )
-
-        _log.info(f'{table_name=} | criando coluna cnpj')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                ALTER TABLE {table_name} DROP COLUMN IF EXISTS cnpj;
-                ALTER TABLE {table_name} ADD COLUMN cnpj VARCHAR;
-                UPDATE {table_name}
-                SET cnpj = cnpj_basico || cnpj_ordem || cnpj_dv
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando data_situacao_cadastral')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET data_situacao_cadastral = SUBSTR(data_situacao_cadastral, 1, 4) || '-' ||
-                                              SUBSTR(data_situacao_cadastral, 5, 2) || '-' ||
-                                              SUBSTR(data_situacao_cadastral, 7, 2);
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando data_inicio_atividade')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET data_inicio_atividade = SUBSTR(data_inicio_atividade, 1, 4) || '-' ||
-                                            SUBSTR(data_inicio_atividade, 5, 2) || '-' ||
-                                            SUBSTR(data_inicio_atividade, 7, 2);
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando data_situacao_especial')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET data_situacao_especial = SUBSTR(data_situacao_especial, 1, 4) || '-' ||
-                                             SUBSTR(data_situacao_especial, 5, 2) || '-' ||
-                                             SUBSTR(data_situacao_especial, 7, 2);
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando descrição de matriz_filial')
-        dict_situacao_cadastral_descricao = {
-            '1': 'MATRIZ',
-            '2': 'FILIAL',
-        }
-        case_statement = '\n'.join(f"WHEN '{key}' THEN '{value}'" for key, value in dict_situacao_cadastral_descricao.items())
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET matriz_filial = CASE matriz_filial
-                    {case_statement}
-                    ELSE null
-                END;
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando descrição da situacao_cadastral')
-        dict_situacao_cadastral_descricao = {
-            '01': 'NULA',
-            '02': 'ATIVA',
-            '03': 'SUSPENSA',
-            '04': 'INAPTA',
-            '08': 'BAIXADA',
-        }
-        case_statement = '\n'.join(f"WHEN '{key}' THEN '{value}'" for key, value in dict_situacao_cadastral_descricao.items())
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                ALTER TABLE {table_name} DROP COLUMN IF EXISTS situacao_cadastral_descricao;
-                ALTER TABLE {table_name} ADD COLUMN situacao_cadastral_descricao VARCHAR;
-                UPDATE {table_name}
-                SET situacao_cadastral_descricao = CASE situacao_cadastral
-                    {case_statement}
-                    ELSE null
-                END;
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando descrição do situacao_cadastral_motivo')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                ALTER TABLE {table_name} DROP COLUMN IF EXISTS situacao_cadastral_motivo;
-                ALTER TABLE {table_name} ADD COLUMN situacao_cadastral_motivo VARCHAR;
-                UPDATE {table_name}
-                SET situacao_cadastral_motivo = (
-                    SELECT motivo
-                    FROM motivos
-                    WHERE motivos.codigo = {table_name}.situacao_cadastral_motivo_codigo
-                    );
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando descrição do municipio')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                ALTER TABLE {table_name} DROP COLUMN IF EXISTS municipio;
-                ALTER TABLE {table_name} ADD COLUMN municipio VARCHAR;
-                UPDATE {table_name}
-                SET municipio = (
-                    SELECT municipio
-                    FROM municipios
-                    WHERE municipios.codigo = {table_name}.municipio_codigo
-                    );
-                """,
-        )
+    with memory_monitor(db_uri, table_name):
+        _log.info(f'{table_name=} | carregando e transformando para o DuckDB')
+        load_safra_to_duckdb(db_uri=db_uri, safra=safra, pattern_unzip='*.ESTABELE', pattern_zip='Estabelecimentos*.zip', dict_column_types=DICT_COLUMN_TYPES, table_name=table_name, source=source, dict_transforms=DICT_TRANSFORMS, typed_dates=typed_dates, typed_keys=typed_keys, order_by=ORDER_BY if typed_keys else None, batch_files=batch_files, partitions=partitions)
+
+        apply_data_enums(db_uri=db_uri, table_name=table_name, dict_transforms=DICT_TRANSFORMS)
+        if typed_keys:
+            create_text_view(db_uri=db_uri, table_name=table_name, dict_transforms=DICT_TRANSFORMS)
+        if history:
+            arquivar_safra(db_uri=db_uri, table_name=table_name, safra=safra)
 
+    with connect_db(db_uri=db_uri) as db:
         end = time.time()
         row_count = db.sql(f'SELECT COUNT(*) FROM  {table_name}').fetchone()[0]
         db.sql(f'select * from {table_name}').show()
@@ -0,0 +1,184 @@
+import time
+
+from dados_publicos_cnpj_receita_federal import SetupLogger
+from dados_publicos_cnpj_receita_federal.database import connect_db
+from dados_publicos_cnpj_receita_federal.engine._core import PARTITION_COLUMN
+from dados_publicos_cnpj_receita_federal.settings import DB_URI
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_EMPRESAS
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_ESTABELECIMENTOS
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_REGIME_TRIBUTARIO
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_SIMPLES
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_SOCIOS
+
+_log = SetupLogger('engine.historico')
+
+SUFFIX_HISTORICO = '_historico'
+SUFFIX_DIFF = '_diff'
+
+# chave (CNPJ) de cada tabela usada por `diff_safras`; em `socios` e `regime_tributario` há várias linhas por chave
+DICT_HISTORY_KEYS = {
+    TABLE_NAME_EMPRESAS: 'cnpj_basico',
+    TABLE_NAME_ESTABELECIMENTOS: 'cnpj',
+    TABLE_NAME_REGIME_TRIBUTARIO: 'cnpj',
+    TABLE_NAME_SIMPLES: 'cnpj_basico',
+    TABLE_NAME_SOCIOS: 'cnpj_basico',
+}
+
+
+def arquivar_safra(db_uri, table_name, safra):
+    """
+    Copia a safra recém-carregada de `table_name` para o histórico `<table_name>_historico`, substituindo a mesma safra,
+    se ela já tiver sido arquivada.
+
+    O histórico guarda todas as safras carregadas, uma após a outra, de modo que as estatísticas de mínimo/máximo de cada
+    bloco da coluna `safra` funcionam como partições: os filtros por safra (`as_of`, `diff_safras`) descartam os blocos
+    das demais safras. Cada linha recebe `hash_linha`, o hash do seu conteúdo (todas as colunas, exceto `safra`),
+    calculado uma única vez na carga e usado por `diff_safras` no lugar da comparação das linhas completas. As colunas
+    ENUM são gravadas como VARCHAR, pois os tipos ENUM mudam de uma safra para outra. A coluna `PARTITION_COLUMN`, que
+    só existe nas tabelas carregadas por `processar_incremental`, não é arquivada: o histórico tem as mesmas colunas
+    numa carga completa e numa carga incremental.
+
+    Parâmetros:
+    ----------
+    db_uri : str
+        O URI para conectar ao banco de dados DuckDB.
+
+    table_name : str
+        O nome da tabela com a safra recém-carregada.
+
+    safra : str
+        O identificador do lote ou período de dados carregado.
+
+    Exemplo:
+    --------
+    arquivar_safra(db_uri=DB_URI, table_name='empresas', safra='2024-10')
+    """
+    start = time.time()
+    table_historico = f'{table_name}{SUFFIX_HISTORICO}'
+    with connect_db(db_uri=db_uri) as db:
+        list_columns = db.execute(
+            'SELECT column_name, data_type FROM duckdb_columns() WHERE table_name = ? AND database_name = current_database() AND schema_name = current_schema() ORDER BY column_index',
+            [table_name],
+        ).fetchall()
+        dict_values = {name: f'CAST({name} AS VARCHAR)' if data_type.startswith('ENUM') else name for name, data_type in list_columns if name != PARTITION_COLUMN}
+        columns = ', '.join(f'{value} AS {name}' for name, value in dict_values.items())
+        hash_values = ', '.join(value for name, value in dict_values.items() if name != 'safra')
+        select = f'SELECT {columns}, hash({hash_values}) AS hash_linha FROM {table_name}'
+
+        db.execute(f'CREATE TABLE IF NOT EXISTS {table_historico} AS {select} WITH NO DATA')
+        db.execute(f'DELETE FROM {table_historico} WHERE safra = ?', [safra])
+        db.execute(f'INSERT INTO {table_historico} BY NAME {select}')
+        row_count = db.execute(f'SELECT COUNT(*) FROM {table_historico} WHERE safra = ?', [safra]).fetchone()[0]
+    _log.info(f'arquivar_safra | {table_historico} | {safra=} | {row_count:_} linhas em {time.time() - start:.1f} segundos')
+
+
+def diff_safras(safra_anterior, safra, tables=None, db_uri=None):
+    """
+    Compara duas safras do histórico e grava, para cada tabela, os CNPJs inseridos, removidos e alterados em
+    `<tabela>_diff`.
+
+    A comparação não lê as linhas completas: cada safra é resumida por chave (ver `DICT_HISTORY_KEYS`) no número de
+    linhas e na soma dos `hash_linha` (ver `arquivar_safra`), e os dois resumos são unidos por um hash join pela chave.
+    Uma chave só em `safra` é `'inserido'`, só em `safra_anterior` é `'removido'` e, nas duas com um resumo diferente,
+    `'alterado'`. Assim, o resultado tem apenas o delta entre as safras, uma pequena fração das linhas.
+
+    Parâmetros:
+    ----------
+    safra_anterior : str
+        A safra de referência (ex: `'2024-09'`).
+
+    safra : str
+        A safra comparada (ex: `'2024-10'`).
+
+    tables : list, opcional
+        As tabelas a comparar. Se não for fornecida, todas as tabelas com histórico são comparadas.
+
+    db_uri : str, opcional
+        O banco de dados DuckDB. Se não for fornecido, usa `DB_URI` das configurações.
+
+    Retorna:
+    -------
+    dict
+        `{tabela: {'inserido': int, 'removido': int, 'alterado': int}}`.
+
+    Exemplo:
+    --------
+    diff_safras('2024-09', '2024-10')
+    # {'empresas': {'inserido': 310_225, 'removido': 0, 'alterado': 95_482}, ...}
+    """
+    db_uri = db_uri or DB_URI
+    dict_diff = {}
+    with connect_db(db_uri=db_uri) as db:
+        for table_name in _history_tables(db, tables):
+            start = time.time()
+            key = DICT_HISTORY_KEYS[table_name]
+            resumo = f'SELECT {key}, COUNT(*) AS linhas, SUM(hash_linha::HUGEINT) AS hash_chave FROM {table_name}{SUFFIX_HISTORICO} WHERE safra = ? AND {key} IS NOT NULL GROUP BY {key}'
+            db.execute(
+                f"""
+                    CREATE OR REPLACE TABLE {table_name}{SUFFIX_DIFF} AS
+                    WITH anterior AS ({resumo}), atual AS ({resumo})
+                    SELECT
+                        COALESCE(atual.{key}, anterior.{key}) AS {key},
+                        CASE WHEN anterior.{key} IS NULL THEN 'inserido' WHEN atual.{key} IS NULL THEN 'removido' ELSE 'alterado' END AS alteracao,
+                        ? AS safra_anterior,
+                        ? AS safra
+                    FROM anterior
+                    FULL OUTER JOIN atual ON anterior.{key} = atual.{key}
+                    WHERE anterior.{key} IS NULL OR atual.{key} IS NULL OR anterior.linhas <> atual.linhas OR anterior.hash_chave <> atual.hash_chave
+                """,
+                [safra_anterior, safra, safra_anterior, safra],
+            )
+            rows = db.execute(f'SELECT alteracao, COUNT(*) FROM {table_name}{SUFFIX_DIFF} GROUP BY 1').fetchall()
+            dict_diff[table_name] = {'inserido': 0, 'removido': 0, 'alterado': 0, **dict(rows)}
+            _log.info(f'diff_safras | {table_name} | {safra_anterior} -> {safra} | {dict_diff[table_name]} em {time.time() - start:.1f} segundos')
+    return dict_diff
+
+
+def as_of(safra, tables=None, db_uri=None):
+    """
+    Cria as views `safra_<AAAA_MM>.<tabela>` com o estado de cada tabela do histórico na safra informada.
+
+    O estado de uma tabela numa safra é a última safra arquivada até ela (inclusive), já que cada safra é uma cópia
+    completa dos dados; assim, uma tabela publicada com atraso (como `regime_tributario`) usa a sua safra anterior.
+    As views filtram o histórico pela safra, o que descarta os blocos das demais safras.
+
+    Parâmetros:
+    ----------
+    safra : str
+        A safra desejada (ex: `'2024-10'`).
+
+    tables : list, opcional
+        As tabelas. Se não for fornecida, todas as tabelas com histórico são consideradas.
+
+    db_uri : str, opcional
+        O banco de dados DuckDB. Se não for fornecido, usa `DB_URI` das configurações.
+
+    Retorna:
+    -------
+    dict
+        `{tabela: safra usada}`; tabelas sem nenhuma safra até `safra` são omitidas.
+
+    Exemplo:
+    --------
+    as_of('2024-10')
+    # SELECT * FROM safra_2024_10.empresas
+    """
+    db_uri = db_uri or DB_URI
+    schema = f"safra_{safra.replace('-', '_')}"
+    dict_safras = {}
+    with connect_db(db_uri=db_uri) as db:
+        db.execute(f'CREATE SCHEMA IF NOT EXISTS {schema}')
+        for table_name in _history_tables(db, tables):
+            safra_tabela = db.execute(f'SELECT MAX(safra) FROM {table_name}{SUFFIX_HISTORICO} WHERE safra <= ?', [safra]).fetchone()[0]
+            if safra_tabela is None:
+                _log.info(f'as_of | {table_name} | nenhuma safra até {safra}')
+                continue
+            db.execute(f"CREATE OR REPLACE VIEW {schema}.{table_name} AS SELECT * EXCLUDE (hash_linha) FROM main.{table_name}{SUFFIX_HISTORICO} WHERE safra = '{safra_tabela}'")
+            dict_safras[table_name] = safra_tabela
+    _log.info(f'as_of | {schema} | {dict_safras}')
+    return dict_safras
+
+
+def _history_tables(db, tables):
+    set_existing = {row[0] for row in db.execute('SELECT table_name FROM duckdb_tables() WHERE database_name = current_database()').fetchall()}
+    return [table_name for table_name in DICT_HISTORY_KEYS if (tables is None or table_name in tables) and f'{table_name}{SUFFIX_HISTORICO}' in set_existing]
@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import sys
+import time
+
+from dados_publicos_cnpj_receita_federal import SetupLogger
+from dados_publicos_cnpj_receita_federal.database import connect_db
+from dados_publicos_cnpj_receita_federal.engine import _core
+from dados_publicos_cnpj_receita_federal.engine import DICT_TABLE_ENGINE
+from dados_publicos_cnpj_receita_federal.engine._core import DICT_MAPPING_TABLES
+from dados_publicos_cnpj_receita_federal.engine._core import match_zip_patterns
+from dados_publicos_cnpj_receita_federal.engine._core import PARTITION_COLUMN
+from dados_publicos_cnpj_receita_federal.io.manifest import file_sha256
+from dados_publicos_cnpj_receita_federal.io.manifest import Manifest
+from dados_publicos_cnpj_receita_federal.settings import DB_URI
+from dados_publicos_cnpj_receita_federal.settings import DICT_TABLE_ZIP_PATTERNS
+from dados_publicos_cnpj_receita_federal.settings import FOLDER_ZIP
+from dados_publicos_cnpj_receita_federal.settings import LIST_REFERENCE_ZIP_PATTERNS
+from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_REFERENCIAS_VERSAO
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_TABELAS_VERSAO
+from dados_publicos_cnpj_receita_federal.settings import TYPED_DATES
+from dados_publicos_cnpj_receita_federal.settings import TYPED_KEYS
+
+_log = SetupLogger('engine.incremental')
+
+
+def processar_incremental(safra, tables=None, source='unzip', db_uri=None):
+    """
+    Reconstrói apenas as tabelas, e dentro delas apenas os arquivos de origem, que mudaram desde o último build.
+
+    Ao final de cada build, são registrados em `TABLE_NAME_TABELAS_VERSAO` a safra, a versão do engine (ver
+    `engine_version`), as configurações que alteram o resultado e o SHA-256 de cada arquivo .zip usado pela tabela
+    (os seus e os das referências). Numa nova chamada, os SHA-256 atuais (do manifesto da safra ou, para arquivos fora
+    dele, calculados) são comparados com os registrados:
+    - nada mudou: a tabela é pulada;
+    - mudaram apenas arquivos da própria tabela: só esses arquivos (partições, ver `load_partitions_to_duckdb`) são
+      recarregados, e os arquivos que deixaram de existir têm as suas linhas apagadas;
+    - mudou a safra, a versão do engine, as configurações ou uma referência (cujas descrições estão em todas as linhas),
+      ou a tabela não existe ou não tem a coluna de partição: a tabela é reconstruída por inteiro, por partição.
+
+    Parâmetros:
+    ----------
+    safra : str
+        O identificador do lote/período dos dados.
+
+    tables : list, opcional
+        As tabelas a considerar (ex: `['regime_tributario']`). Se não for fornecida, todas são consideradas.
+
+    source : str, opcional, padrão='unzip'
+        De onde ler os arquivos (ver `load_safra_to_duckdb`).
+
+    db_uri : str, opcional
+        O banco de dados DuckDB. Se não for fornecido, usa `DB_URI` das configurações.
+
+    Retorna:
+    -------
+    dict
+        O relatório `{tabela: {'acao': 'pulada' | 'parcial' | 'completa', 'motivo': str, 'arquivos': list}}`, com os
+        arquivos recarregados (ou apagados) em cada tabela.
+
+    Exemplo:
+    --------
+    processar_incremental('2024-10')
+    # {'empresas': {'acao': 'pulada', 'motivo': 'arquivos inalterados', 'arquivos': []},
+    #  'regime_tributario': {'acao': 'parcial', 'motivo': 'arquivos alterados: Lucro Real.zip', 'arquivos': ['Lucro Real.zip']}, ...}
+    """
+    start = time.time()
+    db_uri = db_uri or DB_URI
+    tables = [table for table in DICT_TABLE_ENGINE if tables is None or table in tables]
+    dict_checksums = input_checksums(safra)
+    dict_options = {'typed_dates': TYPED_DATES, 'typed_keys': TYPED_KEYS}
+    dict_builds = table_builds(db_uri)
+
+    dict_report = {}
+    references_reloaded = False
+    for table in tables:
+        dict_files = {filename: sha256 for filename, sha256 in dict_checksums.items() if match_zip_patterns(filename, DICT_TABLE_ZIP_PATTERNS[table])}
+        dict_references = {filename: sha256 for filename, sha256 in dict_checksums.items() if match_zip_patterns(filename, LIST_REFERENCE_ZIP_PATTERNS)}
+        version = engine_version(table)
+        acao, motivo, list_files = _plan(db_uri, table, safra, version, dict_options, dict_files, dict_references, dict_builds.get(table))
+        dict_report[table] = {'acao': acao, 'motivo': motivo, 'arquivos': list_files}
+        _log.info(f"processar_incremental | '{safra=}' | {table} | {acao} | {motivo}")
+        if acao == 'pulada':
+            continue
+        if acao == 'completa' and not list_files:
+            msg = f"processar_incremental | '{safra=}' | nenhum arquivo .zip de {table} na safra"
+            _log.critical(msg)
+            raise Exception(msg)
+
+        start_table = time.time()
+        with connect_db(db_uri=db_uri) as db:
+            db.execute(f'DELETE FROM {TABLE_NAME_TABELAS_VERSAO} WHERE tabela = ?', [table])
+            if acao == 'completa':
+                db.execute(f'DROP TABLE IF EXISTS {table}')
+                if not references_reloaded and dict_builds.get(table) and dict_builds[table]['referencias'] != dict_references:
+                    # as referências da mesma safra só são recarregadas por `process_mapping` se não estiverem registradas
+                    references_reloaded = True
+                    db.execute(f'DELETE FROM {TABLE_NAME_REFERENCIAS_VERSAO} WHERE tabela IN ({", ".join("?" for _ in DICT_MAPPING_TABLES)})', list(DICT_MAPPING_TABLES))
+        DICT_TABLE_ENGINE[table](safra=safra, source=source, partitions=list_files, db_uri=db_uri)
+
+        with connect_db(db_uri=db_uri) as db:
+            db.execute(
+                f'INSERT OR REPLACE INTO {TABLE_NAME_TABELAS_VERSAO} VALUES (?, ?, ?, ?, ?, ?, current_timestamp)',
+                [table, safra, version, json.dumps(dict_options, sort_keys=True), json.dumps(dict_files, sort_keys=True), json.dumps(dict_references, sort_keys=True)],
+            )
+        dict_builds[table] = {'safra': safra, 'engine': version, 'opcoes': dict_options, 'arquivos': dict_files, 'referencias': dict_references}
+        _log.info(f"processar_incremental | '{safra=}' | {table} | {acao} em {time.time() - start_table:.1f} segundos")
+
+    dict_count = {acao: sum(report['acao'] == acao for report in dict_report.values()) for acao in ['pulada', 'parcial', 'completa']}
+    _log.info(f"processar_incremental | '{safra=}' | {dict_count} em {time.time() - start:.1f} segundos")
+    return dict_report
+
+
+def _plan(db_uri, table, safra, version, dict_options, dict_files, dict_references, build):
+    """
+    Decide a ação de `processar_incremental` para uma tabela: `(acao, motivo, arquivos a carregar)`.
+    """
+    list_all = sorted(dict_files)
+    if build is None:
+        return 'completa', 'sem build anterior registrado', list_all
+
+    with connect_db(db_uri=db_uri) as db:
+        list_columns = [row[0] for row in db.execute('SELECT column_name FROM duckdb_columns() WHERE table_name = ? AND database_name = current_database() AND schema_name = current_schema()', [table]).fetchall()]
+    if not list_columns:
+        return 'completa', 'tabela ausente no banco', list_all
+    if build['safra'] != safra:
+        return 'completa', f"safra anterior {build['safra']}", list_all
+    if build['engine'] != version:
+        return 'completa', 'versão do engine alterada', list_all
+    if build['opcoes'] != dict_options:
+        return 'completa', f"configurações alteradas: {', '.join(name for name in dict_options if build['opcoes'].get(name) != dict_options[name])}", list_all
+    list_references = sorted(filename for filename in set(build['referencias']) | set(dict_references) if build['referencias'].get(filename) != dict_references.get(filename))
+    if list_references:
+        return 'completa', f"referências alteradas: {', '.join(list_references)}", list_all
+    if PARTITION_COLUMN not in list_columns:
+        return 'completa', f'tabela sem a coluna {PARTITION_COLUMN}', list_all
+
+    list_changed = sorted(filename for filename, sha256 in dict_files.items() if build['arquivos'].get(filename) != sha256)
+    list_removed = sorted(set(build['arquivos']) - set(dict_files))
+    if not list_changed and not list_removed:
+        return 'pulada', 'arquivos inalterados', []
+
+    list_motivos = []
+    if list_changed:
+        list_motivos.append(f"arquivos alterados: {', '.join(list_changed)}")
+    if list_removed:
+        list_motivos.append(f"arquivos removidos: {', '.join(list_removed)}")
+    return 'parcial', ' | '.join(list_motivos), list_changed + list_removed
+
+
+def table_builds(db_uri):
+    """
+    Retorna o último build registrado de cada tabela por `processar_incremental`.
+
+    Cria `TABLE_NAME_TABELAS_VERSAO` se ainda não existir.
+
+    Parâmetros:
+    ----------
+    db_uri : str
+        O URI para conectar ao banco de dados DuckDB.
+
+    Retorna:
+    -------
+    dict
+        `{tabela: {'safra': str, 'engine': str, 'opcoes': dict, 'arquivos': {arquivo: sha256}, 'referencias': {arquivo: sha256}}}`.
+    """
+    with connect_db(db_uri=db_uri) as db:
+        db.execute(f'CREATE TABLE IF NOT EXISTS {TABLE_NAME_TABELAS_VERSAO} (tabela VARCHAR PRIMARY KEY, safra VARCHAR, engine VARCHAR, opcoes VARCHAR, arquivos VARCHAR, referencias VARCHAR, concluido_em TIMESTAMP)')
+        rows = db.execute(f'SELECT tabela, safra, engine, opcoes, arquivos, referencias FROM {TABLE_NAME_TABELAS_VERSAO}').fetchall()
+    return {tabela: {'safra': safra, 'engine': engine, 'opcoes': json.loads(opcoes), 'arquivos': json.loads(arquivos), 'referencias': json.loads(referencias)} for tabela, safra, engine, opcoes, arquivos, referencias in rows}
+
+
+def input_checksums(safra):
+    """
+    Retorna o SHA-256 de cada arquivo .zip da safra: o registrado no manifesto (ver `Manifest`) ou, para arquivos
+    presentes na pasta `zip` e ausentes do manifesto, o calculado a partir do arquivo.
+
+    Parâmetros:
+    ----------
+    safra : str
+        O identificador do lote/período dos dados.
+
+    Retorna:
+    -------
+    dict
+        `{arquivo: sha256}`.
+    """
+    dict_checksums = Manifest(safra).checksums()
+    folder_zip = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_ZIP)
+    if os.path.isdir(folder_zip):
+        for filename in sorted(os.listdir(folder_zip)):
+            if filename.endswith('.zip') and filename not in dict_checksums:
+                dict_checksums[filename] = file_sha256(os.path.join(folder_zip, filename))
+    return dict_checksums
+
+
+def engine_version(table):
+    """
+    Retorna a versão da especificação do engine de uma tabela: o SHA-256 do código do seu módulo e de `engine._core`.
+
+    Qualquer alteração nas colunas, transformações ou na forma de carga muda a versão e invalida a tabela.
+    """
+    hasher = hashlib.sha256()
+    for module in [sys.modules[DICT_TABLE_ENGINE[table].__module__], _core]:
+        with open(module.__file__, 'rb') as f:
+            hasher.update(f.read())
+    return hasher.hexdigest()[:16]
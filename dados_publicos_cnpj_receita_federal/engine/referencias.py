@@ -0,0 +1,91 @@
+from dados_publicos_cnpj_receita_federal import SetupLogger
+from dados_publicos_cnpj_receita_federal.database import connect_db
+from dados_publicos_cnpj_receita_federal.engine._core import DICT_MAPPING_TABLES
+from dados_publicos_cnpj_receita_federal.engine._core import process_mapping
+from dados_publicos_cnpj_receita_federal.engine._core import reference_versions
+from dados_publicos_cnpj_receita_federal.settings import DB_URI
+
+_log = SetupLogger('engine.referencias')
+
+# colunas (código, descrição) de cada tabela de referência
+DICT_REFERENCE_COLUMNS = {
+    **{mapping_table_name: tuple(list_columns_names) for mapping_table_name, (_, _, list_columns_names) in DICT_MAPPING_TABLES.items()},
+    'cnaes': ('id', 'descricao'),
+}
+
+# (db_uri, tabela) -> (versão, {código: descrição}); a versão é `(safra, carregado_em)` de `reference_versions`
+_DICT_CACHE = {}
+
+
+def carregar_referencias(safra, source='unzip'):
+    """
+    Retorna as tabelas de referência da safra como dicionários `{código: descrição}`, para enriquecimento no Python.
+
+    As tabelas são carregadas no banco por `process_mapping` (uma vez por safra) e lidas numa única conexão. Os
+    dicionários ficam em cache no processo e só são lidos de novo quando a versão da tabela no banco muda (por exemplo,
+    ao carregar outra safra).
+
+    Parâmetros:
+    ----------
+    safra : str
+        O identificador do lote ou período de dados (ex: `'2024-10'`).
+
+    source : str, opcional, padrão='unzip'
+        De onde ler os arquivos, caso as referências ainda não estejam carregadas (ver `process_mapping`).
+
+    Retorna:
+    -------
+    dict
+        `{tabela: {código: descrição}}` para `qualificacoes_socios`, `pais`, `naturezas_juridicas`, `municipios`,
+        `motivos` e `cnaes`.
+
+    Exemplo:
+    --------
+    dict_referencias = carregar_referencias('2024-10')
+    dict_referencias['municipios'][7107]  # 'SAO PAULO'
+    """
+    process_mapping(DB_URI, safra, source=source)
+
+    dict_referencias = {}
+    with connect_db(db_uri=DB_URI) as db:
+        dict_versions = reference_versions(db)
+        for table_name, (code_column, description_column) in DICT_REFERENCE_COLUMNS.items():
+            version = dict_versions.get(table_name)
+            cached = _DICT_CACHE.get((DB_URI, table_name))
+            if cached is None or cached[0] != version:
+                _log.info(f'carregar_referencias | lendo {table_name} | {version=}')
+                rows = db.execute(f'SELECT {code_column}, {description_column} FROM {table_name}').fetchall()
+                cached = (version, dict(rows))
+                _DICT_CACHE[(DB_URI, table_name)] = cached
+            dict_referencias[table_name] = cached[1]
+    return dict_referencias
+
+
+def referencia_arrow(table_name):
+    """
+    Retorna uma tabela de referência já carregada como uma tabela Arrow (`pyarrow.Table`).
+
+    Requer o pacote `pyarrow`, que não é uma dependência do projeto.
+
+    Parâmetros:
+    ----------
+    table_name : str
+        O nome da tabela de referência (uma das chaves de `DICT_REFERENCE_COLUMNS`).
+
+    Retorna:
+    -------
+    pyarrow.Table
+        A tabela com as colunas de código e descrição.
+
+    Exemplo:
+    --------
+    municipios = referencia_arrow('municipios')
+    """
+    if table_name not in DICT_REFERENCE_COLUMNS:
+        msg = f'referencia_arrow | tabela de referência desconhecida: {table_name}'
+        _log.critical(msg)
+        raise Exception(msg)
+
+    code_column, description_column = DICT_REFERENCE_COLUMNS[table_name]
+    with connect_db(db_uri=DB_URI) as db:
+        return db.sql(f'SELECT {code_column}, {description_column} FROM {table_name} ORDER BY 1').arrow()
@@ -1,30 +1,56 @@
-import os
 import time
 
 from dados_publicos_cnpj_receita_federal import SetupLogger
 from dados_publicos_cnpj_receita_federal.database import connect_db
-from dados_publicos_cnpj_receita_federal.engine._core import load_data_to_duckdb
+from dados_publicos_cnpj_receita_federal.database import memory_monitor
+from dados_publicos_cnpj_receita_federal.engine._core import apply_data_enums
+from dados_publicos_cnpj_receita_federal.engine._core import create_text_view
+from dados_publicos_cnpj_receita_federal.engine._core import load_safra_to_duckdb
+from dados_publicos_cnpj_receita_federal.engine.historico import arquivar_safra
 from dados_publicos_cnpj_receita_federal.settings import DB_URI
-from dados_publicos_cnpj_receita_federal.settings import FOLDER_UNZIP
-from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
+from dados_publicos_cnpj_receita_federal.settings import HISTORY
 from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_REGIME_TRIBUTARIO
+from dados_publicos_cnpj_receita_federal.settings import TYPED_KEYS
 
 _log = SetupLogger('engine.regime_tributario')
 
+ORDER_BY = 'cnpj'
 
-def processar_regime_tributario(safra):
+DICT_COLUMN_TYPES = {
+    'ano': 'VARCHAR',
+    'cnpj': 'VARCHAR',
+    'cnpj_da_scp': 'VARCHAR',
+    'forma_de_tributacao': 'VARCHAR',
+    'quantidade_de_escrituracoes': 'INTEGER',
+}
+
+DICT_TRANSFORMS = {
+    'cnpj': {'remove': ['.', '/', '-'], 'key': ('BIGINT', 14)},
+    'forma_de_tributacao': {'enum': True},
+}
+
+# (padrão dos CSVs descompactados, padrão dos .zip, separador, cabeçalho), na ordem em que são carregados
+LIST_SOURCES = [
+    ('Lucro Presumido*', 'Lucro*Presumido*.zip', ';', 'false'),
+    ('Lucro Arbitrado*', 'Lucro*Arbitrado*.zip', ',', 'true'),
+    ('Lucro Real*', 'Lucro*Real*.zip', ',', 'true'),
+    ('Imunes*', 'Imunes*.zip', ';', 'false'),
+]
+
+
+def processar_regime_tributario(safra, source='unzip', typed_keys=None, partitions=None, history=None, db_uri=None):
     """
     Processa e carrega os dados do regime tributário para o banco de dados DuckDB.
 
     Esta função realiza os seguintes passos:
-    1. Carrega os dados de vários arquivos CSV (representando diferentes regimes tributários) em tabelas temporárias separadas:
+    1. Carrega os dados de vários arquivos CSV (representando diferentes regimes tributários), na ordem de `LIST_SOURCES`,
+       em uma única tabela `regime_tributario`: o primeiro cria a tabela e os demais são inseridos nela.
         - Lucro Presumido
         - Lucro Arbitrado
         - Lucro Real
         - Imunes
-    2. Combina os dados dessas tabelas individuais em uma única tabela `regime_tributario` usando uma consulta `UNION ALL`.
-    3. Limpa os dados removendo a pontuação (pontos, barras e hífens) da coluna `cnpj`.
-    4. Registra o progresso e o tempo de execução de cada etapa.
+    2. Na mesma passada, limpa os dados removendo a pontuação (pontos, barras e hífens) da coluna `cnpj` (`DICT_TRANSFORMS`).
+    3. Registra o tempo de execução e o número de linhas.
 
     Parâmetros:
     ----------
@@ -32,64 +58,49 @@ def processar_regime_tributario(safra):
         O identificador do lote ou período de dados a ser processado. A função procurará os arquivos CSV
         na pasta correspondente ao safra informado.
 
+    source : str, opcional, padrão='unzip'
+        `'unzip'` para ler os CSVs descompactados por `unzip_safra` ou `'zip'` para ler diretamente dos arquivos .zip,
+        sem descompactá-los em disco (ver `load_zip_to_duckdb`).
+
+    typed_keys : bool, opcional
+        Se `True`, `cnpj` é gravado como BIGINT, a tabela é ordenada por `ORDER_BY` e a view `<tabela>_texto` mantém a
+        chave no formato texto com zeros à esquerda. Se não for fornecido, usa `TYPED_KEYS` das configurações.
+
+    partitions : list, opcional
+        Se fornecida, (re)carrega apenas os arquivos .zip da lista, substituindo as suas linhas na tabela, que guarda o
+        arquivo de origem de cada linha na coluna `arquivo_origem` (ver `load_partitions_to_duckdb` e
+        `processar_incremental`).
+
+    history : bool, opcional
+        Se `True`, a safra carregada também é arquivada em `<tabela>_historico` (ver `arquivar_safra`), mantendo as
+        safras anteriores. Se não for fornecido, usa `HISTORY` das configurações.
+
+    db_uri : str, opcional
+        O banco de dados DuckDB de destino. Se não for fornecido, usa `DB_URI` das configurações (ver `build_parallel`,
+        que carrega cada tabela num arquivo próprio).
+
     Exemplo:
     --------
     processar_regime_tributario('2024-10')
     """
     start = time.time()
+    typed_keys = TYPED_KEYS if typed_keys is None else typed_keys
+    history = HISTORY if history is None else history
+    db_uri = db_uri or DB_URI
     table_name = TABLE_NAME_REGIME_TRIBUTARIO
 
-    _log.info(f'{table_name=} | carregando para o DuckDB')
-    dict_column_types = {
-        'ano': 'VARCHAR',
-        'cnpj': 'VARCHAR',
-        'cnpj_da_scp': 'VARCHAR',
-        'forma_de_tributacao': 'VARCHAR',
-        'quantidade_de_escrituracoes': 'INTEGER',
-    }
-    path_lucro_presumido = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_UNZIP, 'Lucro Presumido*')
-    load_data_to_duckdb(db_uri=DB_URI, path=path_lucro_presumido, dict_column_types=dict_column_types, table_name=table_name + '_lucro_presumido', safra=safra)
-
-    path_lucro_arbitrado = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_UNZIP, 'Lucro Arbitrado*')
-    load_data_to_duckdb(db_uri=DB_URI, path=path_lucro_arbitrado, dict_column_types=dict_column_types, table_name=table_name + '_lucro_arbitrado', safra=safra, sep=',', header='true')
-
-    path_lucro_real = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_UNZIP, 'Lucro Real*')
-    load_data_to_duckdb(db_uri=DB_URI, path=path_lucro_real, dict_column_types=dict_column_types, table_name=table_name + '_lucro_real', safra=safra, sep=',', header='true')
-
-    path_imune = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_UNZIP, 'Imunes*')
-    load_data_to_duckdb(db_uri=DB_URI, path=path_imune, dict_column_types=dict_column_types, table_name=table_name + '_imune', safra=safra)
-
-    _log.info(f'{table_name=} | TRANSFORMAÇÃO')
-
-    with connect_db(db_uri=DB_URI) as db:
-        _log.info(f'{table_name=} | unindo todas as tabelas de regimes')
-        db.execute(
-            f"""
-            SET progress_bar_time = 1;
-            DROP TABLE IF EXISTS {table_name};
-            CREATE TABLE {table_name} AS
-            SELECT * FROM regime_tributario_lucro_presumido
-            UNION ALL
-            SELECT * FROM regime_tributario_lucro_arbitrado
-            UNION ALL
-            SELECT * FROM regime_tributario_lucro_real
-            UNION ALL
-            SELECT * FROM regime_tributario_imune;
-            DROP TABLE regime_tributario_lucro_presumido;
-            DROP TABLE regime_tributario_imune;
-            DROP TABLE regime_tributario_lucro_arbitrado;
-            DROP TABLE regime_tributario_lucro_real;
-            """,
-        )
-        _log.info(f'{table_name=} | limpando cnpj')
-        db.execute(
-            f"""
-                    SET progress_bar_time = 1;
-                    UPDATE {table_name}
-                    SET cnpj = REPLACE(REPLACE(REPLACE(cnpj, '.', ''), '/', ''), '-', '');
-                    """,
-        )
+    with memory_monitor(db_uri, table_name):
+        _log.info(f'{table_name=} | carregando e transformando para o DuckDB')
+        for i, (pattern_unzip, pattern_zip, sep, header) in enumerate(LIST_SOURCES):
+            load_safra_to_duckdb(db_uri=db_uri, safra=safra, pattern_unzip=pattern_unzip, pattern_zip=pattern_zip, dict_column_types=DICT_COLUMN_TYPES, table_name=table_name, source=source, sep=sep, header=header, dict_transforms=DICT_TRANSFORMS, append=i > 0, typed_keys=typed_keys, order_by=ORDER_BY if typed_keys and i == len(LIST_SOURCES) - 1 else None, partitions=partitions)
+
+        apply_data_enums(db_uri=db_uri, table_name=table_name, dict_transforms=DICT_TRANSFORMS)
+        if typed_keys:
+            create_text_view(db_uri=db_uri, table_name=table_name, dict_transforms=DICT_TRANSFORMS)
+        if history:
+            arquivar_safra(db_uri=db_uri, table_name=table_name, safra=safra)
 
+    with connect_db(db_uri=db_uri) as db:
         end = time.time()
         row_count = db.sql(f'SELECT COUNT(*) FROM  {table_name}').fetchone()[0]
         db.sql(f'select * from {table_name}').show()
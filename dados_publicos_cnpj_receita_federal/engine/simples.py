@@ -1,28 +1,57 @@
-import os
 import time
 
 from dados_publicos_cnpj_receita_federal import SetupLogger
 from dados_publicos_cnpj_receita_federal.database import connect_db
-from dados_publicos_cnpj_receita_federal.engine._core import load_data_to_duckdb
+from dados_publicos_cnpj_receita_federal.database import memory_monitor
+from dados_publicos_cnpj_receita_federal.engine._core import apply_data_enums
+from dados_publicos_cnpj_receita_federal.engine._core import create_text_view
+from dados_publicos_cnpj_receita_federal.engine._core import load_safra_to_duckdb
+from dados_publicos_cnpj_receita_federal.engine.historico import arquivar_safra
 from dados_publicos_cnpj_receita_federal.settings import DB_URI
-from dados_publicos_cnpj_receita_federal.settings import FOLDER_UNZIP
-from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
+from dados_publicos_cnpj_receita_federal.settings import HISTORY
 from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_SIMPLES
+from dados_publicos_cnpj_receita_federal.settings import TYPED_KEYS
 
 _log = SetupLogger('engine.simples')
 
+ORDER_BY = 'cnpj_basico'
 
-def processar_simples(safra):
+DICT_COLUMN_TYPES = {
+    'cnpj_basico': 'VARCHAR',
+    'opcao_pelo_simples': 'VARCHAR',
+    'data_opcao_pelo_simples': 'VARCHAR',
+    'data_exclusao_opcao_pelo_simples': 'VARCHAR',
+    'opcao_pelo_mei': 'VARCHAR',
+    'data_opcao_pelo_mei': 'VARCHAR',
+    'data_exclusao_opcao_pelo_mei': 'VARCHAR',
+}
+
+DICT_OPCAO = {
+    'S': 'SIM',
+    'N': 'NÃO',
+}
+
+DICT_TRANSFORMS = {
+    'cnpj_basico': {'lpad': 8, 'key': ('INTEGER', 8)},
+    'opcao_pelo_simples': {'map': DICT_OPCAO, 'default': 'OUTROS', 'enum': True},
+    'data_opcao_pelo_simples': {'date': 'YYYYMMDD', 'null_if': '00000000'},
+    'data_exclusao_opcao_pelo_simples': {'date': 'YYYYMMDD', 'null_if': '00000000'},
+    'opcao_pelo_mei': {'map': DICT_OPCAO, 'default': 'OUTROS', 'enum': True},
+    'data_opcao_pelo_mei': {'date': 'YYYYMMDD', 'null_if': '00000000'},
+    'data_exclusao_opcao_pelo_mei': {'date': 'YYYYMMDD', 'null_if': '00000000'},
+}
+
+
+def processar_simples(safra, source='unzip', typed_dates=None, typed_keys=None, partitions=None, history=None, db_uri=None):
     """
     Processa e carrega os dados relacionados ao regime tributário 'Simples Nacional' para o banco de dados DuckDB.
 
-    Esta função realiza os seguintes passos:
-    1. Carrega os dados do arquivo CSV contendo informações sobre as empresas optantes pelo regime 'Simples Nacional'.
-    2. Transforma os dados, incluindo:
+    Esta função carrega os dados do arquivo CSV contendo informações sobre as empresas optantes pelo regime
+    'Simples Nacional' e aplica as transformações de `DICT_TRANSFORMS` em uma única passada (ver `compile_select`):
         - Preenchimento da coluna 'cnpj_basico' para 8 caracteres.
         - Padronização das colunas 'opcao_pelo_simples' e 'opcao_pelo_mei' para os valores 'SIM', 'NÃO' ou 'OUTROS'.
         - Formatação das colunas 'data_opcao_pelo_simples', 'data_exclusao_opcao_pelo_simples', 'data_opcao_pelo_mei' e 'data_exclusao_opcao_pelo_mei' para o formato de data padrão 'YYYY-MM-DD', ou configurando-as como NULL quando aplicável.
-    3. Registra o progresso e o tempo de execução de cada etapa.
+    Ao final, registra o tempo de execução e o número de linhas.
 
     Parâmetros:
     ----------
@@ -30,122 +59,52 @@ def processar_simples(safra):
         O identificador do lote ou período de dados a ser processado. A função procurará os arquivos CSV
         na pasta correspondente ao safra informado.
 
+    source : str, opcional, padrão='unzip'
+        `'unzip'` para ler os CSVs descompactados por `unzip_safra` ou `'zip'` para ler diretamente dos arquivos .zip,
+        sem descompactá-los em disco (ver `load_zip_to_duckdb`).
+
+    typed_dates : bool, opcional
+        Se `True`, as colunas de data são gravadas como DATE, com as datas ausentes e inválidas como NULL; o número de
+        valores inválidos por coluna é registrado no log. Se não for fornecido, usa `TYPED_DATES` das configurações.
+
+    typed_keys : bool, opcional
+        Se `True`, `cnpj_basico` é gravado como INTEGER, a tabela é ordenada por `ORDER_BY` e a view `<tabela>_texto`
+        mantém a chave no formato texto com zeros à esquerda. Se não for fornecido, usa `TYPED_KEYS` das configurações.
+
+    partitions : list, opcional
+        Se fornecida, (re)carrega apenas os arquivos .zip da lista, substituindo as suas linhas na tabela, que guarda o
+        arquivo de origem de cada linha na coluna `arquivo_origem` (ver `load_partitions_to_duckdb` e
+        `processar_incremental`).
+
+    history : bool, opcional
+        Se `True`, a safra carregada também é arquivada em `<tabela>_historico` (ver `arquivar_safra`), mantendo as
+        safras anteriores. Se não for fornecido, usa `HISTORY` das configurações.
+
+    db_uri : str, opcional
+        O banco de dados DuckDB de destino. Se não for fornecido, usa `DB_URI` das configurações (ver `build_parallel`,
+        que carrega cada tabela num arquivo próprio).
+
     Exemplo:
     --------
     processar_simples('2024-10')
     """
     start = time.time()
+    typed_keys = TYPED_KEYS if typed_keys is None else typed_keys
+    history = HISTORY if history is None else history
+    db_uri = db_uri or DB_URI
     table_name = TABLE_NAME_SIMPLES
 
-    _log.info(f'{table_name=} | carregando para o DuckDB')
-    dict_column_types = {
-        'cnpj_basico': 'VARCHAR',
-        'opcao_pelo_simples': 'VARCHAR',
-        'data_opcao_pelo_simples': 'VARCHAR',
-        'data_exclusao_opcao_pelo_simples': 'VARCHAR',
-        'opcao_pelo_mei': 'VARCHAR',
-        'data_opcao_pelo_mei': 'VARCHAR',
-        'data_exclusao_opcao_pelo_mei': 'VARCHAR',
-    }
-    path = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_UNZIP, '*SIMPLES.CSV*')
-    load_data_to_duckdb(db_uri=DB_URI, path=path, dict_column_types=dict_column_types, table_name=table_name, safra=safra)
-    _log.info(f'{table_name=} | TRANSFORMAÇÃO')
-
-    with connect_db(db_uri=DB_URI) as db:
-        _log.info(f'{table_name=} | definindo cnpj_basico com 8 caracteres')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET cnpj_basico = LPAD(cnpj_basico, 8, '0');
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando opcao_pelo_simples')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET opcao_pelo_simples =
-                    CASE opcao_pelo_simples
-                        WHEN 'S' THEN 'SIM'
-                        WHEN 'N' THEN 'NÃO'
-                        ELSE 'OUTROS'
-                    END;
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando data_opcao_pelo_simples')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET data_opcao_pelo_simples = CASE
-                    WHEN data_opcao_pelo_simples = '00000000' THEN NULL
-                    WHEN data_opcao_pelo_simples != '00000000' THEN SUBSTR(data_opcao_pelo_simples, 1, 4) || '-' ||
-                                                                    SUBSTR(data_opcao_pelo_simples, 5, 2) || '-' ||
-                                                                    SUBSTR(data_opcao_pelo_simples, 7, 2)
-                    ELSE data_opcao_pelo_simples
-                END
-                """,
-        )
-        _log.info(f'{table_name=} | ajustando data_exclusao_opcao_pelo_simples')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET data_exclusao_opcao_pelo_simples = CASE
-                    WHEN data_exclusao_opcao_pelo_simples = '00000000' THEN NULL
-                    WHEN data_exclusao_opcao_pelo_simples != '00000000' THEN SUBSTR(data_exclusao_opcao_pelo_simples, 1, 4) || '-' ||
-                                                                             SUBSTR(data_exclusao_opcao_pelo_simples, 5, 2) || '-' ||
-                                                                             SUBSTR(data_exclusao_opcao_pelo_simples, 7, 2)
-                    ELSE data_exclusao_opcao_pelo_simples
-                END
-                """,
-        )
-
-        _log.info(f'{table_name=} | ajustando opcao_pelo_mei')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET opcao_pelo_mei =
-                    CASE opcao_pelo_mei
-                        WHEN 'S' THEN 'SIM'
-                        WHEN 'N' THEN 'NÃO'
-                        ELSE 'OUTROS'
-                    END;
-                """,
-        )
-        _log.info(f'{table_name=} | ajustando data_opcao_pelo_mei')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET data_opcao_pelo_mei = CASE
-                    WHEN data_opcao_pelo_mei = '00000000' THEN NULL
-                    WHEN data_opcao_pelo_mei != '00000000' THEN SUBSTR(data_opcao_pelo_mei, 1, 4) || '-' ||
-                                                                SUBSTR(data_opcao_pelo_mei, 5, 2) || '-' ||
-                                                                SUBSTR(data_opcao_pelo_mei, 7, 2)
-                    ELSE data_opcao_pelo_mei
-                END
-                """,
-        )
-        _log.info(f'{table_name=} | ajustando data_exclusao_opcao_pelo_mei')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET data_exclusao_opcao_pelo_mei = CASE
-                    WHEN data_exclusao_opcao_pelo_mei = '00000000' THEN NULL
-                    WHEN data_exclusao_opcao_pelo_mei != '00000000' THEN SUBSTR(data_exclusao_opcao_pelo_mei, 1, 4) || '-' ||
-                                                                         SUBSTR(data_exclusao_opcao_pelo_mei, 5, 2) || '-' ||
-                                                                         SUBSTR(data_exclusao_opcao_pelo_mei, 7, 2)
-                    ELSE data_exclusao_opcao_pelo_mei
-                END
-                """,
-        )
+    with memory_monitor(db_uri, table_name):
+        _log.info(f'{table_name=} | carregando e transformando para o DuckDB')
+        load_safra_to_duckdb(db_uri=db_uri, safra=safra, pattern_unzip='*SIMPLES.CSV*', pattern_zip='Simples*.zip', dict_column_types=DICT_COLUMN_TYPES, table_name=table_name, source=source, dict_transforms=DICT_TRANSFORMS, typed_dates=typed_dates, typed_keys=typed_keys, order_by=ORDER_BY if typed_keys else None, partitions=partitions)
+
+        apply_data_enums(db_uri=db_uri, table_name=table_name, dict_transforms=DICT_TRANSFORMS)
+        if typed_keys:
+            create_text_view(db_uri=db_uri, table_name=table_name, dict_transforms=DICT_TRANSFORMS)
+        if history:
+            arquivar_safra(db_uri=db_uri, table_name=table_name, safra=safra)
 
+    with connect_db(db_uri=db_uri) as db:
         end = time.time()
         row_count = db.sql(f'SELECT COUNT(*) FROM  {table_name}').fetchone()[0]
         db.sql(f'select * from {table_name}').show()
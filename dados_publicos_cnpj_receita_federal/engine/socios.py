@@ -1,30 +1,82 @@
-import os
 import time
 
 from dados_publicos_cnpj_receita_federal import SetupLogger
 from dados_publicos_cnpj_receita_federal.database import connect_db
-from dados_publicos_cnpj_receita_federal.engine._core import load_data_to_duckdb
+from dados_publicos_cnpj_receita_federal.database import memory_monitor
+from dados_publicos_cnpj_receita_federal.engine._core import apply_data_enums
+from dados_publicos_cnpj_receita_federal.engine._core import create_text_view
+from dados_publicos_cnpj_receita_federal.engine._core import load_safra_to_duckdb
+from dados_publicos_cnpj_receita_federal.engine.historico import arquivar_safra
 from dados_publicos_cnpj_receita_federal.settings import DB_URI
-from dados_publicos_cnpj_receita_federal.settings import FOLDER_UNZIP
-from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
+from dados_publicos_cnpj_receita_federal.settings import HISTORY
+from dados_publicos_cnpj_receita_federal.settings import LOAD_BATCH_FILES
 from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_SOCIOS
+from dados_publicos_cnpj_receita_federal.settings import TYPED_KEYS
 
 _log = SetupLogger('engine.socios')
 
+ORDER_BY = 'cnpj_basico'
 
-def processar_socios(safra):
+DICT_COLUMN_TYPES = {
+    'cnpj_basico': 'VARCHAR',
+    'identificador_socio': 'VARCHAR',
+    'nome_razao_social_socio': 'VARCHAR',
+    'documento_socio': 'VARCHAR',
+    'qualificacao_socio_codigo': 'VARCHAR',
+    'data_entrada_sociedade': 'VARCHAR',
+    'pais': 'VARCHAR',
+    'documento_representante_legal': 'VARCHAR',
+    'representante_legal': 'VARCHAR',
+    'qualificacao_representante_legal_codigo': 'VARCHAR',
+    'faixa_etaria_socio_codigo': 'VARCHAR',
+}
+
+DICT_TRANSFORMS = {
+    'cnpj_basico': {'lpad': 8, 'key': ('INTEGER', 8)},
+    'identificador_socio': {
+        'map': {
+            '1': 'PESSOA JURIDICA',
+            '2': 'PESSOA FISICA',
+            '3': 'ESTRANGEIRO',
+        },
+        'default': 'OUTROS',
+        'enum': True,
+    },
+    'data_entrada_sociedade': {'date': 'YYYYMMDD', 'null_if': '00000000'},
+    'faixa_etaria_socio_codigo': {'lpad': 2},
+    'qualificacao_socio': {'column': 'qualificacao_socio_codigo', 'lookup': ('qualificacoes_socios', 'descricao'), 'enum': True},
+    'qualificacao_representante_legal': {'column': 'qualificacao_representante_legal_codigo', 'lookup': ('qualificacoes_socios', 'descricao'), 'enum': True},
+    'faixa_etaria_socio': {
+        'column': 'faixa_etaria_socio_codigo',
+        'map': {
+            '01': '0 a 12 anos',
+            '02': '13 a 20 anos',
+            '03': '21 a 30 anos',
+            '04': '31 a 40 anos',
+            '05': '41 a 50 anos',
+            '06': '51 a 60 anos',
+            '07': '61 a 70 anos',
+            '08': '71 a 80 anos',
+            '09': 'Maiores de 80 anos',
+            '00': 'Não se aplica',
+        },
+        'enum': True,
+    },
+}
+
+
+def processar_socios(safra, source='unzip', typed_dates=None, typed_keys=None, batch_files=None, partitions=None, history=None, db_uri=None):
     """
     Processa e carrega dados relacionados aos sócios na base de dados DuckDB.
 
-    Esta função realiza os seguintes passos:
-    1. Carrega os dados a partir do arquivo CSV contendo informações sobre os sócios.
-    2. Transforma os dados, incluindo:
+    Esta função carrega os dados a partir do arquivo CSV contendo informações sobre os sócios e aplica as
+    transformações de `DICT_TRANSFORMS` em uma única passada (ver `compile_select`), incluindo:
         - Preenchimento da coluna 'cnpj_basico' para 8 caracteres.
         - Mapeamento da coluna 'identificador_socio' para valores legíveis ('PESSOA JURIDICA', 'PESSOA FISICA', 'ESTRANGEIRO', 'OUTROS').
         - Adição de descrições para 'qualificacao_socio' e 'qualificacao_representante_legal' com base nos códigos, realizando uma junção com a tabela `qualificacoes_socios`.
         - Formatação da coluna 'data_entrada_sociedade' para o formato padrão de data 'YYYY-MM-DD', ou atribuição de NULL quando aplicável.
-        - Mapeamento da coluna 'faixa_etaria_socio_codigo' para faixas etárias legíveis e atualização com os valores correspondentes.
-    3. Registra o progresso e o tempo de execução de cada etapa.
+        - Mapeamento da coluna 'faixa_etaria_socio_codigo' para faixas etárias legíveis.
+    Ao final, registra o tempo de execução e o número de linhas.
 
     Parâmetros:
     ----------
@@ -32,129 +84,58 @@ def processar_socios(safra):
         O identificador do lote ou período de dados a ser processado. A função procurará arquivos CSV na
         pasta correspondente ao identificador da safra fornecida.
 
+    source : str, opcional, padrão='unzip'
+        `'unzip'` para ler os CSVs descompactados por `unzip_safra` ou `'zip'` para ler diretamente dos arquivos .zip,
+        sem descompactá-los em disco (ver `load_zip_to_duckdb`).
+
+    typed_dates : bool, opcional
+        Se `True`, as colunas de data são gravadas como DATE, com as datas ausentes e inválidas como NULL; o número de
+        valores inválidos por coluna é registrado no log. Se não for fornecido, usa `TYPED_DATES` das configurações.
+
+    typed_keys : bool, opcional
+        Se `True`, `cnpj_basico` é gravado como INTEGER, a tabela é ordenada por `ORDER_BY` e a view `<tabela>_texto`
+        mantém a chave no formato texto com zeros à esquerda. Se não for fornecido, usa `TYPED_KEYS` das configurações.
+
+    batch_files : int, opcional
+        Com `source='unzip'`, carrega os CSVs em lotes de `batch_files` arquivos, um lote por vez (ver
+        `load_data_in_batches`). Se não for fornecido, usa `LOAD_BATCH_FILES` das configurações (0 carrega todos numa
+        única passada).
+
+    partitions : list, opcional
+        Se fornecida, (re)carrega apenas os arquivos .zip da lista, substituindo as suas linhas na tabela, que guarda o
+        arquivo de origem de cada linha na coluna `arquivo_origem` (ver `load_partitions_to_duckdb` e
+        `processar_incremental`).
+
+    history : bool, opcional
+        Se `True`, a safra carregada também é arquivada em `<tabela>_historico` (ver `arquivar_safra`), mantendo as
+        safras anteriores. Se não for fornecido, usa `HISTORY` das configurações.
+
+    db_uri : str, opcional
+        O banco de dados DuckDB de destino. Se não for fornecido, usa `DB_URI` das configurações (ver `build_parallel`,
+        que carrega cada tabela num arquivo próprio).
+
     Exemplo:
     --------
     processar_socios('2024-10')
     """
-
     start = time.time()
+    typed_keys = TYPED_KEYS if typed_keys is None else typed_keys
+    batch_files = LOAD_BATCH_FILES if batch_files is None else batch_files
+    history = HISTORY if history is None else history
+    db_uri = db_uri or DB_URI
     table_name = TABLE_NAME_SOCIOS
 
-    _log.info(f'{table_name=} | carregando para o DuckDB')
-    dict_column_types = {
-        'cnpj_basico': 'VARCHAR',
-        'identificador_socio': 'VARCHAR',
-        'nome_razao_social_socio': 'VARCHAR',
-        'documento_socio': 'VARCHAR',
-        'qualificacao_socio_codigo': 'VARCHAR',
-        'data_entrada_sociedade': 'VARCHAR',
-        'pais': 'VARCHAR',
-        'documento_representante_legal': 'VARCHAR',
-        'representante_legal': 'VARCHAR',
-        'qualificacao_representante_legal_codigo': 'VARCHAR',
-        'faixa_etaria_socio_codigo': 'VARCHAR',
-    }
-    path = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_UNZIP, '*.SOCIOCSV')
-    load_data_to_duckdb(db_uri=DB_URI, path=path, dict_column_types=dict_column_types, table_name=table_name, safra=safra)
-    _log.info(f'{table_name=} | TRANSFORMAÇÃO')
-
-    with connect_db(db_uri=DB_URI) as db:
-        _log.info(f'{table_name=} | definindo cnpj_basico com 8 caracteres')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET cnpj_basico = LPAD(cnpj_basico, 8, '0');
-                """,
-        )
-        _log.info(f'{table_name=} | definindo identificador_socio')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET identificador_socio =
-                    CASE identificador_socio
-                        WHEN '1' THEN 'PESSOA JURIDICA'
-                        WHEN '2' THEN 'PESSOA FISICA'
-                        WHEN '3' THEN 'ESTRANGEIRO'
-                        ELSE 'OUTROS'
-                    END;
-                """,
-        )
-
-        _log.info(f'{table_name=} | definindo qualificacao_socio')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                ALTER TABLE {table_name} DROP COLUMN IF EXISTS qualificacao_socio;
-                ALTER TABLE {table_name} ADD COLUMN qualificacao_socio VARCHAR;
-                UPDATE {table_name}
-                SET qualificacao_socio = (
-                    SELECT descricao
-                    FROM qualificacoes_socios
-                    WHERE qualificacoes_socios.codigo = {table_name}.qualificacao_socio_codigo
-                    );
-                """,
-        )
-
-        _log.info(f'{table_name=} | definindo data_entrada_sociedade')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                UPDATE {table_name}
-                SET data_entrada_sociedade = CASE
-                    WHEN data_entrada_sociedade = '00000000' THEN NULL
-                    WHEN data_entrada_sociedade != '00000000' THEN SUBSTR(data_entrada_sociedade, 1, 4) || '-' ||
-                                                                   SUBSTR(data_entrada_sociedade, 5, 2) || '-' ||
-                                                                   SUBSTR(data_entrada_sociedade, 7, 2)
-                    ELSE data_entrada_sociedade
-                END
-                """,
-        )
-
-        _log.info(f'{table_name=} | definindo qualificacao_representante_legal')
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                ALTER TABLE {table_name} DROP COLUMN IF EXISTS qualificacao_representante_legal;
-                ALTER TABLE {table_name} ADD COLUMN qualificacao_representante_legal VARCHAR;
-                UPDATE {table_name}
-                SET qualificacao_representante_legal = (
-                    SELECT descricao
-                    FROM qualificacoes_socios
-                    WHERE qualificacoes_socios.codigo = {table_name}.qualificacao_representante_legal_codigo
-                    );
-                """,
-        )
-
-        _log.info(f'{table_name=} | definindo faixa_etaria')
-        dict_faixa_etaria_desc = {
-            '01': '0 a 12 anos',
-            '02': '13 a 20 anos',
-            '03': '21 a 30 anos',
-            '04': '31 a 40 anos',
-            '05': '41 a 50 anos',
-            '06': '51 a 60 anos',
-            '07': '61 a 70 anos',
-            '08': '71 a 80 anos',
-            '09': 'Maiores de 80 anos',
-            '00': 'Não se aplica',
-        }
-        case_statement = '\n'.join(f"WHEN '{key}' THEN '{value}'" for key, value in dict_faixa_etaria_desc.items())
-        db.sql(
-            f"""
-                SET progress_bar_time = 1;
-                ALTER TABLE {table_name} DROP COLUMN IF EXISTS faixa_etaria_socio;
-                ALTER TABLE {table_name} ADD COLUMN faixa_etaria_socio VARCHAR;
-                UPDATE {table_name} SET faixa_etaria_socio_codigo = LPAD(faixa_etaria_socio_codigo, 2, '0');
-                UPDATE {table_name}
-                SET faixa_etaria_socio = CASE faixa_etaria_socio_codigo
-                    {case_statement}
-                    ELSE null
-                END;
-                """,
-        )
+    with memory_monitor(db_uri, table_name):
+        _log.info(f'{table_name=} | carregando e transformando para o DuckDB')
+        load_safra_to_duckdb(db_uri=db_uri, safra=safra, pattern_unzip='*.SOCIOCSV', pattern_zip='Socios*.zip', dict_column_types=DICT_COLUMN_TYPES, table_name=table_name, source=source, dict_transforms=DICT_TRANSFORMS, typed_dates=typed_dates, typed_keys=typed_keys, order_by=ORDER_BY if typed_keys else None, batch_files=batch_files, partitions=partitions)
+
+        apply_data_enums(db_uri=db_uri, table_name=table_name, dict_transforms=DICT_TRANSFORMS)
+        if typed_keys:
+            create_text_view(db_uri=db_uri, table_name=table_name, dict_transforms=DICT_TRANSFORMS)
+        if history:
+            arquivar_safra(db_uri=db_uri, table_name=table_name, safra=safra)
 
+    with connect_db(db_uri=db_uri) as db:
         end = time.time()
         row_count = db.sql(f'SELECT COUNT(*) FROM  {table_name}').fetchone()[0]
         db.sql(f'select * from {table_name}').show()
@@ -1,4 +1,5 @@
 from dados_publicos_cnpj_receita_federal.io.clean_up import clean
+from dados_publicos_cnpj_receita_federal.io.cnaes import atualizar_cnaes
 from dados_publicos_cnpj_receita_federal.io.downloader import download_safra
 from dados_publicos_cnpj_receita_federal.io.unzip import unzip_safra
 from dados_publicos_cnpj_receita_federal.io.unload import unload_safra
@@ -0,0 +1,139 @@
+import datetime
+import json
+import os
+
+from dados_publicos_cnpj_receita_federal import SetupLogger
+from dados_publicos_cnpj_receita_federal.io.requests_config import create_custom_session
+from dados_publicos_cnpj_receita_federal.settings import FILE_CNAES_CACHE
+from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
+
+_log = SetupLogger('io.cnaes')
+
+URL_CNAE_SUBCLASSES = 'https://servicodados.ibge.gov.br/api/v2/cnae/subclasses'
+# snapshot distribuído com o pacote (apenas seções e divisões); usado quando não há um cache local gerado por
+# `atualizar_cnaes`
+FILE_CNAES_SNAPSHOT = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'cnaes.json')
+# níveis da hierarquia da CNAE, do mais geral ao mais específico, e a chave do nível pai no JSON do IBGE
+LIST_CNAE_LEVELS = [
+    ('subclasse', 'classe'),
+    ('classe', 'grupo'),
+    ('grupo', 'divisao'),
+    ('divisao', 'secao'),
+    ('secao', None),
+]
+
+
+def ler_cnaes():
+    """
+    Lê o snapshot da hierarquia da CNAE, sem acessar a rede.
+
+    Usa o cache local gerado por `atualizar_cnaes` (`<PATH_FOLDER_RAW>/cnaes.json`), se existir, ou o snapshot
+    distribuído com o pacote (`FILE_CNAES_SNAPSHOT`).
+
+    Retorna:
+    -------
+    dict
+        `{'versao': str, 'fonte': str, 'itens': [[nivel, codigo, descricao, codigo_pai], ...]}`.
+
+    Exemplo:
+    --------
+    snapshot = ler_cnaes()
+    snapshot['versao']
+    """
+    path_cache = os.path.join(PATH_FOLDER_RAW, FILE_CNAES_CACHE)
+    file_path = path_cache if os.path.exists(path_cache) else FILE_CNAES_SNAPSHOT
+    with open(file_path, encoding='utf-8') as f:
+        snapshot = json.load(f)
+    _log.info(f'ler_cnaes | {file_path=} | versao={snapshot["versao"]}')
+    return snapshot
+
+
+def atualizar_cnaes(file_path=None):
+    """
+    Baixa a hierarquia completa da CNAE (seção, divisão, grupo, classe e subclasse) da API do IBGE e grava o cache local.
+
+    É o único ponto que acessa a rede para a CNAE; o carregamento do banco (`process_mapping`) apenas lê o snapshot
+    (ver `ler_cnaes`) e recarrega as tabelas da CNAE quando a versão do snapshot muda. O arquivo é gravado num
+    temporário e renomeado ao final, para que uma falha não deixe um cache incompleto.
+
+    Parâmetros:
+    ----------
+    file_path : str, opcional
+        Onde gravar o snapshot. Se não for fornecido, usa o cache local `<PATH_FOLDER_RAW>/cnaes.json`.
+
+    Retorna:
+    -------
+    dict
+        O snapshot gravado (ver `ler_cnaes`).
+
+    Exemplo:
+    --------
+    atualizar_cnaes()
+    # ou, pela linha de comando:
+    # python -m dados_publicos_cnpj_receita_federal.io.cnaes
+    """
+    file_path = file_path or os.path.join(PATH_FOLDER_RAW, FILE_CNAES_CACHE)
+    _log.info(f'atualizar_cnaes | baixando {URL_CNAE_SUBCLASSES}')
+    response = create_custom_session().get(URL_CNAE_SUBCLASSES, timeout=60)
+    response.raise_for_status()
+
+    snapshot = {
+        'versao': f'ibge-{datetime.date.today().isoformat()}',
+        'fonte': URL_CNAE_SUBCLASSES,
+        'itens': normalizar_subclasses(response.json()),
+    }
+    write_snapshot(file_path, snapshot)
+    _log.info(f'atualizar_cnaes | {file_path=} | versao={snapshot["versao"]} | itens={len(snapshot["itens"])}')
+    return snapshot
+
+
+def normalizar_subclasses(list_subclasses):
+    """
+    Converte a resposta de `URL_CNAE_SUBCLASSES` (subclasses com a hierarquia aninhada) em uma lista de nós únicos.
+
+    Parâmetros:
+    ----------
+    list_subclasses : list
+        As subclasses como retornadas pela API do IBGE, em que cada nível contém o nível pai
+        (`subclasse -> classe -> grupo -> divisao -> secao`).
+
+    Retorna:
+    -------
+    list
+        `[[nivel, codigo, descricao, codigo_pai], ...]`, ordenada pelo nível (da seção à subclasse) e pelo código.
+    """
+    dict_nodes = {}
+    for node in list_subclasses:
+        for level, parent_level in LIST_CNAE_LEVELS:
+            parent = node.get(parent_level) if parent_level else None
+            dict_nodes[(level, node['id'])] = [level, node['id'], node['descricao'], parent['id'] if parent else None]
+            if not parent:
+                break
+            node = parent
+
+    list_order = [level for level, _ in reversed(LIST_CNAE_LEVELS)]
+    return sorted(dict_nodes.values(), key=lambda item: (list_order.index(item[0]), item[1]))
+
+
+def write_snapshot(file_path, snapshot):
+    """
+    Grava um snapshot da CNAE (ver `ler_cnaes`) de forma atômica, no formato do hook `pretty-format-json` do
+    pre-commit (indentação de 2 espaços e chaves ordenadas).
+
+    Parâmetros:
+    ----------
+    file_path : str
+        O caminho do arquivo JSON.
+
+    snapshot : dict
+        O snapshot a gravar.
+    """
+    file_temp = file_path + '.tmp'
+    with open(file_temp, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(file_temp, file_path)
+
+
+if __name__ == '__main__':
+    atualizar_cnaes()
@@ -1,18 +1,31 @@
+import hashlib
 import os
+import re
+import threading
+import time
+from concurrent.futures import as_completed
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from bs4 import BeautifulSoup
 from tqdm import tqdm
 
 from dados_publicos_cnpj_receita_federal import SetupLogger
+from dados_publicos_cnpj_receita_federal.io.listing_cache import fetch_listing
+from dados_publicos_cnpj_receita_federal.io.manifest import file_sha256
+from dados_publicos_cnpj_receita_federal.io.manifest import Manifest
 from dados_publicos_cnpj_receita_federal.io.requests_config import create_custom_session
 from dados_publicos_cnpj_receita_federal.settings import FOLDER_ZIP
 from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
 
 _log = SetupLogger('io.downloader')
 
+CHUNK_SIZE = 1024 * 1024
+WRITE_BUFFER_SIZE = 8 * 1024 * 1024
+SUFFIX_PARTIAL = '.part'
+SEGMENT_MIN_SIZE = 64 * 1024 * 1024
 
-def download_safra(safra):
+
+def download_safra(safra, max_workers=1, segments=1, revalidate=False):
     """
     Baixa os arquivos de dados para uma "safra" (lote/período) específica do portal de dados abertos da Receita Federal.
 
@@ -20,8 +33,13 @@ def download_safra(safra):
     1. Os dados principais do CNPJ para a safra especificada.
     2. Os dados do regime tributário, também associados à safra.
 
-    Ela cria as pastas locais necessárias para armazenar os arquivos .zip baixados e os baixa em série,
-    garantindo que apenas os arquivos ausentes sejam baixados.
+    Ela cria as pastas locais necessárias para armazenar os arquivos .zip baixados e os baixa em série (padrão) ou
+    de forma concorrente, garantindo que apenas os arquivos ausentes sejam baixados. Todas as requisições reutilizam
+    uma única sessão HTTP com pool de conexões, evitando um novo handshake TCP/TLS a cada arquivo.
+
+    Cada arquivo baixado é registrado no manifesto da safra (ver `Manifest`) com tamanho, `ETag`, `Last-Modified` e
+    SHA-256. Em uma nova execução, os arquivos já registrados e presentes com o tamanho esperado são ignorados sem
+    nenhuma requisição ao servidor (ou, com `revalidate=True`, com uma requisição condicional que retorna `304`).
 
     Parâmetros:
     ----------
@@ -29,6 +47,19 @@ def download_safra(safra):
         O identificador do lote/período dos dados a serem baixados. Ele corresponde ao ano ou período
         de interesse, que é adicionado à URL base para buscar os links dos dados.
 
+    max_workers : int, opcional, padrão=1
+        O número de arquivos baixados simultaneamente. Com `1` os arquivos são baixados em série; valores maiores
+        usam um pool de threads compartilhando a mesma sessão, com uma única barra de progresso combinada (em bytes).
+
+    segments : int, opcional, padrão=1
+        O número de conexões simultâneas usadas para baixar cada arquivo grande (ver `download_file`). Apenas arquivos
+        com pelo menos `SEGMENT_MIN_SIZE` bytes são segmentados, o que na prática atinge os maiores arquivos da safra
+        (`Estabelecimentos0.zip`, `Empresas0.zip`, `Socios0.zip`, ...).
+
+    revalidate : bool, opcional, padrão=False
+        Se `True`, os arquivos presentes no manifesto são revalidados com uma requisição condicional (`If-None-Match` /
+        `If-Modified-Since`). Útil para os arquivos do regime tributário, cuja URL não depende da safra.
+
     Raises:
     ------
     Exceção
@@ -37,46 +68,102 @@ def download_safra(safra):
     Exemplo:
     --------
     download_safra('2024-10')
+    download_safra('2024-10', max_workers=4)
+    download_safra('2024-10', max_workers=4, segments=4)
     """
-    now = datetime.now()
-    url_core = 'https://arquivos.receitafederal.gov.br/cnpj/dados_abertos_cnpj/'
-    url_safra = f'{url_core}/{safra}'
     PATH_FOLDER_RAW_SAFRA = os.path.join(PATH_FOLDER_RAW, safra)
     os.makedirs(PATH_FOLDER_RAW_SAFRA, exist_ok=True)
     PATH_FOLDER_RAW_SAFRA_ZIP = os.path.join(PATH_FOLDER_RAW_SAFRA, FOLDER_ZIP)
     os.makedirs(PATH_FOLDER_RAW_SAFRA_ZIP, exist_ok=True)
 
+    session = create_custom_session(pool_maxsize=max(max_workers * segments, 10))
+    list_links = list_download_links(safra=safra, session=session)
+    manifest = Manifest(safra)
+
+    _log.info(f"download | '{safra=}' | Iniciando o download da safra ({max_workers=})")
+    start = time.time()
+    total_bytes = 0
+    total_skipped = 0
+    if max_workers <= 1:
+        with tqdm(total=len(list_links), desc='Arquivos baixados', leave=False) as bar:
+            for url in sorted(list_links):
+                downloaded = _download_url(url=url, path=PATH_FOLDER_RAW_SAFRA_ZIP, session=session, segments=segments, manifest=manifest, revalidate=revalidate)
+                total_bytes += downloaded or 0
+                total_skipped += downloaded is None
+                bar.update(1)
+    else:
+        with tqdm(total=0, unit='B', unit_scale=True, desc=f'Baixando {len(list_links)} arquivos', leave=False) as bar:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {executor.submit(_download_url, url=url, path=PATH_FOLDER_RAW_SAFRA_ZIP, session=session, bar=bar, segments=segments, manifest=manifest, revalidate=revalidate): url for url in sorted(list_links)}
+                for n_done, future in enumerate(as_completed(futures), start=1):
+                    downloaded = future.result()
+                    total_bytes += downloaded or 0
+                    total_skipped += downloaded is None
+                    bar.set_postfix_str(f'{n_done}/{len(list_links)} arquivos')
+
+    elapsed = time.time() - start
+    _log.info(f"download | '{safra=}' | {len(list_links) - total_skipped} arquivos baixados ({total_bytes / 1024 ** 2:_.1f} MiB) e {total_skipped} ignorados em {elapsed:.1f} segundos ({total_bytes / 1024 ** 2 / max(elapsed, 1e-6):.1f} MiB/s)")
+    _log.info('Download completo')
+
+
+def list_download_links(safra, session=None, ttl=None):
+    """
+    Obtém os links de todos os arquivos .zip de uma safra: os dados principais do CNPJ e os do regime tributário.
+
+    As páginas de listagem são lidas pelo cache de listagens (ver `fetch_listing`), compartilhado com `list_safras`.
+
+    Parâmetros:
+    ----------
+    safra : str
+        O identificador do lote/período dos dados.
+
+    session : requests.Session, opcional
+        A sessão HTTP a ser reutilizada. Se não for fornecida, uma nova sessão será criada.
+
+    ttl : int, opcional
+        A validade do cache de listagens em segundos (ver `fetch_listing`).
+
+    Retorna:
+    -------
+    list
+        A lista ordenada de URLs dos dados principais seguida da lista ordenada de URLs do regime tributário.
+
+    Raises:
+    ------
+    Exceção
+        Se nenhum link de download for encontrado para a safra especificada, uma exceção será levantada.
+    """
+    now = datetime.now()
+    url_core = 'https://arquivos.receitafederal.gov.br/cnpj/dados_abertos_cnpj/'
+    url_safra = f'{url_core}/{safra}'
+    session = session or create_custom_session()
+
     _log.info(f"download | '{safra=}' | Obtendo links para a safra {safra}")
-    session = create_custom_session()
-    response = session.get(url_safra)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    links = soup.find_all('a')
-    list_links_core = sorted([f"{url_safra}/{link.get('href')}" for link in links if link.get('href').endswith('.zip')])
+    links = fetch_listing(url_safra, session=session, ttl=ttl)
+    list_links_core = sorted([f'{url_safra}/{href}' for href in links if href.endswith('.zip')])
 
     url_tax_regime = 'https://arquivos.receitafederal.gov.br/cnpj/regime_tributario'
-    response_tax_regime = session.get(url_tax_regime)
-    soup_tax_regime = BeautifulSoup(response_tax_regime.text, 'html.parser')
-    links_tax_regime = soup_tax_regime.find_all('a')
-    list_links_tax_regime = sorted([f"{url_tax_regime}/{link.get('href')}" for link in links_tax_regime if link.get('href').endswith('.zip')])
-
-    list_links = list_links_core + list_links_tax_regime
+    links_tax_regime = fetch_listing(url_tax_regime, session=session, ttl=ttl)
+    list_links_tax_regime = sorted([f'{url_tax_regime}/{href}' for href in links_tax_regime if href.endswith('.zip')])
 
     if not list_links_core:
         msg = f"download | '{safra=}' | Nenhum link encontrado para {safra=} em '{now:%Y-%m-%d %H:%M:%S}'. Verifique aqui {url_core}"
         _log.info(msg)
         raise Exception(msg)
 
-    _log.info(f"download | '{safra=}' | Iniciando o download da safra")
-    with tqdm(total=len(list_links), desc='Arquivos baixados', leave=False) as bar:
-        for url in sorted(list_links):
-            if need_download(url=url, path=PATH_FOLDER_RAW_SAFRA_ZIP):
-                download_file(url=url, path=PATH_FOLDER_RAW_SAFRA_ZIP)
-            bar.update(1)
+    return list_links_core + list_links_tax_regime
 
-    _log.info('Download completo')
 
+def _download_url(url, path, session, bar=None, segments=1, manifest=None, revalidate=False):
+    """
+    Baixa um único arquivo caso necessário, retornando o número de bytes baixados ou `None` se ele foi ignorado.
+    """
+    if not need_download(url=url, path=path, session=session, manifest=manifest, revalidate=revalidate):
+        return None
+    return download_file(url=url, path=path, session=session, bar=bar, segments=segments, manifest=manifest)
 
-def need_download(url, path):
+
+def need_download(url, path, session=None, manifest=None, revalidate=False):
     """
     Verifica se um arquivo precisa ser baixado com base no seu tamanho e se já existe localmente.
 
@@ -84,6 +171,17 @@ def need_download(url, path):
     tamanho do arquivo local (se existir). Se o arquivo local estiver presente e com o mesmo tamanho do arquivo no servidor,
     retorna `False`, indicando que o arquivo não precisa ser baixado. Caso contrário, retorna `True`, indicando que o arquivo deve ser baixado.
 
+    Se um `manifest` for fornecido e o arquivo local tiver o tamanho registrado nele, nenhuma requisição é feita
+    (ou, com `revalidate=True`, é feita uma requisição condicional com o `ETag`/`Last-Modified` registrados). O arquivo
+    local só é aceito se for o registrado: o instante de modificação (`mtime_ns`) gravado no download é comparado com o
+    atual e, se for diferente (arquivo alterado, copiado ou registrado sem ele), o SHA-256 do arquivo é recalculado e
+    comparado com o do manifesto; um arquivo com o mesmo tamanho mas conteúdo diferente (ex: corrompido) é baixado de
+    novo.
+
+    Arquivos locais com o tamanho do servidor, mas ainda ausentes do manifesto (baixados por uma versão anterior, sem
+    manifesto), são registrados nele na primeira verificação. Para isso o SHA-256 do arquivo é calculado uma única vez,
+    lendo o arquivo inteiro (alguns segundos por GB); as verificações seguintes usam o `mtime_ns` registrado.
+
     Parâmetros:
     ----------
     url : str
@@ -93,6 +191,15 @@ def need_download(url, path):
         O caminho do diretório local onde o arquivo será salvo. A função verifica se o arquivo já existe
         neste local e compara o tamanho com o tamanho do arquivo no servidor.
 
+    session : requests.Session, opcional
+        A sessão HTTP a ser reutilizada. Se não for fornecida, uma nova sessão será criada.
+
+    manifest : Manifest, opcional
+        O manifesto da safra com os arquivos já baixados.
+
+    revalidate : bool, opcional, padrão=False
+        Se `True`, os arquivos registrados no manifesto são revalidados com uma requisição condicional.
+
     Retorna:
     -------
     bool
@@ -104,29 +211,84 @@ def need_download(url, path):
     precisa_download('https://.../arquivo.zip', '/caminho/local')
     """
     filename = os.path.split(url)[1]
-    session = create_custom_session()
+    local_file_path = os.path.join(path, filename)
+    local_file_size = os.path.getsize(local_file_path) if os.path.exists(local_file_path) else None
+    session = session or create_custom_session()
+
+    entry = manifest.get(filename) if manifest else None
+    if entry and entry['size'] == local_file_size:
+        if not _check_local_file(file_path=local_file_path, filename=filename, entry=entry, manifest=manifest):
+            return True
+        if not revalidate:
+            return False
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        response = session.head(url, headers=headers)
+        if response.status_code == 304:
+            return False
+        content_length = int(response.headers.get('Content-Length', 0))
+        return content_length != entry['size'] or response.headers.get('ETag') != entry.get('etag')
+
     response = session.head(url)
     headers = response.headers
-    content_length = int(headers.get('Content-Length'))
-    local_file_path = os.path.join(path, filename)
+    content_length = int(headers.get('Content-Length', 0))
 
     need = True
     if content_length:
-        if os.path.exists(local_file_path):
-            local_file_size = os.path.getsize(local_file_path)
-
+        if local_file_size is not None:
             if content_length == local_file_size:
                 need = False
+
+    if not need and manifest is not None:
+        _log.info(f'download | {filename} | arquivo local ausente do manifesto, calculando o SHA-256 de {local_file_size:_} bytes')
+        mtime_ns = os.stat(local_file_path).st_mtime_ns
+        manifest.record(filename=filename, url=url, size=local_file_size, sha256=file_sha256(local_file_path), etag=headers.get('ETag'), last_modified=headers.get('Last-Modified'), mtime_ns=mtime_ns)
     return need
 
 
-def download_file(url, path):
+def _check_local_file(file_path, filename, entry, manifest):
+    """
+    Confere se o arquivo local é o registrado no manifesto: pelo `mtime_ns` ou, se ele mudou, pelo SHA-256.
+    """
+    mtime_ns = os.stat(file_path).st_mtime_ns
+    if entry.get('mtime_ns') == mtime_ns:
+        return True
+
+    _log.info(f'download | {filename} | arquivo modificado desde o registro no manifesto, conferindo o SHA-256')
+    if file_sha256(file_path) != entry['sha256']:
+        _log.info(f'download | {filename} | SHA-256 diferente do manifesto, baixando de novo')
+        return False
+    manifest.record(filename=filename, url=entry['url'], size=entry['size'], sha256=entry['sha256'], etag=entry.get('etag'), last_modified=entry.get('last_modified'), mtime_ns=mtime_ns)
+    return True
+
+
+def download_file(url, path, session=None, bar=None, segments=1, manifest=None):
     """
     Baixa um arquivo de uma URL especificada e o salva no sistema de arquivos local.
 
     Esta função recupera um arquivo da URL fornecida e o salva no diretório local especificado.
-    O arquivo é transmitido em partes para lidar com arquivos grandes de maneira eficiente,
-    mostrando uma barra de progresso usando o `tqdm` para acompanhar o progresso do download.
+    O arquivo é transmitido em blocos de `CHUNK_SIZE` bytes com escrita bufferizada para lidar com arquivos grandes de
+    maneira eficiente, mostrando uma barra de progresso usando o `tqdm` para acompanhar o progresso do download.
+
+    Durante o download os dados são gravados em `<arquivo>.part`. Se um `.part` de uma execução interrompida já existir,
+    o download é retomado a partir do último byte gravado com o cabeçalho `Range: bytes=N-` (quando o servidor responde
+    `206 Partial Content` com um `Content-Range` que começa em `N`); caso o servidor ignore o `Range` ou devolva outro
+    intervalo, o arquivo é baixado desde o início. Ao final, o `.part` é
+    renomeado atomicamente para o nome definitivo, de modo que um arquivo incompleto nunca tenha o nome final: se o
+    servidor informar o `Content-Length`, o número de bytes recebidos é conferido antes da renomeação e, se faltar algum,
+    o `.part` é mantido para ser retomado na próxima execução.
+
+    Com `segments > 1`, arquivos com pelo menos `SEGMENT_MIN_SIZE` bytes são divididos em `segments` intervalos de bytes
+    baixados em paralelo (uma conexão por intervalo) e gravados diretamente em suas posições de um `.part` pré-alocado.
+    O tamanho do arquivo montado é conferido antes da renomeação. Se o servidor não anunciar `Accept-Ranges: bytes`,
+    o download volta a ser feito em um único fluxo.
+
+    O SHA-256 do arquivo é calculado durante a transmissão (no download segmentado, após a montagem) e, se um
+    `manifest` for fornecido, registrado nele junto com o tamanho, o `ETag` e o `Last-Modified` do servidor e o
+    `mtime_ns` do arquivo gravado.
 
     Parâmetros:
     ----------
@@ -137,25 +299,171 @@ def download_file(url, path):
         O diretório local onde o arquivo baixado será salvo. O arquivo será nomeado com base
         no nome do arquivo extraído da URL.
 
+    session : requests.Session, opcional
+        A sessão HTTP a ser reutilizada. Se não for fornecida, uma nova sessão será criada.
+
+    bar : tqdm, opcional
+        Uma barra de progresso compartilhada (em bytes) a ser atualizada no lugar da barra própria do arquivo. Usada
+        pelo download concorrente para exibir o progresso combinado de todos os arquivos.
+
+    segments : int, opcional, padrão=1
+        O número de intervalos de bytes baixados em paralelo para arquivos grandes. Com `1` o arquivo é baixado em um
+        único fluxo.
+
+    manifest : Manifest, opcional
+        O manifesto da safra onde o arquivo baixado será registrado.
+
+    Retorna:
+    -------
+    int
+        O número de bytes baixados nesta chamada (sem contar os bytes já existentes em um `.part` retomado).
+
     Raises:
     ------
     HTTPError
         Se a requisição HTTP para o arquivo falhar (por exemplo, se o arquivo não for encontrado ou houver um erro no servidor),
         será levantada uma `HTTPError`.
 
+    IOError
+        Se o download resultar em um arquivo com tamanho diferente do informado pelo servidor.
+
     Exemplo:
     --------
     download_file('https://.../arquivo.zip', '/diretorio/local/arquivo.zip')
     """
     filename = os.path.split(url)[1]
     local_file_path = os.path.join(path, filename)
-    session = create_custom_session()
-    response = session.get(url, stream=True, timeout=40)
-    response.raise_for_status()
+    partial_file_path = local_file_path + SUFFIX_PARTIAL
+    session = session or create_custom_session()
 
-    with open(local_file_path, 'wb') as f:
+    if segments > 1:
+        response = session.head(url)
         total_size = int(response.headers.get('Content-Length', 0))
-        with tqdm(total=total_size, unit='B', unit_scale=True, desc=filename, leave=False) as bar:
-            for data in response.iter_content(chunk_size=1024):
+        accept_ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+        if accept_ranges and total_size >= SEGMENT_MIN_SIZE:
+            downloaded = _download_file_segmented(url=url, partial_file_path=partial_file_path, local_file_path=local_file_path, total_size=total_size, session=session, bar=bar, segments=segments)
+            if manifest is not None:
+                manifest.record(filename=filename, url=url, size=total_size, sha256=file_sha256(local_file_path), etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'), mtime_ns=os.stat(local_file_path).st_mtime_ns)
+            return downloaded
+        if not accept_ranges:
+            _log.info(f'download_file | {filename} | servidor sem suporte a Range, baixando em um único fluxo')
+
+    offset = os.path.getsize(partial_file_path) if os.path.exists(partial_file_path) else 0
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    response = session.get(url, stream=True, timeout=40, headers=headers)
+    if offset and response.status_code == 416:
+        _log.info(f'download_file | {filename} | intervalo inválido para o arquivo parcial, baixando desde o início')
+        response.close()
+        offset = 0
+        response = session.get(url, stream=True, timeout=40)
+    response.raise_for_status()
+    if offset and response.status_code == 206 and _content_range_start(response) != offset:
+        _log.info(f"download_file | {filename} | Content-Range '{response.headers.get('Content-Range')}' não começa em {offset:_}, baixando desde o início")
+        response.close()
+        offset = 0
+        response = session.get(url, stream=True, timeout=40)
+        response.raise_for_status()
+
+    hasher = hashlib.sha256()
+    if offset and response.status_code == 206:
+        _log.info(f'download_file | {filename} | retomando o download a partir de {offset:_} bytes')
+        mode = 'ab'
+        with open(partial_file_path, 'rb') as f:
+            while True:
+                data = f.read(WRITE_BUFFER_SIZE)
+                if not data:
+                    break
+                hasher.update(data)
+    else:
+        offset = 0
+        mode = 'wb'
+
+    total_size = offset + int(response.headers.get('Content-Length', 0))
+    own_bar = bar is None
+    if own_bar:
+        bar = tqdm(total=total_size, initial=offset, unit='B', unit_scale=True, desc=filename, leave=False)
+    else:
+        with bar.get_lock():
+            bar.total += total_size - offset
+            bar.refresh()
+
+    downloaded = 0
+    try:
+        with open(partial_file_path, mode, buffering=WRITE_BUFFER_SIZE) as f:
+            for data in response.iter_content(chunk_size=CHUNK_SIZE):
                 f.write(data)
+                hasher.update(data)
+                downloaded += len(data)
                 bar.update(len(data))
+    finally:
+        if own_bar:
+            bar.close()
+
+    if 'Content-Length' in response.headers and offset + downloaded != total_size:
+        raise OSError(f'download_file | {filename} | arquivo com {offset + downloaded:_} bytes, esperado {total_size:_}; o arquivo parcial será retomado')
+
+    os.replace(partial_file_path, local_file_path)
+    if manifest is not None:
+        manifest.record(filename=filename, url=url, size=offset + downloaded, sha256=hasher.hexdigest(), etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'), mtime_ns=os.stat(local_file_path).st_mtime_ns)
+    return downloaded
+
+
+def _download_file_segmented(url, partial_file_path, local_file_path, total_size, session, bar, segments):
+    """
+    Baixa um arquivo em `segments` intervalos de bytes paralelos, gravando cada um na sua posição de um `.part` pré-alocado.
+    """
+    filename = os.path.basename(local_file_path)
+    segment_size = -(-total_size // segments)
+    ranges = [(start, min(start + segment_size, total_size) - 1) for start in range(0, total_size, segment_size)]
+    _log.info(f'download_file | {filename} | baixando {total_size:_} bytes em {len(ranges)} segmentos')
+
+    with open(partial_file_path, 'wb') as f:
+        f.truncate(total_size)
+
+    own_bar = bar is None
+    if own_bar:
+        bar = tqdm(total=total_size, unit='B', unit_scale=True, desc=filename, leave=False)
+    else:
+        with bar.get_lock():
+            bar.total += total_size
+            bar.refresh()
+    lock = threading.Lock()
+
+    def download_segment(start, end):
+        response = session.get(url, stream=True, timeout=40, headers={'Range': f'bytes={start}-{end}'})
+        response.raise_for_status()
+        if response.status_code != 206 or _content_range_start(response) != start:
+            raise OSError(f"download_file | {filename} | o servidor não respondeu 206 com o intervalo {start}-{end} (Content-Range '{response.headers.get('Content-Range')}')")
+        written = 0
+        with open(partial_file_path, 'r+b', buffering=WRITE_BUFFER_SIZE) as f:
+            f.seek(start)
+            for data in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(data)
+                written += len(data)
+                with lock:
+                    bar.update(len(data))
+        if written != end - start + 1:
+            raise OSError(f'download_file | {filename} | segmento {start}-{end} com {written:_} bytes, esperado {end - start + 1:_}')
+        return written
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            downloaded = sum(executor.map(lambda r: download_segment(*r), ranges))
+    finally:
+        if own_bar:
+            bar.close()
+
+    assembled_size = os.path.getsize(partial_file_path)
+    if downloaded != total_size or assembled_size != total_size:
+        raise OSError(f'download_file | {filename} | arquivo montado com {assembled_size:_} bytes, esperado {total_size:_}')
+
+    os.replace(partial_file_path, local_file_path)
+    return downloaded
+
+
+def _content_range_start(response):
+    """
+    Retorna o primeiro byte do `Content-Range` de uma resposta `206` (`bytes <início>-<fim>/<total>`), ou `None`.
+    """
+    match = re.match(r'bytes (\d+)-\d+/(\d+|\*)$', response.headers.get('Content-Range', '').strip())
+    return int(match[1]) if match else None
@@ -0,0 +1,130 @@
+import html
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+
+from dados_publicos_cnpj_receita_federal import SetupLogger
+from dados_publicos_cnpj_receita_federal.io.requests_config import create_custom_session
+from dados_publicos_cnpj_receita_federal.settings import FILE_LISTING_CACHE
+from dados_publicos_cnpj_receita_federal.settings import LISTING_CACHE_TTL
+from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
+
+_log = SetupLogger('io.listing_cache')
+
+_lock = threading.Lock()
+_regex_href = re.compile(r'<a\s[^>]*?href\s*=\s*["\']([^"\']+)["\']', re.IGNORECASE)
+
+
+def parse_hrefs(text):
+    """
+    Extrai os `href` de todos os links `<a>` de uma página de listagem de diretório.
+
+    Usa uma expressão regular sobre o HTML em vez de construir a árvore completa do documento, o que é suficiente
+    para as páginas de índice geradas pelo servidor da Receita Federal e muito mais rápido.
+
+    Exemplo:
+    --------
+    parse_hrefs('<a href="2024-10/">2024-10/</a>')
+    # ['2024-10/']
+    """
+    return [html.unescape(href) for href in _regex_href.findall(text)]
+
+
+def fetch_listing(url, session=None, ttl=None):
+    """
+    Retorna os `href` da página de listagem de `url`, usando um cache em disco com validade (TTL).
+
+    O cache fica em `<PATH_FOLDER_RAW>/listings.json` e é compartilhado por `list_safras`, `safra_atual` e
+    `download_safra`. Enquanto a entrada estiver dentro do TTL nenhuma requisição é feita. Depois disso a página é
+    revalidada com uma requisição condicional (`If-None-Match` / `If-Modified-Since`): se o servidor responder `304`,
+    a listagem em cache é reutilizada sem baixar nem processar a página novamente. Se a revalidação falhar (erro na
+    requisição ou resposta diferente de `200`/`304`), a listagem em cache, mesmo vencida, é reutilizada com um aviso no
+    log.
+
+    Parâmetros:
+    ----------
+    url : str
+        A URL da página de listagem.
+
+    session : requests.Session, opcional
+        A sessão HTTP a ser reutilizada. Se não for fornecida, uma nova sessão será criada.
+
+    ttl : int, opcional
+        A validade do cache em segundos. Se não for fornecida, usa `LISTING_CACHE_TTL` das configurações. Com `0`, a
+        página é sempre revalidada.
+
+    Retorna:
+    -------
+    list
+        Os `href` da página.
+
+    Lança:
+    ------
+    Exceção
+        Se o servidor não responder com sucesso e não houver a listagem em cache.
+
+    Exemplo:
+    --------
+    fetch_listing('https://arquivos.receitafederal.gov.br/cnpj/dados_abertos_cnpj/')
+    """
+    ttl = LISTING_CACHE_TTL if ttl is None else ttl
+    path_cache = os.path.join(PATH_FOLDER_RAW, FILE_LISTING_CACHE)
+    with _lock:
+        cache = _load_cache(path_cache)
+    entry = cache.get(url)
+    now = time.time()
+    if entry and now - entry['fetched_at'] < ttl:
+        return entry['hrefs']
+
+    headers = {}
+    if entry and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry and entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+
+    session = session or create_custom_session()
+    try:
+        response = session.get(url, headers=headers)
+    except requests.RequestException as e:
+        return _stale_listing(url, entry, f'erro na requisição ({e})')
+    if entry and response.status_code == 304:
+        _log.info(f'fetch_listing | {url} | listagem não modificada')
+        entry['fetched_at'] = now
+    elif response.status_code == 200:
+        entry = {
+            'hrefs': parse_hrefs(response.text),
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': now,
+        }
+    else:
+        return _stale_listing(url, entry, f'resposta {response.status_code}')
+
+    with _lock:
+        cache = _load_cache(path_cache)
+        cache[url] = entry
+        path_tmp = path_cache + '.tmp'
+        with open(path_tmp, 'w', encoding='UTF-8') as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+        os.replace(path_tmp, path_cache)
+    return entry['hrefs']
+
+
+def _stale_listing(url, entry, reason):
+    if entry is None:
+        msg = f'fetch_listing | {url} | {reason} e nenhuma listagem em cache'
+        _log.critical(msg)
+        raise Exception(msg)
+    _log.warning(f'fetch_listing | {url} | {reason}, usando a listagem em cache')
+    return entry['hrefs']
+
+
+def _load_cache(path_cache):
+    if not os.path.exists(path_cache):
+        return {}
+    with open(path_cache, encoding='UTF-8') as f:
+        return json.load(f)
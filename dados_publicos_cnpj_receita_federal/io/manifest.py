@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+from dados_publicos_cnpj_receita_federal import SetupLogger
+from dados_publicos_cnpj_receita_federal.settings import FILE_MANIFEST
+from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
+
+_log = SetupLogger('io.manifest')
+
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class Manifest:
+    """
+    Manifesto persistente dos arquivos baixados de uma safra.
+
+    O manifesto é um arquivo JSON em `<PATH_FOLDER_RAW>/<safra>/manifest.json` que registra, para cada arquivo .zip,
+    a URL de origem, o tamanho, os cabeçalhos `ETag`/`Last-Modified` devolvidos pelo servidor, o SHA-256 calculado
+    durante o download e o instante de modificação do arquivo gravado (`mtime_ns`). Com ele, uma nova execução de `download_safra` sabe quais arquivos estão completos sem enviar
+    uma requisição por arquivo, e as etapas seguintes sabem exatamente quais entradas mudaram (`changed_files`).
+
+    As gravações são protegidas por um `threading.Lock`, de modo que o mesmo manifesto pode ser atualizado pelas
+    threads do download concorrente.
+
+    Parâmetros:
+    ----------
+    safra : str
+        O identificador do lote/período dos dados.
+
+    Exemplo:
+    --------
+    manifest = Manifest('2024-10')
+    manifest.get('Empresas0.zip')
+    # {'url': 'https://...', 'size': 123, 'etag': '"..."', 'last_modified': '...', 'sha256': '...', 'mtime_ns': 1731..., 'updated_at': '...'}
+    """
+
+    def __init__(self, safra):
+        self.safra = safra
+        self.path = os.path.join(PATH_FOLDER_RAW, safra, FILE_MANIFEST)
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='UTF-8') as f:
+                self.entries = json.load(f)
+
+    def get(self, filename):
+        return self.entries.get(filename)
+
+    def checksums(self):
+        """
+        Retorna um dicionário `{arquivo: sha256}` com todos os arquivos registrados.
+        """
+        return {filename: entry['sha256'] for filename, entry in self.entries.items()}
+
+    def record(self, filename, url, size, sha256, etag=None, last_modified=None, mtime_ns=None):
+        """
+        Registra (ou substitui) a entrada de um arquivo e grava o manifesto em disco de forma atômica.
+
+        `mtime_ns` é o `st_mtime_ns` do arquivo local no momento do registro; enquanto ele não muda, o arquivo é
+        considerado o mesmo sem recalcular o SHA-256 (ver `need_download`).
+        """
+        entry = {
+            'url': url,
+            'size': size,
+            'etag': etag,
+            'last_modified': last_modified,
+            'sha256': sha256,
+            'mtime_ns': mtime_ns,
+            'updated_at': f'{datetime.now():%Y-%m-%d %H:%M:%S}',
+        }
+        with self._lock:
+            self.entries[filename] = entry
+            self._save()
+        return entry
+
+    def changed_files(self, known_checksums):
+        """
+        Lista os arquivos cujo SHA-256 atual difere do informado em `known_checksums` (ou que não constam nele).
+
+        Parâmetros:
+        ----------
+        known_checksums : dict
+            Um dicionário `{arquivo: sha256}` registrado por quem consumiu os arquivos anteriormente.
+
+        Retorna:
+        -------
+        list
+            A lista ordenada dos nomes de arquivos novos ou alterados.
+        """
+        return sorted(filename for filename, sha256 in self.checksums().items() if known_checksums.get(filename) != sha256)
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        path_tmp = self.path + '.tmp'
+        with open(path_tmp, 'w', encoding='UTF-8') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+        os.replace(path_tmp, self.path)
+
+
+def file_sha256(file_path):
+    """
+    Calcula o SHA-256 de um arquivo lendo-o em blocos.
+    """
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while True:
+            data = f.read(HASH_CHUNK_SIZE)
+            if not data:
+                break
+            hasher.update(data)
+    return hasher.hexdigest()
@@ -3,7 +3,7 @@ from requests.adapters import HTTPAdapter
 from urllib3.util import Retry
 
 
-def create_custom_session():
+def create_custom_session(pool_maxsize=10):
     retry = Retry(
         total=15,
         connect=5,
@@ -12,7 +12,7 @@ def create_custom_session():
         backoff_factor=1,
         status_forcelist=[429, 500, 502, 503, 504],
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
     session = requests.Session()
     session.mount('http://', adapter)
     session.mount('https://', adapter)
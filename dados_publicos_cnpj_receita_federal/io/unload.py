@@ -2,7 +2,9 @@ import os
 
 from dados_publicos_cnpj_receita_federal import SetupLogger
 from dados_publicos_cnpj_receita_federal.database import connect_db
+from dados_publicos_cnpj_receita_federal.database import memory_monitor
 from dados_publicos_cnpj_receita_federal.settings import DB_URI
+from dados_publicos_cnpj_receita_federal.settings import DUCKDB_PRESERVE_INSERTION_ORDER
 from dados_publicos_cnpj_receita_federal.settings import FOLDER_UNLOAD
 from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
 from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_EMPRESAS
@@ -71,32 +73,37 @@ def unload_safra(safra, unload_file_format='parquet', threads=4, chunk_size=2_00
         path_unload = os.path.join(export_path, safra)
         os.makedirs(path_unload, exist_ok=True)
 
-    with connect_db(db_uri=DB_URI) as db:
-        for tbl in list_tbls:
-            _log.info(f"unload | descarregando {tbl=} para '{unload_file_format}'")
-            if unload_file_format == 'parquet':
-                PATH_FOLDER_UNLOAD_PARQUET = os.path.join(path_unload, 'format_parquet')
-                os.makedirs(PATH_FOLDER_UNLOAD_PARQUET, exist_ok=True)
-                PATH_FOLDER_UNLOAD_PARQUET_TBL = os.path.join(PATH_FOLDER_UNLOAD_PARQUET, tbl)
-                os.makedirs(PATH_FOLDER_UNLOAD_PARQUET_TBL, exist_ok=True)
+    with memory_monitor(DB_URI, 'unload'), connect_db(db_uri=DB_URI) as db:
+        # os blocos são lidos com LIMIT/OFFSET, que só particionam a tabela sem repetições na ordem de inserção
+        db.execute('SET preserve_insertion_order = true')
+        try:
+            for tbl in list_tbls:
+                _log.info(f"unload | descarregando {tbl=} para '{unload_file_format}'")
+                if unload_file_format == 'parquet':
+                    PATH_FOLDER_UNLOAD_PARQUET = os.path.join(path_unload, 'format_parquet')
+                    os.makedirs(PATH_FOLDER_UNLOAD_PARQUET, exist_ok=True)
+                    PATH_FOLDER_UNLOAD_PARQUET_TBL = os.path.join(PATH_FOLDER_UNLOAD_PARQUET, tbl)
+                    os.makedirs(PATH_FOLDER_UNLOAD_PARQUET_TBL, exist_ok=True)
 
-                total_rows = db.execute(f'SELECT COUNT(*) FROM {tbl}').fetchone()[0]
-                rounds = max(total_rows // chunk_size, 1)
-                _log.info(f'unload | {tbl=} com {total_rows:_} linhas em {rounds} blocos')
-                for offset in range(0, total_rows, chunk_size):
-                    file_number = offset // chunk_size
-                    output_file = f'{PATH_FOLDER_UNLOAD_PARQUET_TBL}/{tbl}_{file_number}.parquet'
+                    total_rows = db.execute(f'SELECT COUNT(*) FROM {tbl}').fetchone()[0]
+                    rounds = max(total_rows // chunk_size, 1)
+                    _log.info(f'unload | {tbl=} com {total_rows:_} linhas em {rounds} blocos')
+                    for offset in range(0, total_rows, chunk_size):
+                        file_number = offset // chunk_size
+                        output_file = f'{PATH_FOLDER_UNLOAD_PARQUET_TBL}/{tbl}_{file_number}.parquet'
 
-                    _log.info(f'unload | [{tbl=}, {unload_file_format}] | bloco {file_number} de {rounds} ({file_number/rounds:.1%}) -> para o arquivo {output_file}')
-                    db.execute(
-                        f"""
-                                    SET progress_bar_time = 1;
-                                    SET threads = {threads};
-                                    COPY (SELECT * FROM {tbl} LIMIT {chunk_size} OFFSET {offset}) TO '{output_file}'
-                                    (FORMAT PARQUET, COMPRESSION ZSTD);
-                                """,
-                    )
-            else:
-                msg = f'unload | {unload_file_format=} não implementado'
-                _log.info(msg)
-                raise NotImplementedError(msg)
+                        _log.info(f'unload | [{tbl=}, {unload_file_format}] | bloco {file_number} de {rounds} ({file_number/rounds:.1%}) -> para o arquivo {output_file}')
+                        db.execute(
+                            f"""
+                                        SET progress_bar_time = 1;
+                                        SET threads = {threads};
+                                        COPY (SELECT * FROM {tbl} LIMIT {chunk_size} OFFSET {offset}) TO '{output_file}'
+                                        (FORMAT PARQUET, COMPRESSION ZSTD);
+                                    """,
+                        )
+                else:
+                    msg = f'unload | {unload_file_format=} não implementado'
+                    _log.info(msg)
+                    raise NotImplementedError(msg)
+        finally:
+            db.execute(f"SET preserve_insertion_order = '{DUCKDB_PRESERVE_INSERTION_ORDER}'")
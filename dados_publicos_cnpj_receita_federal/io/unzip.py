@@ -1,17 +1,28 @@
+import json
 import os
+import time
 import zipfile
+import zlib
+from concurrent.futures import as_completed
+from concurrent.futures import ProcessPoolExecutor
 
 from tqdm import tqdm
 
 from dados_publicos_cnpj_receita_federal import SetupLogger
 from dados_publicos_cnpj_receita_federal.settings import FOLDER_UNZIP
+from dados_publicos_cnpj_receita_federal.settings import FOLDER_UNZIP_STATE
 from dados_publicos_cnpj_receita_federal.settings import FOLDER_ZIP
 from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
+from dados_publicos_cnpj_receita_federal.settings import UNZIP_ENCODING
 
 _log = SetupLogger('io.unzip')
 
+CHUNK_SIZE = 1024 * 1024 * 2
+SOURCE_ENCODING = 'ISO-8859-1'
+SUFFIX_PARTIAL = '.part'
 
-def unzip_safra(safra):
+
+def unzip_safra(safra, workers=1, encoding=None, force=False):
     """
     Descompacta todos os arquivos no lote 'safra' especificado da pasta de arquivos .zip para o diretório de descompactação.
 
@@ -19,15 +30,36 @@ def unzip_safra(safra):
     arquivos extraídos em um diretório de descompactação designado. Se nenhum arquivo .zip for encontrado,
     a função registra uma mensagem e retorna.
 
+    Com `workers > 1`, os arquivos são descompactados em paralelo por um pool de processos, aproveitando os demais
+    núcleos para a descompressão e a conversão de codificação. Em ambos os modos, um erro em um arquivo não interrompe
+    os demais: os erros são registrados e, ao final, uma exceção lista todos os arquivos que falharam. Arquivos já
+    extraídos por completo em uma execução anterior são pulados (ver `unzip_file`).
+
     Parâmetros:
     ----------
     safra : str
         O identificador do lote de dados ou período a ser processado. A função procurará arquivos .zip na
         pasta correspondente à safra fornecida.
 
+    workers : int, opcional, padrão=1
+        O número de processos usados para descompactar os arquivos. Com `1` os arquivos são descompactados em série.
+
+    encoding : str, opcional
+        A codificação dos arquivos extraídos (ver `unzip_file`). Se não for fornecida, usa `UNZIP_ENCODING` das
+        configurações, que também é a codificação usada pelos `processar_*` para ler os arquivos.
+
+    force : bool, opcional, padrão=False
+        Se `True`, extrai novamente os arquivos já extraídos por completo (ver `unzip_file`).
+
+    Raises:
+    ------
+    Exceção
+        Se a descompactação de um ou mais arquivos falhar.
+
     Exemplo:
     --------
     unzip_safra('2024-10')
+    unzip_safra('2024-10', workers=4)
     """
     _log.info(f"unzip |'{safra=}' | Listando arquivos")
     PATH_FOLDER_RAW_SAFRA = os.path.join(PATH_FOLDER_RAW, safra)
@@ -35,22 +67,47 @@ def unzip_safra(safra):
     PATH_FOLDER_RAW_SAFRA_UNZIP = os.path.join(PATH_FOLDER_RAW_SAFRA, FOLDER_UNZIP)
     os.makedirs(PATH_FOLDER_RAW_SAFRA_UNZIP, exist_ok=True)
 
-    _log.info(f"unzip |'{safra=}' | Iniciando a descompactação da safra")
-    list_files = os.listdir(PATH_FOLDER_RAW_SAFRA_ZIP)
+    _log.info(f"unzip |'{safra=}' | Iniciando a descompactação da safra ({workers=})")
+    list_files = [file for file in os.listdir(PATH_FOLDER_RAW_SAFRA_ZIP) if file.endswith('.zip')]
 
     if not list_files:
         _log.info(f"unzip |'{safra=}' | Nenhum arquivo .zip encontrado para a safra")
         return
 
+    start = time.time()
+    total_bytes = 0
+    dict_errors = {}
     with tqdm(total=len(list_files), desc='Arquivos descompactados', leave=False) as bar:
-        for file in sorted(list_files):
-            unzip_file(file_path=os.path.join(PATH_FOLDER_RAW_SAFRA_ZIP, file), path_folder_unzip=PATH_FOLDER_RAW_SAFRA_UNZIP)
-            bar.update(1)
+        if workers <= 1:
+            for file in sorted(list_files):
+                try:
+                    total_bytes += unzip_file(file_path=os.path.join(PATH_FOLDER_RAW_SAFRA_ZIP, file), path_folder_unzip=PATH_FOLDER_RAW_SAFRA_UNZIP, encoding=encoding, force=force)
+                except Exception as e:
+                    dict_errors[file] = e
+                bar.update(1)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {executor.submit(unzip_file, file_path=os.path.join(PATH_FOLDER_RAW_SAFRA_ZIP, file), path_folder_unzip=PATH_FOLDER_RAW_SAFRA_UNZIP, progress=False, encoding=encoding, force=force): file for file in sorted(list_files)}
+                for future in as_completed(futures):
+                    try:
+                        total_bytes += future.result()
+                    except Exception as e:
+                        dict_errors[futures[future]] = e
+                    bar.update(1)
+
+    elapsed = time.time() - start
+    _log.info(f"unzip |'{safra=}' | {len(list_files) - len(dict_errors)} arquivos descompactados ({total_bytes / 1024 ** 2:_.1f} MiB) em {elapsed:.1f} segundos")
+    if dict_errors:
+        for file, error in sorted(dict_errors.items()):
+            _log.error(f"unzip |'{safra=}' | erro ao descompactar {file}: {error}")
+        msg = f"unzip |'{safra=}' | {len(dict_errors)} arquivos não foram descompactados: {sorted(dict_errors)}"
+        _log.critical(msg)
+        raise Exception(msg)
 
     _log.info(f"unzip |'{safra=}' | Descompactação concluída")
 
 
-def unzip_file(file_path, path_folder_unzip):
+def unzip_file(file_path, path_folder_unzip, progress=True, encoding=None, force=False):
     """
     Extrai o conteúdo de um arquivo ZIP e o salva em um diretório especificado.
 
@@ -58,6 +115,17 @@ def unzip_file(file_path, path_folder_unzip):
     diretório de destino, exibindo uma barra de progresso para acompanhar o progresso da extração. A função
     trata o conteúdo de cada arquivo lendo-o em partes e gravando-o no diretório de destino.
 
+    Os arquivos da Receita Federal são codificados em ISO-8859-1 (Latin-1). Com `encoding='utf-8'` cada bloco é
+    decodificado e regravado em UTF-8; com `encoding='latin-1'` o conteúdo é copiado byte a byte, sem nenhuma
+    conversão, e a leitura em Latin-1 fica a cargo do leitor de CSV do DuckDB.
+
+    A extração é idempotente: cada arquivo é gravado com um nome temporário na pasta `FOLDER_UNZIP_STATE` (ao lado
+    de `path_folder_unzip`) e só então renomeado para o destino, de modo que uma interrupção nunca deixa um CSV pela
+    metade com o nome final. Arquivos já extraídos cujo tamanho e CRC32 conferem com a entrada do ZIP são pulados.
+    Na cópia sem conversão a comparação é feita diretamente com o diretório do ZIP; com conversão, o conteúdo em
+    disco difere do original, e a comparação usa o tamanho e o CRC32 registrados na extração anterior
+    (`<arquivo>.json` na pasta de estado), junto com o CRC32 e o tamanho da entrada de origem.
+
     Parâmetros:
     ----------
     file_path : str
@@ -66,23 +134,145 @@ def unzip_file(file_path, path_folder_unzip):
     path_folder_unzip : str
         O diretório de destino onde os arquivos extraídos serão salvos.
 
+    progress : bool, opcional, padrão=True
+        Se `True`, exibe uma barra de progresso para o arquivo. Desativada quando executada em um pool de processos.
+
+    encoding : str, opcional
+        A codificação dos arquivos extraídos: `'utf-8'` ou `'latin-1'`. Se não for fornecida, usa `UNZIP_ENCODING`.
+
+    force : bool, opcional, padrão=False
+        Se `True`, extrai todos os arquivos mesmo que já estejam completos no destino.
+
+    Retorna:
+    -------
+    int
+        O número de caracteres (ou bytes, sem conversão) extraídos. Arquivos pulados não são contados.
+
     Exemplo:
     --------
     unzip_file('/caminho/para/arquivo.zip', '/caminho/para/destino')
     """
+    encoding = (encoding or UNZIP_ENCODING).lower()
+    transcode = encoding != 'latin-1'
+    path_folder_state = os.path.join(os.path.dirname(os.path.normpath(path_folder_unzip)), FOLDER_UNZIP_STATE)
+    os.makedirs(path_folder_state, exist_ok=True)
+    total_extracted = 0
     with zipfile.ZipFile(file_path, 'r') as zip_ref:
-        total_size = sum(zip_ref.getinfo(name).file_size for name in zip_ref.namelist())
-        with tqdm(total=total_size, unit='B', unit_scale=True, desc=f'{os.path.basename(file_path):>25}', leave=False) as pbar:
-            for file_name in zip_ref.namelist():
+        list_infos = [info for info in zip_ref.infolist() if not info.is_dir()]
+        total_size = sum(info.file_size for info in list_infos)
+        with tqdm(total=total_size, unit='B', unit_scale=True, desc=f'{os.path.basename(file_path):>25}', leave=False, disable=not progress) as pbar:
+            for info in list_infos:
+                file_name = os.path.basename(info.filename)
                 file_target = os.path.join(path_folder_unzip, file_name)
-                with open(file_target, 'w', encoding='UTF-8') as outfile:
-                    member_fd = zip_ref.open(file_name)
+                file_temp = os.path.join(path_folder_state, file_name + SUFFIX_PARTIAL)
+                file_state = os.path.join(path_folder_state, file_name + '.json')
+                if not force and is_extracted(info, file_target, file_state, encoding):
+                    _log.info(f'unzip_file | {file_name} já extraído, pulando')
+                    pbar.update(info.file_size)
+                    continue
+
+                crc = 0
+                size = 0
+                with zip_ref.open(info) as member_fd, open(file_temp, 'wb') as outfile:
                     while True:
-                        x = member_fd.read(n=1024 * 1024 * 2).decode('ISO-8859-1')
-                        if not x:
+                        chunk = member_fd.read(CHUNK_SIZE)
+                        if not chunk:
                             break
-                        outfile.write(x)
-                        pbar.update(len(x))
+                        pbar.update(len(chunk))
+                        if transcode:
+                            x = chunk.decode(SOURCE_ENCODING)
+                            total_extracted += len(x)
+                            chunk = x.encode(encoding)
+                        else:
+                            total_extracted += len(chunk)
+                        outfile.write(chunk)
+                        crc = zlib.crc32(chunk, crc)
+                        size += len(chunk)
+
+                if os.path.exists(file_state):
+                    os.remove(file_state)
+                os.replace(file_temp, file_target)
+                if transcode:
+                    _write_state(file_state, {'encoding': encoding, 'source_crc': info.CRC, 'source_size': info.file_size, 'crc': crc, 'size': size})
+    return total_extracted
+
+
+def is_extracted(info, file_target, file_state, encoding):
+    """
+    Verifica se uma entrada do ZIP já foi extraída por completo em `file_target`.
+
+    O tamanho do arquivo em disco é comparado primeiro, e o CRC32 só é calculado quando o tamanho confere. Sem
+    conversão (`encoding='latin-1'`), o esperado é o da própria entrada do ZIP; com conversão, o esperado é o
+    registrado em `file_state` na última extração, desde que ela tenha partido da mesma entrada e codificação.
+
+    Parâmetros:
+    ----------
+    info : zipfile.ZipInfo
+        A entrada do diretório do ZIP.
+
+    file_target : str
+        O caminho do arquivo extraído.
+
+    file_state : str
+        O caminho do registro da extração convertida.
+
+    encoding : str
+        A codificação dos arquivos extraídos.
+
+    Retorna:
+    -------
+    bool
+        `True` se o arquivo em disco corresponde à entrada do ZIP.
+    """
+    if not os.path.isfile(file_target):
+        return False
+
+    if encoding == 'latin-1':
+        expected_size, expected_crc = info.file_size, info.CRC
+    else:
+        try:
+            with open(file_state, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if (state.get('encoding'), state.get('source_crc'), state.get('source_size')) != (encoding, info.CRC, info.file_size):
+            return False
+        expected_size, expected_crc = state.get('size'), state.get('crc')
+
+    if os.path.getsize(file_target) != expected_size:
+        return False
+    return file_crc32(file_target) == expected_crc
+
+
+def file_crc32(path):
+    """
+    Calcula o CRC32 de um arquivo, lendo-o em blocos de `CHUNK_SIZE`.
+
+    Parâmetros:
+    ----------
+    path : str
+        O caminho do arquivo.
+
+    Retorna:
+    -------
+    int
+        O CRC32 do conteúdo do arquivo.
+    """
+    crc = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _write_state(file_state, state):
+    file_temp = file_state + '.tmp'
+    with open(file_temp, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(file_temp, file_state)
 
 
 if __name__ == '__main__':
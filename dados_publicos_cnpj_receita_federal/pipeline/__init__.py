@@ -0,0 +1,3 @@
+from dados_publicos_cnpj_receita_federal.pipeline.parallel import build_parallel
+from dados_publicos_cnpj_receita_federal.pipeline.resumable import run_resumable
+from dados_publicos_cnpj_receita_federal.pipeline.scheduler import run_pipeline
@@ -0,0 +1,153 @@
+import os
+import time
+from concurrent.futures import as_completed
+from concurrent.futures import ProcessPoolExecutor
+
+from dados_publicos_cnpj_receita_federal import SetupLogger
+from dados_publicos_cnpj_receita_federal.database import connect_db
+from dados_publicos_cnpj_receita_federal.database import detect_cpu_count
+from dados_publicos_cnpj_receita_federal.database import pipeline_session
+from dados_publicos_cnpj_receita_federal.database import resource_profile
+from dados_publicos_cnpj_receita_federal.engine import DICT_TABLE_ENGINE
+from dados_publicos_cnpj_receita_federal.engine._core import process_mapping
+from dados_publicos_cnpj_receita_federal.engine.historico import arquivar_safra
+from dados_publicos_cnpj_receita_federal.settings import DB_URI
+from dados_publicos_cnpj_receita_federal.settings import DUCKDB_PRESERVE_INSERTION_ORDER
+from dados_publicos_cnpj_receita_federal.settings import FOLDER_DB_PARTS
+from dados_publicos_cnpj_receita_federal.settings import HISTORY
+from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_EMPRESAS
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_ESTABELECIMENTOS
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_REGIME_TRIBUTARIO
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_SIMPLES
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_SOCIOS
+
+_log = SetupLogger('pipeline.parallel')
+
+# da maior para a menor tabela, para que a maior comece primeiro e determine o tempo total
+LIST_TABLES_BY_SIZE = [
+    TABLE_NAME_ESTABELECIMENTOS,
+    TABLE_NAME_SOCIOS,
+    TABLE_NAME_EMPRESAS,
+    TABLE_NAME_SIMPLES,
+    TABLE_NAME_REGIME_TRIBUTARIO,
+]
+
+
+def build_parallel(safra, tables=None, source='unzip', max_workers=None, keep_parts=False):
+    """
+    Carrega as tabelas de uma safra em paralelo, cada uma em um processo e em um banco DuckDB próprio, e as copia para
+    o banco principal ao final.
+
+    Os `processar_*` são independentes entre si, exceto pelas tabelas de referência, que cada processo carrega no seu
+    próprio banco (`<safra>/db_parts/<tabela>.duckdb`). Como cada processo grava no seu arquivo, não há disputa pelo
+    banco principal e o tempo total fica próximo ao da maior tabela. O orçamento de memória e os processadores do perfil
+    de recursos (ver `resource_profile`) são divididos entre os processos. Ao final, cada banco é anexado (`ATTACH`) ao
+    banco principal e a sua tabela (com a view `<tabela>_texto`, se houver) é copiada mantendo a ordem física; as
+    tabelas de referência do banco principal são carregadas por `process_mapping`. Com `HISTORY`, as tabelas copiadas
+    são então arquivadas no histórico do banco principal (ver `arquivar_safra`).
+
+    Parâmetros:
+    ----------
+    safra : str
+        O identificador do lote/período dos dados.
+
+    tables : list, opcional
+        As tabelas a carregar (ex: `['empresas', 'simples']`). Se não for fornecida, todas são carregadas.
+
+    source : str, opcional, padrão='unzip'
+        De onde ler os arquivos (ver `load_safra_to_duckdb`).
+
+    max_workers : int, opcional
+        O número de processos. Se não for fornecido, usa o menor valor entre o número de tabelas e o de processadores.
+
+    keep_parts : bool, opcional, padrão=False
+        Se `True`, mantém os bancos de cada tabela após a cópia.
+
+    Retorna:
+    -------
+    dict
+        Um dicionário `{tabela: segundos}` com o tempo de carga de cada tabela no seu processo.
+
+    Exemplo:
+    --------
+    build_parallel('2024-10')
+    """
+    start = time.time()
+    tables = [table for table in LIST_TABLES_BY_SIZE if tables is None or table in tables]
+    max_workers = max_workers or max(min(len(tables), detect_cpu_count()), 1)
+    path_parts = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_DB_PARTS)
+    os.makedirs(path_parts, exist_ok=True)
+    dict_parts = {table: os.path.join(path_parts, f'{table}.duckdb') for table in tables}
+    for path in dict_parts.values():
+        _remove_part(path)
+
+    _log.info(f"build_parallel | '{safra=}' | {tables} em {max_workers} processos")
+    dict_elapsed = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        dict_futures = {executor.submit(_build_part, table=table, safra=safra, source=source, db_uri=path, n_workers=max_workers): table for table, path in dict_parts.items()}
+        for future in as_completed(dict_futures):
+            table = dict_futures[future]
+            try:
+                dict_elapsed[table] = future.result()
+            except Exception:
+                _log.critical(f"build_parallel | '{safra=}' | falha ao carregar {table}")
+                for pending in dict_futures:
+                    pending.cancel()
+                raise
+            _log.info(f"build_parallel | '{safra=}' | {table} carregada em {dict_elapsed[table]:.1f} segundos")
+
+    merge_start = time.time()
+    process_mapping(DB_URI, safra, source=source)
+    merge_parts(DB_URI, dict_parts)
+    if HISTORY:
+        for table in tables:
+            arquivar_safra(db_uri=DB_URI, table_name=table, safra=safra)
+    if not keep_parts:
+        for path in dict_parts.values():
+            _remove_part(path)
+    _log.info(f"build_parallel | '{safra=}' | cópia para o banco principal em {time.time() - merge_start:.1f} segundos | total {time.time() - start:.1f} segundos")
+    return dict_elapsed
+
+
+def merge_parts(db_uri, dict_parts):
+    """
+    Copia a tabela de cada banco de `dict_parts` (e as suas views) para o banco `db_uri`, substituindo a existente.
+
+    A cópia é feita com `preserve_insertion_order` ativo, para manter a ordem física das tabelas ordenadas pela chave.
+
+    Parâmetros:
+    ----------
+    db_uri : str
+        O URI do banco de dados DuckDB principal.
+
+    dict_parts : dict
+        `{tabela: caminho do banco da tabela}`.
+    """
+    with connect_db(db_uri=db_uri) as db:
+        db.execute('SET preserve_insertion_order = true')
+        for table, path in dict_parts.items():
+            _log.info(f'merge_parts | copiando {table} de {path}')
+            db.execute(f"ATTACH '{path}' AS parte (READ_ONLY)")
+            try:
+                db.execute(f'CREATE OR REPLACE TABLE {table} AS SELECT * FROM parte.{table}')
+                for (sql,) in db.execute("SELECT sql FROM duckdb_views() WHERE database_name = 'parte' AND NOT internal").fetchall():
+                    db.execute(sql.replace('CREATE VIEW', 'CREATE OR REPLACE VIEW', 1))
+            finally:
+                db.execute('DETACH parte')
+        db.execute(f"SET preserve_insertion_order = '{DUCKDB_PRESERVE_INSERTION_ORDER}'")
+
+
+def _build_part(table, safra, source, db_uri, n_workers):
+    start = time.time()
+    # cada processo recebe uma parte do orçamento de memória e dos processadores, aplicada à conexão da sessão, usada por
+    # todas as etapas do `processar_*`; o histórico fica apenas no banco principal, arquivado após a cópia (ver `build_parallel`)
+    with pipeline_session(db_uri, profile=resource_profile(n_workers=n_workers)):
+        DICT_TABLE_ENGINE[table](safra=safra, source=source, history=False, db_uri=db_uri)
+    return time.time() - start
+
+
+def _remove_part(path):
+    for file_path in [path, f'{path}.wal']:
+        if os.path.exists(file_path):
+            os.remove(file_path)
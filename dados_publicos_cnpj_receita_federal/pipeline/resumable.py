@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import time
+
+from dados_publicos_cnpj_receita_federal import SetupLogger
+from dados_publicos_cnpj_receita_federal.database import connect_db
+from dados_publicos_cnpj_receita_federal.database import pipeline_session
+from dados_publicos_cnpj_receita_federal.engine import DICT_TABLE_ENGINE
+from dados_publicos_cnpj_receita_federal.engine.incremental import engine_version
+from dados_publicos_cnpj_receita_federal.io.downloader import download_safra
+from dados_publicos_cnpj_receita_federal.io.manifest import Manifest
+from dados_publicos_cnpj_receita_federal.io.unload import unload_safra
+from dados_publicos_cnpj_receita_federal.io.unzip import unzip_safra
+from dados_publicos_cnpj_receita_federal.pipeline.scheduler import dependencias_por_tabela
+from dados_publicos_cnpj_receita_federal.settings import DB_URI
+from dados_publicos_cnpj_receita_federal.settings import FOLDER_UNLOAD
+from dados_publicos_cnpj_receita_federal.settings import FOLDER_UNZIP
+from dados_publicos_cnpj_receita_federal.settings import FOLDER_ZIP
+from dados_publicos_cnpj_receita_federal.settings import HISTORY
+from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
+from dados_publicos_cnpj_receita_federal.settings import TABLE_NAME_PIPELINE_ESTADO
+from dados_publicos_cnpj_receita_federal.settings import TYPED_DATES
+from dados_publicos_cnpj_receita_federal.settings import TYPED_KEYS
+from dados_publicos_cnpj_receita_federal.settings import UNZIP_ENCODING
+
+_log = SetupLogger('pipeline.resumable')
+
+STAGE_DOWNLOAD = 'download'
+STAGE_UNZIP = 'unzip'
+STAGE_UNLOAD = 'unload'
+
+
+def run_resumable(safra, tables=None, source='unzip', max_workers=1, segments=1, revalidate=False, unload=True, force=None):
+    """
+    Executa a pipeline completa de uma safra (download, descompactação, carga de cada tabela e exportação), retomando a
+    partir da primeira etapa que não está válida.
+
+    Cada etapa concluída é registrada em `TABLE_NAME_PIPELINE_ESTADO` com a impressão digital (fingerprint) das suas
+    entradas (ver `stage_inputs`): os SHA-256 dos arquivos .zip do manifesto, a versão da especificação do engine, as
+    configurações que alteram o resultado e a safra, além de uma verificação barata de que a saída ainda existe (arquivos
+    descompactados e exportados, tabela carregada com a safra). Numa nova execução, as etapas cuja impressão digital não
+    mudou são puladas sem acessar a rede nem o disco além de um `stat` por arquivo; as demais são executadas e
+    registradas de novo. Assim, uma falha em `processar_socios` é retomada a partir de `socios`, sem repetir os
+    downloads, a descompactação e as tabelas já carregadas. O registro de uma etapa é apagado antes de ela começar, de
+    modo que uma etapa interrompida nunca é considerada concluída.
+
+    Parâmetros:
+    ----------
+    safra : str
+        O identificador do lote/período dos dados.
+
+    tables : list, opcional
+        As tabelas a processar (ex: `['empresas', 'simples']`). Se não for fornecida, todas são processadas.
+
+    source : str, opcional, padrão='unzip'
+        De onde as tabelas são carregadas (ver `load_safra_to_duckdb`). Com `'zip'`, a etapa de descompactação é omitida.
+
+    max_workers : int, opcional, padrão=1
+        O número de downloads simultâneos (ver `download_safra`).
+
+    segments : int, opcional, padrão=1
+        O número de conexões por arquivo grande (ver `download_file`).
+
+    revalidate : bool, opcional, padrão=False
+        Executa a etapa de download mesmo que ela esteja válida, revalidando os arquivos do manifesto com requisições
+        condicionais (ver `download_safra`), para detectar arquivos republicados pela Receita Federal.
+
+    unload : bool, opcional, padrão=True
+        Se `True`, exporta as tabelas ao final (ver `unload_safra`).
+
+    force : list, opcional
+        Etapas a executar mesmo que estejam válidas (ex: `['socios']`).
+
+    Retorna:
+    -------
+    dict
+        Um dicionário `{etapa: 'executada' | 'pulada'}`, na ordem de execução.
+
+    Exemplo:
+    --------
+    run_resumable('2024-10')
+    # {'download': 'pulada', 'unzip': 'pulada', 'empresas': 'pulada', ..., 'socios': 'executada', 'unload': 'executada'}
+    """
+    start = time.time()
+    tables = [table for table in DICT_TABLE_ENGINE if table in tables] if tables else list(DICT_TABLE_ENGINE)
+    set_force = set(force or [])
+    if revalidate:
+        set_force.add(STAGE_DOWNLOAD)
+
+    list_stages = [(STAGE_DOWNLOAD, lambda: download_safra(safra=safra, max_workers=max_workers, segments=segments, revalidate=revalidate))]
+    if source != 'zip':
+        list_stages.append((STAGE_UNZIP, lambda: unzip_safra(safra=safra)))
+    for table in tables:
+        list_stages.append((table, lambda table=table: DICT_TABLE_ENGINE[table](safra=safra, source=source)))
+    if unload:
+        list_stages.append((STAGE_UNLOAD, lambda: unload_safra(safra=safra)))
+
+    dict_report = {}
+    with pipeline_session(DB_URI) as db_session:
+        dict_state = estado_pipeline(safra)
+        for stage, run_stage in list_stages:
+            fingerprint = _fingerprint(stage_inputs(safra, stage, tables=tables, source=source))
+            if stage not in set_force and dict_state.get(stage) == fingerprint:
+                _log.info(f"run_resumable | '{safra=}' | etapa '{stage}' válida, pulando")
+                dict_report[stage] = 'pulada'
+                continue
+
+            _log.info(f"run_resumable | '{safra=}' | executando a etapa '{stage}'")
+            start_stage = time.time()
+            with connect_db(db_uri=DB_URI) as db:
+                db.execute(f'DELETE FROM {TABLE_NAME_PIPELINE_ESTADO} WHERE safra = ? AND etapa = ?', [safra, stage])
+            run_stage()
+
+            # a impressão digital registrada é a das entradas após a etapa, que pode ter alterado o manifesto ou as saídas
+            dict_inputs = stage_inputs(safra, stage, tables=tables, source=source)
+            with connect_db(db_uri=DB_URI) as db:
+                db.execute(f'INSERT OR REPLACE INTO {TABLE_NAME_PIPELINE_ESTADO} VALUES (?, ?, ?, ?, current_timestamp, ?)', [safra, stage, _fingerprint(dict_inputs), json.dumps(dict_inputs, sort_keys=True), time.time() - start_stage])
+            db_session.checkpoint(stage)
+            dict_report[stage] = 'executada'
+
+    _log.info(f"run_resumable | '{safra=}' | {sum(status == 'executada' for status in dict_report.values())} de {len(dict_report)} etapas executadas em {time.time() - start:.1f} segundos")
+    return dict_report
+
+
+def estado_pipeline(safra):
+    """
+    Retorna as etapas concluídas de uma safra e as suas impressões digitais, como registradas por `run_resumable`.
+
+    Cria `TABLE_NAME_PIPELINE_ESTADO` se ainda não existir.
+
+    Parâmetros:
+    ----------
+    safra : str
+        O identificador do lote/período dos dados.
+
+    Retorna:
+    -------
+    dict
+        Um dicionário `{etapa: fingerprint}`.
+    """
+    with connect_db(db_uri=DB_URI) as db:
+        db.execute(f'CREATE TABLE IF NOT EXISTS {TABLE_NAME_PIPELINE_ESTADO} (safra VARCHAR, etapa VARCHAR, fingerprint VARCHAR, entradas VARCHAR, concluido_em TIMESTAMP, segundos DOUBLE, PRIMARY KEY (safra, etapa))')
+        rows = db.execute(f'SELECT etapa, fingerprint FROM {TABLE_NAME_PIPELINE_ESTADO} WHERE safra = ?', [safra]).fetchall()
+    return dict(rows)
+
+
+def stage_inputs(safra, stage, tables=None, source='unzip'):
+    """
+    Descreve as entradas de uma etapa de `run_resumable`, das quais é calculada a sua impressão digital.
+
+    - `download`: o SHA-256 de cada arquivo do manifesto que está na pasta `zip` com o tamanho registrado.
+    - `unzip`: os SHA-256 dos arquivos .zip, a codificação da extração e o nome e tamanho de cada arquivo descompactado.
+    - tabela: os SHA-256 dos arquivos .zip da tabela e das referências (ver `dependencias_por_tabela`), a versão do engine
+      (ver `engine_version`), `source`, as configurações `TYPED_DATES`, `TYPED_KEYS`, `UNZIP_ENCODING` e `HISTORY` e a safra
+      presente na tabela.
+    - `unload`: as entradas das tabelas e o nome e tamanho de cada arquivo exportado.
+
+    Parâmetros:
+    ----------
+    safra : str
+        O identificador do lote/período dos dados.
+
+    stage : str
+        A etapa (`'download'`, `'unzip'`, `'unload'` ou o nome de uma tabela).
+
+    tables : list, opcional
+        As tabelas consideradas pela etapa `unload`. Se não for fornecida, todas são consideradas.
+
+    source : str, opcional, padrão='unzip'
+        De onde as tabelas são carregadas.
+
+    Retorna:
+    -------
+    dict
+        As entradas da etapa, serializáveis em JSON.
+    """
+    PATH_FOLDER_RAW_SAFRA = os.path.join(PATH_FOLDER_RAW, safra)
+    dict_checksums = _checksums(safra)
+    if stage == STAGE_DOWNLOAD:
+        return {'safra': safra, 'arquivos': dict_checksums}
+    if stage == STAGE_UNZIP:
+        return {'safra': safra, 'arquivos': dict_checksums, 'encoding': UNZIP_ENCODING, 'saida': _list_files(os.path.join(PATH_FOLDER_RAW_SAFRA, FOLDER_UNZIP))}
+    if stage == STAGE_UNLOAD:
+        dict_tables = {table: stage_inputs(safra, table, source=source) for table in (tables or DICT_TABLE_ENGINE)}
+        return {'safra': safra, 'tabelas': dict_tables, 'saida': _list_files(os.path.join(PATH_FOLDER_RAW_SAFRA, FOLDER_UNLOAD))}
+
+    set_files = dependencias_por_tabela(list(dict_checksums), tables=[stage])[stage]
+    return {
+        'safra': safra,
+        'arquivos': {filename: dict_checksums[filename] for filename in sorted(set_files)},
+        'engine': engine_version(stage),
+        'source': source,
+        'typed_dates': TYPED_DATES,
+        'typed_keys': TYPED_KEYS,
+        'encoding': UNZIP_ENCODING,
+        'history': HISTORY,
+        'safra_no_banco': _table_safra(stage),
+    }
+
+
+def _checksums(safra):
+    folder_zip = os.path.join(PATH_FOLDER_RAW, safra, FOLDER_ZIP)
+    dict_checksums = {}
+    for filename, entry in Manifest(safra).entries.items():
+        file_path = os.path.join(folder_zip, filename)
+        if os.path.isfile(file_path) and os.path.getsize(file_path) == entry['size']:
+            dict_checksums[filename] = entry['sha256']
+    return dict_checksums
+
+
+def _list_files(folder):
+    dict_files = {}
+    for root, _, files in os.walk(folder):
+        for filename in files:
+            file_path = os.path.join(root, filename)
+            dict_files[os.path.relpath(file_path, folder)] = os.path.getsize(file_path)
+    return dict(sorted(dict_files.items()))
+
+
+def _table_safra(table):
+    with connect_db(db_uri=DB_URI) as db:
+        exists = db.execute('SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = ? AND database_name = current_database()', [table]).fetchone()[0]
+        if not exists:
+            return None
+        row = db.execute(f'SELECT safra FROM {table} LIMIT 1').fetchone()
+    return row[0] if row else None
+
+
+def _fingerprint(dict_inputs):
+    return hashlib.sha256(json.dumps(dict_inputs, sort_keys=True).encode('utf-8')).hexdigest()
@@ -0,0 +1,172 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+from dados_publicos_cnpj_receita_federal import SetupLogger
+from dados_publicos_cnpj_receita_federal.database import pipeline_session
+from dados_publicos_cnpj_receita_federal.engine import DICT_TABLE_ENGINE
+from dados_publicos_cnpj_receita_federal.engine._core import match_zip_patterns
+from dados_publicos_cnpj_receita_federal.io.downloader import _download_url
+from dados_publicos_cnpj_receita_federal.io.downloader import list_download_links
+from dados_publicos_cnpj_receita_federal.io.manifest import Manifest
+from dados_publicos_cnpj_receita_federal.io.requests_config import create_custom_session
+from dados_publicos_cnpj_receita_federal.io.unzip import unzip_file
+from dados_publicos_cnpj_receita_federal.settings import DB_URI
+from dados_publicos_cnpj_receita_federal.settings import DICT_TABLE_ZIP_PATTERNS
+from dados_publicos_cnpj_receita_federal.settings import FOLDER_UNZIP
+from dados_publicos_cnpj_receita_federal.settings import FOLDER_ZIP
+from dados_publicos_cnpj_receita_federal.settings import LIST_REFERENCE_ZIP_PATTERNS
+from dados_publicos_cnpj_receita_federal.settings import PATH_FOLDER_RAW
+
+_log = SetupLogger('pipeline.scheduler')
+
+
+def dependencias_por_tabela(list_filenames, tables=None):
+    """
+    Agrupa os arquivos .zip de uma safra pelas tabelas que dependem deles.
+
+    Cada tabela depende dos seus próprios arquivos (ver `DICT_TABLE_ZIP_PATTERNS`) e dos arquivos das tabelas de
+    referência (`LIST_REFERENCE_ZIP_PATTERNS`), que são carregadas por `process_mapping` junto com qualquer tabela.
+
+    Parâmetros:
+    ----------
+    list_filenames : list
+        Os nomes dos arquivos .zip disponíveis para a safra.
+
+    tables : list, opcional
+        As tabelas a considerar. Se não for fornecida, todas as tabelas de `DICT_TABLE_ZIP_PATTERNS` são consideradas.
+
+    Retorna:
+    -------
+    dict
+        Um dicionário `{tabela: set(arquivos)}`.
+
+    Exemplo:
+    --------
+    dependencias_por_tabela(['Empresas0.zip', 'Paises.zip', 'Simples.zip'])
+    # {'empresas': {'Empresas0.zip', 'Paises.zip'}, 'simples': {'Simples.zip', 'Paises.zip'}, ...}
+    """
+    tables = tables or list(DICT_TABLE_ZIP_PATTERNS)
+    set_references = {filename for filename in list_filenames if match_zip_patterns(filename, LIST_REFERENCE_ZIP_PATTERNS)}
+    return {table: {filename for filename in list_filenames if match_zip_patterns(filename, DICT_TABLE_ZIP_PATTERNS[table])} | set_references for table in tables}
+
+
+def run_pipeline(safra, tables=None, max_workers=4, segments=1, revalidate=False, unzip_workers=1, source='unzip'):
+    """
+    Executa download, descompactação e carregamento de uma safra com as etapas sobrepostas.
+
+    Em vez de esperar o fim de `download_safra` para chamar `unzip_safra` e depois cada `processar_*`, esta função
+    acompanha cada arquivo individualmente:
+    1. Os arquivos são baixados em um pool de `max_workers` threads, com os arquivos de referência e as tabelas menores
+       primeiro.
+    2. Cada .zip é descompactado assim que termina de ser baixado (ou imediatamente, se já estava completo).
+    3. Assim que todos os arquivos de uma tabela (e os de referência) estão descompactados, o `processar_*`
+       correspondente é iniciado enquanto os demais downloads continuam.
+
+    Os `processar_*` são executados um de cada vez, pois todos gravam no mesmo arquivo DuckDB, e compartilham uma única
+    conexão (`pipeline_session`), com um checkpoint ao final de cada tabela. Ao final, são registrados os tempos de cada
+    etapa por tabela.
+
+    Parâmetros:
+    ----------
+    safra : str
+        O identificador do lote/período dos dados.
+
+    tables : list, opcional
+        As tabelas a processar (ex: `['empresas', 'simples']`). Se não for fornecida, todas são processadas.
+
+    max_workers : int, opcional, padrão=4
+        O número de downloads simultâneos.
+
+    segments : int, opcional, padrão=1
+        O número de conexões por arquivo grande (ver `download_file`).
+
+    revalidate : bool, opcional, padrão=False
+        Revalida os arquivos do manifesto com requisições condicionais (ver `download_safra`).
+
+    unzip_workers : int, opcional, padrão=1
+        O número de processos usados para descompactar os arquivos (ver `unzip_safra`).
+
+    source : str, opcional, padrão='unzip'
+        Com `'zip'`, a etapa de descompactação é omitida e cada tabela é carregada diretamente dos arquivos .zip
+        (ver `load_zip_to_duckdb`) assim que eles terminam de ser baixados.
+
+    Retorna:
+    -------
+    dict
+        Um dicionário `{tabela: segundos}` com o instante, a partir do início, em que cada tabela ficou pronta.
+
+    Exemplo:
+    --------
+    run_pipeline('2024-10', max_workers=4)
+    """
+    start = time.time()
+    PATH_FOLDER_RAW_SAFRA = os.path.join(PATH_FOLDER_RAW, safra)
+    PATH_FOLDER_RAW_SAFRA_ZIP = os.path.join(PATH_FOLDER_RAW_SAFRA, FOLDER_ZIP)
+    PATH_FOLDER_RAW_SAFRA_UNZIP = os.path.join(PATH_FOLDER_RAW_SAFRA, FOLDER_UNZIP)
+    os.makedirs(PATH_FOLDER_RAW_SAFRA_ZIP, exist_ok=True)
+    os.makedirs(PATH_FOLDER_RAW_SAFRA_UNZIP, exist_ok=True)
+
+    session = create_custom_session(pool_maxsize=max(max_workers * segments, 10))
+    manifest = Manifest(safra)
+    dict_urls = {os.path.split(url)[1]: url for url in list_download_links(safra=safra, session=session)}
+    dict_dependencies = dependencias_por_tabela(list(dict_urls), tables=tables)
+    set_needed = set().union(*dict_dependencies.values())
+
+    def priority(filename):
+        if match_zip_patterns(filename, LIST_REFERENCE_ZIP_PATTERNS):
+            return (0, filename)
+        return (min(len(files) for files in dict_dependencies.values() if filename in files), filename)
+
+    _log.info(f"run_pipeline | '{safra=}' | {len(set_needed)} arquivos para as tabelas {list(dict_dependencies)}")
+    set_unzipped = set()
+    set_started = set()
+    dict_ready = {}
+    dict_futures = {}
+    unzip_executor = ProcessPoolExecutor(max_workers=unzip_workers) if unzip_workers > 1 else ThreadPoolExecutor(max_workers=1)
+    with pipeline_session(DB_URI) as db_session, ThreadPoolExecutor(max_workers=max_workers) as download_executor, unzip_executor, ThreadPoolExecutor(max_workers=1) as engine_executor:
+        for filename in sorted(set_needed, key=priority):
+            future = download_executor.submit(_download_url, url=dict_urls[filename], path=PATH_FOLDER_RAW_SAFRA_ZIP, session=session, segments=segments, manifest=manifest, revalidate=revalidate)
+            dict_futures[future] = ('download', filename)
+
+        while dict_futures:
+            done, _ = wait(dict_futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, name = dict_futures.pop(future)
+                try:
+                    future.result()
+                except Exception:
+                    _log.critical(f"run_pipeline | '{safra=}' | falha na etapa '{stage}' de {name}")
+                    for pending in dict_futures:
+                        pending.cancel()
+                    raise
+
+                if stage == 'download' and source == 'zip':
+                    set_unzipped.add(name)
+                elif stage == 'download':
+                    _log.info(f"run_pipeline | '{safra=}' | {name} baixado em {time.time() - start:.1f} segundos, descompactando")
+                    future_unzip = unzip_executor.submit(unzip_file, file_path=os.path.join(PATH_FOLDER_RAW_SAFRA_ZIP, name), path_folder_unzip=PATH_FOLDER_RAW_SAFRA_UNZIP, progress=unzip_workers <= 1)
+                    dict_futures[future_unzip] = ('unzip', name)
+                elif stage == 'unzip':
+                    set_unzipped.add(name)
+                elif stage == 'engine':
+                    dict_ready[name] = time.time() - start
+                    _log.info(f"run_pipeline | '{safra=}' | tabela {name} pronta em {dict_ready[name]:.1f} segundos")
+
+            for table, files in dict_dependencies.items():
+                if table not in set_started and files <= set_unzipped:
+                    set_started.add(table)
+                    _log.info(f"run_pipeline | '{safra=}' | arquivos de {table} prontos em {time.time() - start:.1f} segundos, iniciando o carregamento")
+                    future_engine = engine_executor.submit(_processar_tabela, table=table, safra=safra, source=source, db_session=db_session)
+                    dict_futures[future_engine] = ('engine', table)
+
+    _log.info(f"run_pipeline | '{safra=}' | pipeline concluída em {time.time() - start:.1f} segundos")
+    return dict_ready
+
+
+def _processar_tabela(table, safra, source, db_session):
+    DICT_TABLE_ENGINE[table](safra=safra, source=source)
+    db_session.checkpoint(table)
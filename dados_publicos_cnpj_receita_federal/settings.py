@@ -8,10 +8,64 @@ os.makedirs(PATH_FOLDER_RAW, exist_ok=True)
 
 FOLDER_ZIP = 'zip'
 FOLDER_UNZIP = 'unzip'
+FOLDER_UNZIP_STATE = 'unzip_state'
 FOLDER_UNLOAD = 'unload'
+# bancos DuckDB de cada tabela na carga paralela (ver `build_parallel`), dentro da pasta da safra
+FOLDER_DB_PARTS = 'db_parts'
+
+FILE_MANIFEST = 'manifest.json'
+FILE_LISTING_CACHE = 'listings.json'
+# cache local do snapshot da CNAE, gerado por `atualizar_cnaes` (ver `io.cnaes`)
+FILE_CNAES_CACHE = 'cnaes.json'
+
+LISTING_CACHE_TTL = int(os.environ.get('DADOS_PUBLICOS_CNPJ_LISTING_CACHE_TTL', 3600))
+
+# codificação dos arquivos na pasta `unzip`: 'utf-8' (convertidos na descompactação) ou 'latin-1' (cópia byte a byte
+# do .zip, lidos pelo DuckDB sem conversão prévia)
+UNZIP_ENCODING = os.environ.get('DADOS_PUBLICOS_CNPJ_UNZIP_ENCODING', 'utf-8').lower()
+
+# esquema tipado (opcional): as colunas de data são gravadas como DATE em vez do texto 'YYYY-MM-DD'
+TYPED_DATES = os.environ.get('DADOS_PUBLICOS_CNPJ_TYPED_DATES', 'false').lower() in ('1', 'true')
+# chaves inteiras (opcional): cnpj_basico INTEGER e cnpj BIGINT, tabelas ordenadas pela chave e views `<tabela>_texto`
+# com as chaves no formato texto com zeros à esquerda
+TYPED_KEYS = os.environ.get('DADOS_PUBLICOS_CNPJ_TYPED_KEYS', 'false').lower() in ('1', 'true')
+# carga em lotes (opcional): número de CSVs descompactados carregados por vez em `empresas`, `estabelecimentos` e
+# `socios`, para limitar a memória e a pasta temporária de cada passada; 0 carrega todos numa única passada
+LOAD_BATCH_FILES = int(os.environ.get('DADOS_PUBLICOS_CNPJ_LOAD_BATCH_FILES', 0))
+# histórico (opcional): cada carga também é arquivada em `<tabela>_historico`, com todas as safras e o hash de cada
+# linha, para `diff_safras` e `as_of` (ver `engine.historico`)
+HISTORY = os.environ.get('DADOS_PUBLICOS_CNPJ_HISTORY', 'false').lower() in ('1', 'true')
+
+# perfil de recursos do DuckDB, aplicado a todas as conexões (ver `database.resource_profile`). Com `MEMORY_LIMIT` e
+# `THREADS` vazios, os valores são dimensionados a partir da memória (`MEMORY_FRACTION` dela) e dos processadores
+# detectados, considerando os limites do contêiner (cgroup). `TEMP_DIRECTORY` vazio mantém a pasta padrão do DuckDB
+# (`<banco>.tmp`), usada quando uma consulta excede a memória; `MAX_TEMP_DIRECTORY_SIZE` vazio mantém o padrão do DuckDB
+DUCKDB_MEMORY_LIMIT = os.environ.get('DADOS_PUBLICOS_CNPJ_DUCKDB_MEMORY_LIMIT', '')
+DUCKDB_MEMORY_FRACTION = float(os.environ.get('DADOS_PUBLICOS_CNPJ_DUCKDB_MEMORY_FRACTION', 0.7))
+DUCKDB_THREADS = os.environ.get('DADOS_PUBLICOS_CNPJ_DUCKDB_THREADS', '')
+DUCKDB_TEMP_DIRECTORY = os.environ.get('DADOS_PUBLICOS_CNPJ_DUCKDB_TEMP_DIRECTORY', '')
+DUCKDB_MAX_TEMP_DIRECTORY_SIZE = os.environ.get('DADOS_PUBLICOS_CNPJ_DUCKDB_MAX_TEMP_DIRECTORY_SIZE', '')
+# as cargas não dependem da ordem de inserção (a ordenação é feita com ORDER BY, e `unload_safra` a reativa para os seus
+# blocos), o que reduz a memória das cargas paralelas
+DUCKDB_PRESERVE_INSERTION_ORDER = os.environ.get('DADOS_PUBLICOS_CNPJ_DUCKDB_PRESERVE_INSERTION_ORDER', 'false').lower() in ('1', 'true')
 
 TABLE_NAME_EMPRESAS = 'empresas'
 TABLE_NAME_ESTABELECIMENTOS = 'estabelecimentos'
 TABLE_NAME_SIMPLES = 'simples'
 TABLE_NAME_SOCIOS = 'socios'
 TABLE_NAME_REGIME_TRIBUTARIO = 'regime_tributario'
+# safra de origem de cada tabela de referência carregada por `process_mapping`
+TABLE_NAME_REFERENCIAS_VERSAO = 'referencias_versao'
+# etapas concluídas de cada safra e a impressão digital das suas entradas (ver `run_resumable`)
+TABLE_NAME_PIPELINE_ESTADO = 'pipeline_estado'
+# arquivos de origem (e SHA-256) e versão do engine do último build de cada tabela (ver `processar_incremental`)
+TABLE_NAME_TABELAS_VERSAO = 'tabelas_versao'
+
+DICT_TABLE_ZIP_PATTERNS = {
+    TABLE_NAME_EMPRESAS: ['Empresas*.zip'],
+    TABLE_NAME_ESTABELECIMENTOS: ['Estabelecimentos*.zip'],
+    TABLE_NAME_SIMPLES: ['Simples*.zip'],
+    TABLE_NAME_SOCIOS: ['Socios*.zip'],
+    TABLE_NAME_REGIME_TRIBUTARIO: ['Imunes*.zip', 'Lucro*.zip'],
+}
+LIST_REFERENCE_ZIP_PATTERNS = ['Motivos*.zip', 'Municipios*.zip', 'Naturezas*.zip', 'Paises*.zip', 'Qualificacoes*.zip']
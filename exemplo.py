@@ -1,3 +1,4 @@
+from dados_publicos_cnpj_receita_federal.database import pipeline_session
 from dados_publicos_cnpj_receita_federal.engine import processar_empresas
 from dados_publicos_cnpj_receita_federal.engine import processar_estabelecimentos
 from dados_publicos_cnpj_receita_federal.engine import processar_regime_tributario
@@ -16,13 +17,13 @@ def main():
     download_safra(safra=safra)
     unzip_safra(safra=safra)
 
-    processar_empresas(safra=safra)
-    processar_estabelecimentos(safra=safra)
-    processar_regime_tributario(safra=safra)
-    processar_simples(safra=safra)
-    processar_socios(safra=safra)
+    # uma única conexão com o DuckDB para todas as etapas, com um checkpoint ao final de cada tabela
+    with pipeline_session() as session:
+        for processar in [processar_empresas, processar_estabelecimentos, processar_regime_tributario, processar_simples, processar_socios]:
+            processar(safra=safra)
+            session.checkpoint(processar.__name__)
 
-    unload_safra(safra=safra)
+        unload_safra(safra=safra)
 
 
 if __name__ == '__main__':
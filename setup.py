@@ -11,6 +11,8 @@ setup(
     name='dados_publicos_cnpj_receita_federal',
     version='0.1.0',
     packages=find_packages(),
+    package_data={'dados_publicos_cnpj_receita_federal': ['data/*.json']},
+    include_package_data=True,
     author='adntayer',
     description='Este projeto tem como objetivo extrair informações do Cadastro Nacional da Pessoa Jurídica (CNPJ) disponibilizadas pela Receita Federal do Brasil',
     long_description=open('README.md').read(),
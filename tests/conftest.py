@@ -0,0 +1,105 @@
+import hashlib
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from dados_publicos_cnpj_receita_federal.io import downloader
+from dados_publicos_cnpj_receita_federal.io import listing_cache
+from dados_publicos_cnpj_receita_federal.io import manifest
+from dados_publicos_cnpj_receita_federal.io import unzip
+from dados_publicos_cnpj_receita_federal.pipeline import resumable
+from dados_publicos_cnpj_receita_federal.pipeline import scheduler
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    """
+    Serve os arquivos de uma pasta com suporte opcional a `Range` e a requisições condicionais (`If-None-Match`).
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        range_header = self.headers.get('Range')
+        self.server.requests.append((self.command, self.path, range_header))
+        file_path = os.path.join(self.server.folder, self.path.lstrip('/'))
+        if not os.path.isfile(file_path):
+            self.send_error(404)
+            return
+
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        start, end, status = 0, len(data) - 1, 200
+        if range_header and self.server.accept_ranges:
+            match = re.match(r'bytes=(\d+)-(\d*)', range_header)
+            # `range_from_start` simula um servidor que responde 206 sempre a partir do byte 0
+            start = 0 if self.server.range_from_start else int(match[1])
+            end = min(int(match[2]), len(data) - 1) if match[2] else len(data) - 1
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        if self.server.accept_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        if send_body:
+            self.wfile.write(data[start : end + 1])
+
+
+@pytest.fixture
+def http_server(tmp_path):
+    """
+    Servidor HTTP local que serve os arquivos de `http_server.folder`, simulando o servidor da Receita Federal.
+    """
+    folder = tmp_path / 'server'
+    folder.mkdir()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _FileHandler)
+    server.folder = str(folder)
+    server.accept_ranges = True
+    server.range_from_start = False
+    server.requests = []
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def path_raw(tmp_path, monkeypatch):
+    """
+    Redireciona a pasta de dados (`PATH_FOLDER_RAW`) dos módulos para uma pasta temporária.
+    """
+    path = tmp_path / 'raw'
+    path.mkdir()
+    for module in [downloader, listing_cache, manifest, resumable, scheduler, unzip]:
+        monkeypatch.setattr(module, 'PATH_FOLDER_RAW', str(path))
+    for module in [resumable, scheduler]:
+        monkeypatch.setattr(module, 'DB_URI', str(path / 'db.duckdb'))
+    return path
@@ -0,0 +1,109 @@
+import io
+import zipfile
+
+import pytest
+
+from dados_publicos_cnpj_receita_federal.engine import _core
+from dados_publicos_cnpj_receita_federal.engine import empresas
+from dados_publicos_cnpj_receita_federal.engine import estabelecimentos
+from dados_publicos_cnpj_receita_federal.engine import historico
+from dados_publicos_cnpj_receita_federal.engine import incremental
+from dados_publicos_cnpj_receita_federal.engine import referencias
+from dados_publicos_cnpj_receita_federal.engine import regime_tributario
+from dados_publicos_cnpj_receita_federal.engine import simples
+from dados_publicos_cnpj_receita_federal.engine import socios
+from dados_publicos_cnpj_receita_federal.io import cnaes
+from dados_publicos_cnpj_receita_federal.io import manifest
+from dados_publicos_cnpj_receita_federal.io import unzip
+from dados_publicos_cnpj_receita_federal.io.unzip import unzip_safra
+
+SAFRA = '2024-10'
+
+DICT_ZIPS = {
+    'Empresas0.zip': {
+        'K3241.K03200Y0.D41109.EMPRECSV': [
+            '"41273600";"SÃO JOÃO COMERCIO LTDA";"2062";"49";"1000,50";"01";""',
+            '"12345";"EMPRESA DEMAIS";"2046";"05";"0,00";"05";""',
+        ],
+    },
+    'Empresas1.zip': {
+        'K3241.K03200Y1.D41109.EMPRECSV': [
+            '"99999999";"EMPRESA SEM PORTE";"9999";"99";"25";"";"UNIÃO"',
+        ],
+    },
+    'Estabelecimentos0.zip': {
+        'K3241.K03200Y0.D41109.ESTABELE': [
+            '"41273600";"0001";"06";"1";"LOJA";"02";"20200115";"00";"";"";"20200110";"4711302";"4712100,4721102";"RUA";"DAS FLORES";"10";"";"CENTRO";"01001000";"SP";"7107";"11";"12345678";"";"";"";"";"a@b.com";"";""',
+            '"12345";"2";"7";"2";"";"08";"20231231";"01";"";"105";"19990101";"6201501";"";"AVENIDA";"BRASIL";"S/N";"SALA 1";"";"20000000";"RJ";"6001";"";"";"";"";"";"";"";"";"00000000"',
+        ],
+    },
+    'Simples.zip': {
+        'F.K03200$W.SIMPLES.CSV.D41109': [
+            '"41273600";"S";"20200101";"00000000";"N";"00000000";"00000000"',
+            '"12345";"N";"20070701";"20091231";"S";"20090701";"20100101"',
+        ],
+    },
+    'Socios0.zip': {
+        'K3241.K03200Y0.D41109.SOCIOCSV': [
+            '"41273600";"2";"JOÃO DA SILVA";"***123456**";"49";"20200115";"";"***000000**";"";"00";"4"',
+            '"12345";"1";"EMPRESA SOCIA";"00000000000191";"22";"00000000";"105";"";"";"";"0"',
+        ],
+    },
+    'Qualificacoes.zip': {'F.K03200$Z.D41109.QUALSCSV': ['"05";"Administrador"', '"22";"Sócio"', '"49";"Sócio-Administrador"', '"00";"Não informada"']},
+    'Paises.zip': {'F.K03200$Z.D41109.PAISCSV': ['"105";"BRASIL"']},
+    'Naturezas.zip': {'F.K03200$Z.D41109.NATJUCSV': ['"2062";"Sociedade Empresária Limitada"', '"2046";"Sociedade Anônima Aberta"']},
+    'Municipios.zip': {'F.K03200$Z.D41109.MUNICCSV': ['"7107";"SAO PAULO"', '"6001";"RIO DE JANEIRO"']},
+    'Motivos.zip': {'F.K03200$Z.D41109.MOTICSV': ['"00";"SEM MOTIVO"', '"01";"EXTINCAO POR ENCERRAMENTO LIQUIDACAO VOLUNTARIA"']},
+    'Lucro Presumido.zip': {'Lucro Presumido.csv': ['"2022";"41.273.600/0001-06";"";"LUCRO PRESUMIDO";"1"']},
+    'Lucro Arbitrado.zip': {'Lucro Arbitrado.csv': ['ano,cnpj,cnpj_da_scp,forma_de_tributacao,quantidade_de_escrituracoes', '2021,00.012.345/0002-07,,LUCRO ARBITRADO,2']},
+    'Lucro Real.zip': {'Lucro Real.csv': ['ano,cnpj,cnpj_da_scp,forma_de_tributacao,quantidade_de_escrituracoes', '2022,99.999.999/0001-99,,LUCRO REAL,1']},
+    'Imunes e isentas.zip': {'Imunes e isentas.csv': ['"2020";"41.273.600/0001-06";"";"IMUNE DO IRPJ";"1"']},
+}
+
+# subclasses no formato da API do IBGE (ver `atualizar_cnaes`), gravadas como o cache local da CNAE
+LIST_CNAE_SUBCLASSES = [
+    {
+        'id': '4711302',
+        'descricao': 'COMÉRCIO VAREJISTA DE MERCADORIAS EM GERAL - SUPERMERCADOS',
+        'classe': {
+            'id': '47113',
+            'descricao': 'COMÉRCIO VAREJISTA DE MERCADORIAS EM GERAL - HIPERMERCADOS E SUPERMERCADOS',
+            'grupo': {
+                'id': '471',
+                'descricao': 'COMÉRCIO VAREJISTA NÃO-ESPECIALIZADO',
+                'divisao': {'id': '47', 'descricao': 'COMÉRCIO VAREJISTA', 'secao': {'id': 'G', 'descricao': 'COMÉRCIO; REPARAÇÃO DE VEÍCULOS AUTOMOTORES E MOTOCICLETAS'}},
+            },
+        },
+    },
+]
+
+LIST_ENGINE_MODULES = [empresas, estabelecimentos, historico, incremental, referencias, regime_tributario, simples, socios]
+
+
+@pytest.fixture
+def safra_sintetica(tmp_path, monkeypatch):
+    """
+    Uma safra sintética e pequena (arquivos .zip e CSVs descompactados) com um banco DuckDB vazio em `tmp_path`.
+    """
+    path_raw = tmp_path / 'raw'
+    folder_zip = path_raw / SAFRA / 'zip'
+    folder_zip.mkdir(parents=True)
+    for zip_name, members in DICT_ZIPS.items():
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+            for member, lines in members.items():
+                zf.writestr(member, ('\n'.join(lines) + '\n').encode('ISO-8859-1'))
+        (folder_zip / zip_name).write_bytes(buffer.getvalue())
+
+    cnaes.write_snapshot(str(path_raw / 'cnaes.json'), {'versao': 'teste', 'fonte': 'teste', 'itens': cnaes.normalizar_subclasses(LIST_CNAE_SUBCLASSES)})
+
+    db_uri = str(tmp_path / 'db.duckdb')
+    monkeypatch.setattr(unzip, 'PATH_FOLDER_RAW', str(path_raw))
+    monkeypatch.setattr(_core, 'PATH_FOLDER_RAW', str(path_raw))
+    monkeypatch.setattr(cnaes, 'PATH_FOLDER_RAW', str(path_raw))
+    monkeypatch.setattr(incremental, 'PATH_FOLDER_RAW', str(path_raw))
+    monkeypatch.setattr(manifest, 'PATH_FOLDER_RAW', str(path_raw))
+    for module in LIST_ENGINE_MODULES:
+        monkeypatch.setattr(module, 'DB_URI', db_uri)
+    unzip_safra(SAFRA)
+    return db_uri
@@ -0,0 +1,365 @@
+import datetime
+import io
+import os
+import shutil
+import zipfile
+from unittest.mock import patch
+
+import duckdb
+import pytest
+
+from dados_publicos_cnpj_receita_federal import database
+from dados_publicos_cnpj_receita_federal.database import connect_db
+from dados_publicos_cnpj_receita_federal.database import pipeline_session
+from dados_publicos_cnpj_receita_federal.engine import _core
+from dados_publicos_cnpj_receita_federal.engine import as_of
+from dados_publicos_cnpj_receita_federal.engine import carregar_referencias
+from dados_publicos_cnpj_receita_federal.engine import diff_safras
+from dados_publicos_cnpj_receita_federal.engine import empresas
+from dados_publicos_cnpj_receita_federal.engine import estabelecimentos
+from dados_publicos_cnpj_receita_federal.engine import processar_empresas
+from dados_publicos_cnpj_receita_federal.engine import processar_estabelecimentos
+from dados_publicos_cnpj_receita_federal.engine import processar_incremental
+from dados_publicos_cnpj_receita_federal.engine import processar_regime_tributario
+from dados_publicos_cnpj_receita_federal.engine import processar_simples
+from dados_publicos_cnpj_receita_federal.engine import processar_socios
+from dados_publicos_cnpj_receita_federal.engine._core import compile_select
+from dados_publicos_cnpj_receita_federal.engine._core import load_data_to_duckdb
+from dados_publicos_cnpj_receita_federal.engine.historico import arquivar_safra
+from dados_publicos_cnpj_receita_federal.io import cnaes
+from dados_publicos_cnpj_receita_federal.io.unzip import unzip_safra
+from dados_publicos_cnpj_receita_federal.pipeline import parallel
+from tests.engine.conftest import SAFRA
+
+DICT_COLUMN_TYPES = {
+    'cnpj_basico': 'VARCHAR',
+    'razao_social': 'VARCHAR',
+    'capital_social': 'DOUBLE',
+}
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'latin-1'])
+def test_load_data_to_duckdb_encoding(tmp_path, encoding):
+    path = tmp_path / 'K3241.K03200Y0.D41109.EMPRECSV'
+    path.write_bytes('"00000001";"SÃO JOÃO LTDA";"1000,50"\n"00000002";"AÇÚCAR";"0,00"\n'.encode(encoding))
+    db_uri = str(tmp_path / 'db.duckdb')
+
+    with patch.object(_core, 'process_mapping'):
+        load_data_to_duckdb(db_uri=db_uri, path=str(tmp_path / '*.EMPRECSV'), dict_column_types=DICT_COLUMN_TYPES, table_name='empresas', safra='2024-10', encoding=encoding)
+
+    with duckdb.connect(db_uri) as db:
+        rows = db.sql('SELECT * FROM empresas ORDER BY cnpj_basico').fetchall()
+    assert rows == [('00000001', 'SÃO JOÃO LTDA', 1000.5, '2024-10'), ('00000002', 'AÇÚCAR', 0.0, '2024-10')]
+
+
+def test_load_data_to_duckdb_typed_dates(tmp_path):
+    path = tmp_path / 'F.K03200$W.SIMPLES.CSV.D41109'
+    path.write_text('"1";"20200131"\n"2";"00000000"\n"3";""\n"4";"20201332"\n"5";"2020"\n', encoding='utf-8')
+    db_uri = str(tmp_path / 'db.duckdb')
+
+    with patch.object(_core, 'process_mapping'):
+        dict_invalid_dates = load_data_to_duckdb(
+            db_uri=db_uri,
+            path=str(path),
+            dict_column_types={'cnpj_basico': 'VARCHAR', 'data_opcao': 'VARCHAR'},
+            table_name='simples',
+            safra='2024-10',
+            encoding='utf-8',
+            dict_transforms={'data_opcao': {'date': 'YYYYMMDD', 'null_if': '00000000'}},
+            typed_dates=True,
+        )
+
+    assert dict_invalid_dates == {'data_opcao': 2}
+    with duckdb.connect(db_uri) as db:
+        assert db.sql("SELECT column_type FROM (DESCRIBE simples) WHERE column_name = 'data_opcao'").fetchone()[0] == 'DATE'
+        rows = db.sql('SELECT cnpj_basico, data_opcao FROM simples ORDER BY cnpj_basico').fetchall()
+    assert rows == [('1', datetime.date(2020, 1, 31)), ('2', None), ('3', None), ('4', None), ('5', None)]
+
+
+@pytest.mark.parametrize('processar', [processar_estabelecimentos, processar_simples, processar_socios])
+def test_processar_typed_dates_from_zip_matches_unzip(safra_sintetica, processar):
+    table_name = processar.__name__.replace('processar_', '')
+    processar(SAFRA, typed_dates=True)
+    expected = _dump(safra_sintetica, table_name)
+    assert 'DATE' in [column[1] for column in expected[0]]
+
+    processar(SAFRA, source='zip', typed_dates=True)
+    assert _dump(safra_sintetica, table_name) == expected
+
+
+def test_compile_select():
+    dict_column_types = {'codigo': 'VARCHAR', 'data': 'VARCHAR', 'valor': 'DOUBLE'}
+    dict_transforms = {
+        'codigo': {'lpad': 3},
+        'data': {'date': 'YYYYMMDD', 'null_if': '00000000'},
+        'descricao': {'column': 'codigo', 'map': {'001': 'UM'}, 'default': 'OUTROS'},
+        'referencia': {'column': 'codigo', 'lookup': ('ref', 'nome')},
+        'chave': {'concat': ['codigo', 'data']},
+    }
+    with duckdb.connect() as db:
+        db.execute("CREATE TABLE ref AS SELECT * FROM (VALUES (2, 'DOIS')) AS t(codigo, nome)")
+        db.execute("CREATE TABLE src AS SELECT * FROM (VALUES ('1', '20240131', '1,5'), ('2', '00000000', '0')) AS t(codigo, data, valor)")
+        relation = db.sql(compile_select(dict_column_types=dict_column_types, safra='2024-10', relation='src', dict_transforms=dict_transforms))
+        assert relation.columns == ['codigo', 'data', 'valor', 'safra', 'descricao', 'referencia', 'chave']
+        assert relation.order('codigo').fetchall() == [
+            ('001', '2024-01-31', 1.5, '2024-10', 'UM', None, '0012024-01-31'),
+            ('002', None, 0.0, '2024-10', 'OUTROS', 'DOIS', None),
+        ]
+
+
+@pytest.mark.parametrize('source', ['unzip', 'zip'])
+def test_process_mapping_typed(safra_sintetica, source):
+    _core.process_mapping(safra_sintetica, SAFRA, source=source)
+
+    with duckdb.connect(safra_sintetica) as db:
+        assert db.sql('DESCRIBE motivos').fetchall()[0][:2] == ('codigo', 'INTEGER')
+        assert db.sql('SELECT * FROM motivos ORDER BY codigo').fetchall() == [(0, 'SEM MOTIVO'), (1, 'EXTINCAO POR ENCERRAMENTO LIQUIDACAO VOLUNTARIA')]
+
+
+@pytest.mark.parametrize('source', ['unzip', 'zip'])
+def test_process_mapping_missing_files(safra_sintetica, source):
+    with pytest.raises(Exception, match="Verifique se 'safra' existe"):
+        _core.process_mapping(safra_sintetica, '1900-01', source=source)
+
+
+def test_process_mapping_versioned_by_safra(safra_sintetica, tmp_path):
+    processar_empresas(SAFRA)
+    with duckdb.connect(safra_sintetica) as db:
+        versions = _core.reference_versions(db)
+    assert {versions[table_name][0] for table_name in _core.DICT_MAPPING_TABLES} == {SAFRA}
+
+    processar_socios(SAFRA)
+    with duckdb.connect(safra_sintetica) as db:
+        assert _core.reference_versions(db) == versions
+
+    shutil.copytree(tmp_path / 'raw' / SAFRA, tmp_path / 'raw' / '2024-11')
+    dict_referencias = carregar_referencias('2024-11')
+    assert dict_referencias['municipios'] == {7107: 'SAO PAULO', 6001: 'RIO DE JANEIRO'}
+    assert dict_referencias['cnaes'] == {'47113': 'COMÉRCIO VAREJISTA DE MERCADORIAS EM GERAL - HIPERMERCADOS E SUPERMERCADOS'}
+    with duckdb.connect(safra_sintetica) as db:
+        versions = _core.reference_versions(db)
+    assert {versions[table_name][0] for table_name in _core.DICT_MAPPING_TABLES} == {'2024-11'}
+
+    with patch.object(_core, '_iter_zip_csv_chunks') as mock_zip, patch.object(_core, '_read_csv_clause') as mock_csv:
+        assert carregar_referencias('2024-11') == dict_referencias
+    mock_zip.assert_not_called()
+    mock_csv.assert_not_called()
+
+
+def test_process_mapping_cnaes_snapshot(safra_sintetica):
+    _core.process_mapping(safra_sintetica, SAFRA)
+    with duckdb.connect(safra_sintetica) as db:
+        assert db.sql('SELECT nivel, codigo, codigo_pai FROM cnaes_hierarquia ORDER BY codigo').fetchall() == [('divisao', '47', 'G'), ('grupo', '471', '47'), ('classe', '47113', '471'), ('subclasse', '4711302', '47113'), ('secao', 'G', None)]
+        assert db.sql('SELECT * FROM cnaes').fetchall() == [('47113', 'COMÉRCIO VAREJISTA DE MERCADORIAS EM GERAL - HIPERMERCADOS E SUPERMERCADOS')]
+        assert _core.reference_versions(db)['cnaes'][0] == 'teste'
+
+
+def test_process_mapping_bundled_cnaes_snapshot(safra_sintetica, tmp_path):
+    # sem o cache local, vale o snapshot distribuído com o pacote, que tem apenas as seções e divisões
+    os.remove(tmp_path / 'raw' / 'cnaes.json')
+    with patch.object(_core._log, 'warning') as mock_warning:
+        processar_empresas(SAFRA)
+    mock_warning.assert_called_once()
+    with duckdb.connect(safra_sintetica) as db:
+        assert db.sql('SELECT nivel, COUNT(*) FROM cnaes_hierarquia GROUP BY 1 ORDER BY 1').fetchall() == [('divisao', 87), ('secao', 21)]
+        assert db.sql("SELECT codigo_pai FROM cnaes_hierarquia WHERE codigo = '47'").fetchone() == ('G',)
+        assert db.sql('SELECT COUNT(*) FROM cnaes').fetchone() == (0,)
+        assert db.sql('SELECT COUNT(*) FROM empresas').fetchone() == (3,)
+
+
+def test_processar_enum_columns(safra_sintetica, tmp_path):
+    processar_estabelecimentos(SAFRA)
+
+    with duckdb.connect(safra_sintetica) as db:
+        dict_types = dict(db.sql('SELECT column_name, column_type FROM (DESCRIBE estabelecimentos)').fetchall())
+        assert dict_types['matriz_filial'] == "ENUM('MATRIZ', 'FILIAL')"
+        assert dict_types['uf'] == "ENUM('RJ', 'SP')"
+        assert dict_types['situacao_cadastral_motivo'].startswith('ENUM(')
+        assert dict_types['municipio'] == 'VARCHAR'
+
+        path = str(tmp_path / 'estabelecimentos.parquet')
+        db.execute(f"COPY estabelecimentos TO '{path}' (FORMAT PARQUET)")
+        encodings = db.sql(f"SELECT encodings FROM parquet_metadata('{path}') WHERE path_in_schema = 'uf'").fetchone()[0]
+    assert 'DICTIONARY' in encodings
+
+
+def _dump(db_uri, table_name):
+    with duckdb.connect(db_uri) as db:
+        columns = db.sql(f'DESCRIBE {table_name}').fetchall()
+        rows = db.sql(f'SELECT * FROM {table_name} ORDER BY ALL').fetchall()
+    return columns, rows
+
+
+@pytest.mark.parametrize('processar', [processar_empresas, processar_estabelecimentos, processar_regime_tributario, processar_simples, processar_socios])
+def test_processar_from_zip_matches_unzip(safra_sintetica, tmp_path, processar):
+    table_name = processar.__name__.replace('processar_', '')
+    processar(SAFRA)
+    expected = _dump(safra_sintetica, table_name)
+    assert expected[1]
+
+    with duckdb.connect(safra_sintetica) as db:
+        for name in [table_name, *_core.DICT_MAPPING_TABLES]:
+            db.execute(f'DROP TABLE {name}')
+    processar(SAFRA, source='zip')
+    assert _dump(safra_sintetica, table_name) == expected
+
+
+@pytest.mark.parametrize('processar, key', [(processar_estabelecimentos, 'cnpj_basico'), (processar_regime_tributario, 'cnpj')])
+def test_processar_typed_keys(safra_sintetica, processar, key):
+    table_name = processar.__name__.replace('processar_', '')
+    processar(SAFRA)
+    expected_texto = _dump(safra_sintetica, table_name)[1]
+
+    processar(SAFRA, typed_keys=True)
+    expected = _dump(safra_sintetica, table_name)
+    with duckdb.connect(safra_sintetica) as db:
+        dict_types = dict(db.sql(f'SELECT column_name, column_type FROM (DESCRIBE {table_name})').fetchall())
+        assert dict_types['cnpj'] == 'BIGINT'
+        list_keys = [row[0] for row in db.sql(f'SELECT {key} FROM {table_name}').fetchall()]
+        assert list_keys == sorted(list_keys)
+        rows_texto = db.sql(f'SELECT * FROM {table_name}_texto ORDER BY ALL').fetchall()
+    assert rows_texto == expected_texto
+    assert all(len(row[list(dict_types).index('cnpj')]) == 14 for row in rows_texto)
+
+    processar(SAFRA, source='zip', typed_keys=True)
+    assert _dump(safra_sintetica, table_name) == expected
+
+
+def test_processar_batch_files(safra_sintetica):
+    processar_empresas(SAFRA)
+    expected = _dump(safra_sintetica, 'empresas')
+
+    processar_empresas(SAFRA, batch_files=1)
+    assert _dump(safra_sintetica, 'empresas') == expected
+
+    processar_empresas(SAFRA, typed_keys=True, batch_files=1)
+    with duckdb.connect(safra_sintetica) as db:
+        list_keys = [row[0] for row in db.sql('SELECT cnpj_basico FROM empresas').fetchall()]
+        rows_texto = db.sql('SELECT * FROM empresas_texto ORDER BY ALL').fetchall()
+    assert list_keys == sorted(list_keys)
+    assert rows_texto == expected[1]
+
+
+def test_history_diff_safras_and_as_of(safra_sintetica):
+    processar_empresas(SAFRA, history=True)
+    processar_empresas(SAFRA, history=True)
+    expected = _dump(safra_sintetica, 'empresas')[1]
+
+    # a safra seguinte: uma empresa alterada, uma removida e uma nova
+    with duckdb.connect(safra_sintetica) as db:
+        db.execute("UPDATE empresas SET safra = '2024-11'")
+        db.execute("UPDATE empresas SET razao_social = 'NOVA RAZAO' WHERE cnpj_basico = '41273600'")
+        db.execute("DELETE FROM empresas WHERE cnpj_basico = '00012345'")
+        db.execute("INSERT INTO empresas BY NAME SELECT '2024-11' AS safra, '11111111' AS cnpj_basico, 'EMPRESA NOVA' AS razao_social")
+    arquivar_safra(db_uri=safra_sintetica, table_name='empresas', safra='2024-11')
+
+    assert diff_safras(SAFRA, '2024-11') == {'empresas': {'inserido': 1, 'removido': 1, 'alterado': 1}}
+    with duckdb.connect(safra_sintetica) as db:
+        rows = db.sql('SELECT cnpj_basico, alteracao FROM empresas_diff ORDER BY 1').fetchall()
+        assert rows == [('00012345', 'removido'), ('11111111', 'inserido'), ('41273600', 'alterado')]
+
+    assert as_of('2024-12') == {'empresas': '2024-11'}
+    assert as_of(SAFRA) == {'empresas': SAFRA}
+    with duckdb.connect(safra_sintetica) as db:
+        assert db.sql('SELECT * FROM safra_2024_10.empresas ORDER BY ALL').fetchall() == expected
+
+
+def test_history_full_then_incremental(safra_sintetica, monkeypatch):
+    processar_empresas(SAFRA, history=True)
+
+    # a carga incremental arquiva a tabela com a coluna de partição, que fica fora do histórico e do hash das linhas
+    monkeypatch.setattr(empresas, 'HISTORY', True)
+    with duckdb.connect(safra_sintetica) as db:
+        db.execute("UPDATE empresas_historico SET safra = '2024-09'")
+    assert processar_incremental(SAFRA, tables=['empresas'])['empresas']['acao'] == 'completa'
+
+    with duckdb.connect(safra_sintetica) as db:
+        assert 'arquivo_origem' in [row[0] for row in db.sql('DESCRIBE empresas').fetchall()]
+        assert 'arquivo_origem' not in [row[0] for row in db.sql('DESCRIBE empresas_historico').fetchall()]
+    assert diff_safras('2024-09', SAFRA) == {'empresas': {'inserido': 0, 'removido': 0, 'alterado': 0}}
+
+
+@pytest.mark.parametrize('source', ['unzip', 'zip'])
+def test_processar_incremental_rebuilds_only_changed_files(safra_sintetica, tmp_path, source):
+    folder_zip = tmp_path / 'raw' / SAFRA / 'zip'
+    tables = ['empresas', 'regime_tributario']
+
+    dict_report = processar_incremental(SAFRA, tables=tables, source=source)
+    assert {table: report['acao'] for table, report in dict_report.items()} == {'empresas': 'completa', 'regime_tributario': 'completa'}
+    assert dict_report['empresas']['arquivos'] == ['Empresas0.zip', 'Empresas1.zip']
+    assert processar_incremental(SAFRA, tables=tables, source=source)['empresas'] == {'acao': 'pulada', 'motivo': 'arquivos inalterados', 'arquivos': []}
+
+    # a Receita republica apenas um dos arquivos de empresas
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        zf.writestr('K3241.K03200Y1.D41109.EMPRECSV', '"99999999";"EMPRESA REPUBLICADA";"9999";"99";"25";"";""\n"88888888";"EMPRESA NOVA";"2062";"49";"1,00";"01";""\n'.encode('ISO-8859-1'))
+    (folder_zip / 'Empresas1.zip').write_bytes(buffer.getvalue())
+    unzip_safra(SAFRA)
+
+    dict_report = processar_incremental(SAFRA, tables=tables, source=source)
+    assert dict_report['empresas'] == {'acao': 'parcial', 'motivo': 'arquivos alterados: Empresas1.zip', 'arquivos': ['Empresas1.zip']}
+    assert dict_report['regime_tributario']['acao'] == 'pulada'
+    with duckdb.connect(safra_sintetica) as db:
+        rows = db.sql('SELECT * EXCLUDE (arquivo_origem) FROM empresas ORDER BY ALL').fetchall()
+        assert db.sql('SELECT arquivo_origem, COUNT(*) FROM empresas GROUP BY 1 ORDER BY 1').fetchall() == [('Empresas0.zip', 2), ('Empresas1.zip', 2)]
+
+    # o resultado parcial é igual ao de uma carga completa dos mesmos arquivos, que não tem a coluna de partição
+    processar_empresas(SAFRA)
+    assert _dump(safra_sintetica, 'empresas')[1] == rows
+    assert processar_incremental(SAFRA, tables=['empresas'], source=source)['empresas']['motivo'] == 'tabela sem a coluna arquivo_origem'
+
+    os.remove(folder_zip / 'Empresas1.zip')
+    assert processar_incremental(SAFRA, tables=['empresas'], source=source)['empresas'] == {'acao': 'parcial', 'motivo': 'arquivos removidos: Empresas1.zip', 'arquivos': ['Empresas1.zip']}
+    with duckdb.connect(safra_sintetica) as db:
+        assert db.sql('SELECT DISTINCT arquivo_origem FROM empresas').fetchall() == [('Empresas0.zip',)]
+
+
+def test_processar_in_pipeline_session(safra_sintetica):
+    processar_socios(SAFRA)
+    expected = _dump(safra_sintetica, 'socios')
+
+    with pipeline_session(safra_sintetica) as session:
+        processar_socios(SAFRA)
+        session.checkpoint('socios')
+        assert _dump(safra_sintetica, 'socios') == expected
+    assert session.dict_stats['cursores'] > 1
+
+
+def test_build_parallel_matches_sequential(safra_sintetica, tmp_path, monkeypatch):
+    monkeypatch.setattr(estabelecimentos, 'TYPED_KEYS', True)
+    dict_expected = {}
+    for processar in [processar_empresas, processar_estabelecimentos, processar_regime_tributario, processar_simples, processar_socios]:
+        processar(SAFRA)
+        table_name = processar.__name__.replace('processar_', '')
+        dict_expected[table_name] = _dump(safra_sintetica, table_name)
+
+    db_uri = str(tmp_path / 'paralelo.duckdb')
+    monkeypatch.setattr(parallel, 'DB_URI', db_uri)
+    monkeypatch.setattr(parallel, 'PATH_FOLDER_RAW', str(tmp_path / 'raw'))
+    dict_elapsed = parallel.build_parallel(SAFRA, max_workers=2)
+
+    assert set(dict_elapsed) == set(dict_expected)
+    for table_name, expected in dict_expected.items():
+        assert _dump(db_uri, table_name) == expected
+    with duckdb.connect(db_uri) as db:
+        list_keys = [row[0] for row in db.sql('SELECT cnpj_basico FROM estabelecimentos').fetchall()]
+        assert list_keys == sorted(list_keys)
+        assert db.sql('SELECT cnpj FROM estabelecimentos_texto ORDER BY 1').fetchall() == [('00012345000207',), ('41273600000106',)]
+        assert db.sql('SELECT COUNT(*) FROM motivos').fetchone() == (2,)
+    assert not os.listdir(tmp_path / 'raw' / SAFRA / 'db_parts')
+
+
+def test_build_part_splits_resource_profile(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DUCKDB_MEMORY_LIMIT', '1GiB')
+    monkeypatch.setattr(database, 'DUCKDB_THREADS', '4')
+    db_uri = str(tmp_path / 'parte.duckdb')
+    settings = []
+
+    def engine(safra, source, history, db_uri):
+        with connect_db(db_uri=db_uri) as db:
+            settings.append(db.sql("SELECT current_setting('memory_limit'), current_setting('threads')").fetchone())
+
+    with patch.dict(parallel.DICT_TABLE_ENGINE, {'empresas': engine}):
+        parallel._build_part('empresas', SAFRA, 'unzip', db_uri, n_workers=4)
+    assert settings == [('256.0 MiB', 1)]
+    assert (database.DUCKDB_MEMORY_LIMIT, database.DUCKDB_THREADS) == ('1GiB', '4')
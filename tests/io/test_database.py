@@ -2,10 +2,14 @@ import unittest
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
+import duckdb
 import pytest
 
+from dados_publicos_cnpj_receita_federal import database
 from dados_publicos_cnpj_receita_federal import SetupLogger
 from dados_publicos_cnpj_receita_federal.database import connect_db
+from dados_publicos_cnpj_receita_federal.database import memory_monitor
+from dados_publicos_cnpj_receita_federal.database import pipeline_session
 
 
 @patch('duckdb.connect')
@@ -72,5 +76,55 @@ def test_connect_db_with_uri(mock_error, mock_info, mock_connect):
     mock_info.assert_any_call('connect_db | conexão fechada')
 
 
+def test_pipeline_session_shares_one_connection(tmp_path):
+    db_uri = str(tmp_path / 'db.duckdb')
+    with patch('duckdb.connect', wraps=duckdb.connect) as mock_connect:
+        with pipeline_session(db_uri) as session:
+            with connect_db(db_uri) as db:
+                db.execute('CREATE TABLE t AS SELECT 1 AS a')
+                with connect_db(db_uri) as nested:
+                    assert nested.sql('SELECT a FROM t').fetchall() == [(1,)]
+            with pipeline_session(db_uri) as nested_session:
+                assert nested_session is session
+            session.checkpoint('t')
+        mock_connect.assert_called_once_with(db_uri)
+
+    assert session.dict_stats['cursores'] == 3
+    assert session.dict_stats['checkpoints'] == 1
+    with connect_db(db_uri) as db:
+        assert db.sql('SELECT a FROM t').fetchall() == [(1,)]
+
+
+def test_resource_profile_applied_to_connections(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DUCKDB_MEMORY_LIMIT', '256MiB')
+    monkeypatch.setattr(database, 'DUCKDB_THREADS', '1')
+    monkeypatch.setattr(database, 'DUCKDB_TEMP_DIRECTORY', str(tmp_path / 'spill'))
+    db_uri = str(tmp_path / 'db.duckdb')
+
+    with memory_monitor(db_uri, 'teste', interval=0.01) as dict_peak:
+        with connect_db(db_uri) as db:
+            db.execute('CREATE TABLE t AS SELECT i, md5(CAST(i AS VARCHAR)) AS s FROM range(1000000) AS t(i) ORDER BY s')
+            settings = db.sql("SELECT current_setting('memory_limit'), current_setting('threads'), current_setting('temp_directory'), current_setting('preserve_insertion_order')").fetchone()
+    assert settings == ('256.0 MiB', 1, str(tmp_path / 'spill'), False)
+    assert dict_peak['memory_limit'] == '256.0 MiB'
+    assert dict_peak['pico_memoria'] > 0
+    assert database.detect_memory_bytes() > 0
+    assert database.detect_cpu_count() >= 1
+
+
+def test_resource_profile_split_across_workers(monkeypatch):
+    monkeypatch.setattr(database, 'DUCKDB_MEMORY_LIMIT', '8GiB')
+    monkeypatch.setattr(database, 'DUCKDB_THREADS', '8')
+    assert database.resource_profile()['memory_limit'] == '8GiB'
+    dict_profile = database.resource_profile(n_workers=4)
+    assert (dict_profile['memory_limit'], dict_profile['threads']) == ('2048MiB', 2)
+
+    monkeypatch.setattr(database, 'DUCKDB_MEMORY_LIMIT', '')
+    monkeypatch.setattr(database, 'DUCKDB_MEMORY_FRACTION', 0.5)
+    monkeypatch.setattr(database, 'detect_memory_bytes', lambda: 16 * 2**30)
+    assert database.resource_profile(n_workers=16)['memory_limit'] == '512MiB'
+    assert database.resource_profile(n_workers=16)['threads'] == 1
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,172 @@
+import hashlib
+import os
+from unittest.mock import MagicMock
+from unittest.mock import patch
+
+import pytest
+
+from dados_publicos_cnpj_receita_federal.io import downloader
+from dados_publicos_cnpj_receita_federal.io.downloader import download_file
+from dados_publicos_cnpj_receita_federal.io.downloader import download_safra
+from dados_publicos_cnpj_receita_federal.io.downloader import need_download
+from dados_publicos_cnpj_receita_federal.io.manifest import Manifest
+
+
+def _serve_files(folder, n_files=5, size=50_000):
+    contents = {}
+    for i in range(n_files):
+        name = f'Arquivo{i}.zip'
+        data = os.urandom(size + i)
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(data)
+        contents[name] = data
+    return contents
+
+
+def test_need_download_compares_size(http_server, tmp_path):
+    base_url = http_server.url
+    contents = _serve_files(http_server.folder, n_files=1)
+    local = tmp_path / 'local'
+    local.mkdir()
+
+    assert need_download(url=f'{base_url}/Arquivo0.zip', path=str(local))
+    (local / 'Arquivo0.zip').write_bytes(contents['Arquivo0.zip'])
+    assert not need_download(url=f'{base_url}/Arquivo0.zip', path=str(local))
+
+
+def test_need_download_checks_manifest_file(http_server, path_raw):
+    contents = _serve_files(http_server.folder, n_files=1)
+    url = f'{http_server.url}/Arquivo0.zip'
+    local = path_raw / '2024-10' / 'zip'
+    with patch.object(downloader, 'list_download_links', return_value=[url]):
+        download_safra('2024-10')
+    file_path = local / 'Arquivo0.zip'
+    mtime_ns = os.stat(file_path).st_mtime_ns
+    assert Manifest('2024-10').get('Arquivo0.zip')['mtime_ns'] == mtime_ns
+
+    # com o mtime registrado, o arquivo é aceito sem ler o conteúdo
+    with patch.object(downloader, 'file_sha256') as mock_sha256:
+        assert not need_download(url=url, path=str(local), manifest=Manifest('2024-10'))
+    mock_sha256.assert_not_called()
+
+    # mesmo tamanho, conteúdo diferente
+    file_path.write_bytes(bytes(len(contents['Arquivo0.zip'])))
+    os.utime(file_path, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+    assert need_download(url=url, path=str(local), manifest=Manifest('2024-10'))
+
+    # mesmo conteúdo, mtime diferente: o SHA-256 confere e o novo mtime é registrado
+    file_path.write_bytes(contents['Arquivo0.zip'])
+    os.utime(file_path, ns=(mtime_ns + 2 * 10**9, mtime_ns + 2 * 10**9))
+    assert not need_download(url=url, path=str(local), manifest=Manifest('2024-10'))
+    assert Manifest('2024-10').get('Arquivo0.zip')['mtime_ns'] == mtime_ns + 2 * 10**9
+
+
+def test_download_file(http_server, tmp_path):
+    base_url = http_server.url
+    contents = _serve_files(http_server.folder, n_files=1)
+    local = tmp_path / 'local'
+    local.mkdir()
+
+    downloaded = download_file(url=f'{base_url}/Arquivo0.zip', path=str(local))
+    assert downloaded == len(contents['Arquivo0.zip'])
+    assert (local / 'Arquivo0.zip').read_bytes() == contents['Arquivo0.zip']
+
+
+def test_download_file_checks_content_length(tmp_path):
+    response = MagicMock(status_code=200, headers={'Content-Length': '100'})
+    response.iter_content.return_value = [b'x' * 60]
+    session = MagicMock()
+    session.get.return_value = response
+
+    with pytest.raises(OSError, match='esperado 100'):
+        download_file(url='https://arquivos/Arquivo0.zip', path=str(tmp_path), session=session)
+    assert not (tmp_path / 'Arquivo0.zip').exists()
+    assert (tmp_path / 'Arquivo0.zip.part').read_bytes() == b'x' * 60
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_download_safra(http_server, path_raw, max_workers):
+    base_url = http_server.url
+    contents = _serve_files(http_server.folder)
+    links = [f'{base_url}/{name}' for name in contents]
+
+    with patch.object(downloader, 'list_download_links', return_value=links):
+        download_safra('2024-10', max_workers=max_workers)
+        for name, data in contents.items():
+            assert (path_raw / '2024-10' / 'zip' / name).read_bytes() == data
+
+        with patch.object(downloader, 'download_file') as mock_download_file:
+            download_safra('2024-10', max_workers=max_workers)
+            mock_download_file.assert_not_called()
+
+
+@pytest.mark.parametrize('accept_ranges', [True, False])
+def test_download_file_resumes_partial(http_server, tmp_path, accept_ranges):
+    http_server.accept_ranges = accept_ranges
+    contents = _serve_files(http_server.folder, n_files=1)
+    data = contents['Arquivo0.zip']
+    local = tmp_path / 'local'
+    local.mkdir()
+    (local / 'Arquivo0.zip.part').write_bytes(data[:20_000])
+
+    downloaded = download_file(url=f'{http_server.url}/Arquivo0.zip', path=str(local))
+
+    assert (local / 'Arquivo0.zip').read_bytes() == data
+    assert not (local / 'Arquivo0.zip.part').exists()
+    assert http_server.requests[-1] == ('GET', '/Arquivo0.zip', 'bytes=20000-')
+    assert downloaded == (len(data) - 20_000 if accept_ranges else len(data))
+
+
+def test_download_file_restarts_on_wrong_content_range(http_server, tmp_path):
+    http_server.range_from_start = True
+    contents = _serve_files(http_server.folder, n_files=1)
+    data = contents['Arquivo0.zip']
+    local = tmp_path / 'local'
+    local.mkdir()
+    (local / 'Arquivo0.zip.part').write_bytes(data[:20_000])
+
+    downloaded = download_file(url=f'{http_server.url}/Arquivo0.zip', path=str(local))
+
+    assert (local / 'Arquivo0.zip').read_bytes() == data
+    assert downloaded == len(data)
+    assert http_server.requests == [('GET', '/Arquivo0.zip', 'bytes=20000-'), ('GET', '/Arquivo0.zip', None)]
+
+
+@pytest.mark.parametrize('accept_ranges', [True, False])
+def test_download_file_segmented(http_server, tmp_path, accept_ranges):
+    http_server.accept_ranges = accept_ranges
+    contents = _serve_files(http_server.folder, n_files=1, size=100_000)
+    data = contents['Arquivo0.zip']
+    local = tmp_path / 'local'
+    local.mkdir()
+
+    with patch.object(downloader, 'SEGMENT_MIN_SIZE', 1):
+        downloaded = download_file(url=f'{http_server.url}/Arquivo0.zip', path=str(local), segments=4)
+
+    assert downloaded == len(data)
+    assert (local / 'Arquivo0.zip').read_bytes() == data
+    range_requests = [r for r in http_server.requests if r[0] == 'GET' and r[2]]
+    assert len(range_requests) == (4 if accept_ranges else 0)
+
+
+def test_download_safra_manifest(http_server, path_raw):
+    contents = _serve_files(http_server.folder, n_files=3)
+    links = [f'{http_server.url}/{name}' for name in contents]
+
+    with patch.object(downloader, 'list_download_links', return_value=links):
+        download_safra('2024-10')
+        manifest = Manifest('2024-10')
+        assert manifest.checksums() == {name: hashlib.sha256(data).hexdigest() for name, data in contents.items()}
+        assert all(manifest.get(name)['etag'] for name in contents)
+
+        http_server.requests.clear()
+        download_safra('2024-10')
+        assert http_server.requests == []
+
+        download_safra('2024-10', revalidate=True)
+        assert [r[0] for r in http_server.requests] == ['HEAD'] * 3
+
+        with open(os.path.join(http_server.folder, 'Arquivo1.zip'), 'wb') as f:
+            f.write(b'novo conteudo')
+        download_safra('2024-10', revalidate=True)
+        assert Manifest('2024-10').changed_files(manifest.checksums()) == ['Arquivo1.zip']
@@ -0,0 +1,53 @@
+import os
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from dados_publicos_cnpj_receita_federal.io import listing_cache
+from dados_publicos_cnpj_receita_federal.io.listing_cache import fetch_listing
+from dados_publicos_cnpj_receita_federal.io.listing_cache import parse_hrefs
+
+INDEX = """<html><body><h1>Index of /cnpj/dados_abertos_cnpj</h1>
+<a href="?C=N;O=D">Name</a>
+<a href="/cnpj/">Parent Directory</a>
+<a href="2024-09/">2024-09/</a>
+<A HREF='2024-10/'>2024-10/</A>
+<a class="x" href="Lucro%20Real.zip">Lucro Real.zip</a>
+<a href="a&amp;b.zip">a&amp;b.zip</a>
+</body></html>
+"""
+
+
+def test_parse_hrefs():
+    assert parse_hrefs(INDEX) == ['?C=N;O=D', '/cnpj/', '2024-09/', '2024-10/', 'Lucro%20Real.zip', 'a&b.zip']
+
+
+def test_fetch_listing_uses_cache_and_revalidates(http_server, path_raw):
+    with open(os.path.join(http_server.folder, 'index.html'), 'w') as f:
+        f.write(INDEX)
+    url = f'{http_server.url}/index.html'
+
+    assert '2024-10/' in fetch_listing(url, ttl=3600)
+    assert fetch_listing(url, ttl=3600) == parse_hrefs(INDEX)
+    assert len(http_server.requests) == 1
+
+    assert fetch_listing(url, ttl=0) == parse_hrefs(INDEX)
+    assert len(http_server.requests) == 2
+    assert (path_raw / 'listings.json').exists()
+
+
+def test_fetch_listing_falls_back_to_stale_cache(http_server, path_raw):
+    with open(os.path.join(http_server.folder, 'index.html'), 'w') as f:
+        f.write(INDEX)
+    url = f'{http_server.url}/index.html'
+    with pytest.raises(Exception, match='nenhuma listagem em cache'):
+        fetch_listing(f'{http_server.url}/ausente.html', ttl=0)
+
+    assert fetch_listing(url, ttl=0) == parse_hrefs(INDEX)
+    os.remove(os.path.join(http_server.folder, 'index.html'))
+    with patch.object(listing_cache._log, 'warning') as mock_warning:
+        assert fetch_listing(url, ttl=0) == parse_hrefs(INDEX)
+        with patch('requests.Session.get', side_effect=requests.ConnectionError('sem rede')):
+            assert fetch_listing(url, ttl=0) == parse_hrefs(INDEX)
+    assert mock_warning.call_count == 2
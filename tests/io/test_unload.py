@@ -0,0 +1,17 @@
+import pytest
+
+from dados_publicos_cnpj_receita_federal.database import pipeline_session
+from dados_publicos_cnpj_receita_federal.io import unload
+from dados_publicos_cnpj_receita_federal.io.unload import unload_safra
+
+
+def test_unload_safra_restores_preserve_insertion_order(tmp_path, monkeypatch):
+    db_uri = str(tmp_path / 'db.duckdb')
+    monkeypatch.setattr(unload, 'DB_URI', db_uri)
+
+    with pipeline_session(db_uri) as session:
+        with pytest.raises(NotImplementedError):
+            unload_safra('2024-10', unload_file_format='csv', export_path=str(tmp_path))
+        cursor = session.cursor()
+        assert cursor.execute("SELECT current_setting('preserve_insertion_order')").fetchone() == (False,)
+        cursor.close()
@@ -0,0 +1,76 @@
+import io
+import zipfile
+
+import pytest
+
+from dados_publicos_cnpj_receita_federal.io.unzip import unzip_safra
+
+
+def _write_zip(path, members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for member, text in members.items():
+            zf.writestr(member, text.encode('ISO-8859-1'))
+    path.write_bytes(buffer.getvalue())
+
+
+@pytest.fixture
+def safra_zip(path_raw):
+    folder_zip = path_raw / '2024-10' / 'zip'
+    folder_zip.mkdir(parents=True)
+    for i in range(4):
+        _write_zip(folder_zip / f'Empresas{i}.zip', {f'K3241.K03200Y{i}.D41109.EMPRECSV': f'"{i}";"SÃO JOÃO"\n' * 1000})
+    return path_raw / '2024-10'
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_unzip_safra(safra_zip, workers):
+    unzip_safra('2024-10', workers=workers)
+
+    for i in range(4):
+        text = (safra_zip / 'unzip' / f'K3241.K03200Y{i}.D41109.EMPRECSV').read_text(encoding='UTF-8')
+        assert text == f'"{i}";"SÃO JOÃO"\n' * 1000
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_unzip_safra_continues_after_error(safra_zip, workers):
+    (safra_zip / 'zip' / 'Empresas1.zip').write_bytes(b'not a zip')
+
+    with pytest.raises(Exception, match='Empresas1.zip'):
+        unzip_safra('2024-10', workers=workers)
+
+    assert sorted(p.name for p in (safra_zip / 'unzip').iterdir()) == [f'K3241.K03200Y{i}.D41109.EMPRECSV' for i in [0, 2, 3]]
+
+
+def test_unzip_safra_without_transcoding(safra_zip):
+    unzip_safra('2024-10', encoding='latin-1')
+
+    raw = (safra_zip / 'unzip' / 'K3241.K03200Y0.D41109.EMPRECSV').read_bytes()
+    assert raw == '"0";"SÃO JOÃO"\n'.encode('ISO-8859-1') * 1000
+
+
+@pytest.mark.parametrize('encoding', ['utf-8', 'latin-1'])
+def test_unzip_safra_skips_extracted_files(safra_zip, mocker, encoding):
+    unzip_safra('2024-10', encoding=encoding)
+    target = safra_zip / 'unzip' / 'K3241.K03200Y0.D41109.EMPRECSV'
+    content = target.read_bytes()
+    target.write_bytes(content[:-1] + b'X')
+    mtimes = {p.name: p.stat().st_mtime_ns for p in (safra_zip / 'unzip').iterdir()}
+    spy = mocker.spy(zipfile.ZipFile, 'open')
+
+    unzip_safra('2024-10', encoding=encoding)
+
+    assert [call.args[1].filename for call in spy.call_args_list] == ['K3241.K03200Y0.D41109.EMPRECSV']
+    assert target.read_bytes() == content
+    for i in range(1, 4):
+        name = f'K3241.K03200Y{i}.D41109.EMPRECSV'
+        assert (safra_zip / 'unzip' / name).stat().st_mtime_ns == mtimes[name]
+    assert not list((safra_zip / 'unzip_state').glob('*.part'))
+
+
+def test_unzip_safra_reextracts_when_encoding_changes(safra_zip):
+    unzip_safra('2024-10', encoding='utf-8')
+    unzip_safra('2024-10', encoding='latin-1')
+
+    raw = (safra_zip / 'unzip' / 'K3241.K03200Y0.D41109.EMPRECSV').read_bytes()
+    assert raw == '"0";"SÃO JOÃO"\n'.encode('ISO-8859-1') * 1000
@@ -0,0 +1,68 @@
+import os
+from unittest.mock import patch
+
+import pytest
+
+from dados_publicos_cnpj_receita_federal.database import connect_db
+from dados_publicos_cnpj_receita_federal.io.manifest import Manifest
+from dados_publicos_cnpj_receita_federal.pipeline import resumable
+from dados_publicos_cnpj_receita_federal.pipeline.resumable import run_resumable
+
+SAFRA = '2024-10'
+
+
+def _write_zip(path_raw, filename, content):
+    folder_zip = path_raw / SAFRA / 'zip'
+    folder_zip.mkdir(parents=True, exist_ok=True)
+    (folder_zip / filename).write_bytes(content)
+    Manifest(SAFRA).record(filename=filename, url=f'https://arquivos/{filename}', size=len(content), sha256=content.hex())
+
+
+def test_run_resumable_resumes_at_first_invalid_stage(path_raw):
+    for filename in ['Empresas0.zip', 'Paises.zip', 'Socios0.zip']:
+        _write_zip(path_raw, filename, filename.encode())
+    calls = []
+    failing = {'socios'}
+
+    def fake_unzip(safra):
+        calls.append('unzip')
+        folder_unzip = path_raw / safra / 'unzip'
+        folder_unzip.mkdir(exist_ok=True)
+        (folder_unzip / 'K3241.K03200Y0.D41109.EMPRECSV').write_text('"1"\n')
+
+    def fake_engine(table):
+        def engine(safra, source):
+            calls.append(table)
+            if table in failing:
+                raise Exception(f'falha em {table}')
+            with connect_db(db_uri=resumable.DB_URI) as db:
+                db.execute(f'CREATE OR REPLACE TABLE {table} AS SELECT ? AS safra', [safra])
+
+        return engine
+
+    def run():
+        calls.clear()
+        return run_resumable(SAFRA, tables=['empresas', 'socios'], unload=False)
+
+    dict_engine = {table: fake_engine(table) for table in ['empresas', 'socios']}
+    with patch.object(resumable, 'download_safra', side_effect=lambda **kwargs: calls.append('download')), patch.object(resumable, 'unzip_safra', side_effect=fake_unzip), patch.dict(resumable.DICT_TABLE_ENGINE, dict_engine):
+        with pytest.raises(Exception, match='falha em socios'):
+            run()
+        assert calls == ['download', 'unzip', 'empresas', 'socios']
+
+        failing.clear()
+        assert run() == {'download': 'pulada', 'unzip': 'pulada', 'empresas': 'pulada', 'socios': 'executada'}
+        assert calls == ['socios']
+
+        assert set(run().values()) == {'pulada'}
+        assert calls == []
+
+        # um arquivo republicado invalida apenas as tabelas que dependem dele
+        _write_zip(path_raw, 'Socios0.zip', b'socios republicado')
+        assert run() == {'download': 'executada', 'unzip': 'executada', 'empresas': 'pulada', 'socios': 'executada'}
+
+        # uma saída removida invalida a etapa que a gerou
+        os.remove(path_raw / SAFRA / 'unzip' / 'K3241.K03200Y0.D41109.EMPRECSV')
+        with connect_db(db_uri=resumable.DB_URI) as db:
+            db.execute('DROP TABLE empresas')
+        assert run() == {'download': 'pulada', 'unzip': 'executada', 'empresas': 'executada', 'socios': 'pulada'}
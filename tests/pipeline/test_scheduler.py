@@ -0,0 +1,51 @@
+import io
+import os
+import zipfile
+from unittest.mock import patch
+
+from dados_publicos_cnpj_receita_federal.pipeline import scheduler
+from dados_publicos_cnpj_receita_federal.pipeline.scheduler import dependencias_por_tabela
+from dados_publicos_cnpj_receita_federal.pipeline.scheduler import run_pipeline
+
+
+def _write_zip(folder, filename, member, text):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        zf.writestr(member, text.encode('ISO-8859-1'))
+    with open(os.path.join(folder, filename), 'wb') as f:
+        f.write(buffer.getvalue())
+
+
+def test_dependencias_por_tabela():
+    files = ['Empresas0.zip', 'Empresas1.zip', 'Paises.zip', 'Simples.zip', 'Lucro%20Real.zip', 'Cnaes.zip']
+    dependencies = dependencias_por_tabela(files)
+    assert dependencies['empresas'] == {'Empresas0.zip', 'Empresas1.zip', 'Paises.zip'}
+    assert dependencies['simples'] == {'Simples.zip', 'Paises.zip'}
+    assert dependencies['regime_tributario'] == {'Lucro%20Real.zip', 'Paises.zip'}
+    assert dependencies['estabelecimentos'] == {'Paises.zip'}
+
+
+def test_run_pipeline_starts_each_table_when_its_files_are_ready(http_server, path_raw):
+    _write_zip(http_server.folder, 'Paises.zip', 'F.K03200$Z.D41109.PAISCSV', '"0";"BRASIL"\n')
+    _write_zip(http_server.folder, 'Simples.zip', 'F.K03200$W.SIMPLES.CSV.D41109', '"1";"S"\n')
+    _write_zip(http_server.folder, 'Empresas0.zip', 'K3241.K03200Y0.D41109.EMPRECSV', '"1";"ação"\n')
+    links = [f'{http_server.url}/{name}' for name in ['Empresas0.zip', 'Paises.zip', 'Simples.zip']]
+    calls = []
+
+    def fake_engine(table):
+        def engine(safra, source):
+            unzip = path_raw / safra / 'unzip'
+            calls.append((table, sorted(os.listdir(unzip))))
+
+        return engine
+
+    dict_engine = {table: fake_engine(table) for table in ['empresas', 'simples']}
+    with patch.object(scheduler, 'list_download_links', return_value=links), patch.dict(scheduler.DICT_TABLE_ENGINE, dict_engine):
+        dict_ready = run_pipeline('2024-10', tables=['empresas', 'simples'], max_workers=2)
+
+    assert set(dict_ready) == {'empresas', 'simples'}
+    assert sorted(table for table, _ in calls) == ['empresas', 'simples']
+    for table, files in calls:
+        assert 'F.K03200$Z.D41109.PAISCSV' in files
+    unzipped = (path_raw / '2024-10' / 'unzip' / 'K3241.K03200Y0.D41109.EMPRECSV').read_text(encoding='UTF-8')
+    assert unzipped == '"1";"ação"\n'